@@ -8,6 +8,10 @@ from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
@@ -37,13 +41,18 @@ logger = getLogger()
 # }, wc_client)
 
 # SELECT
-# "col_1",
-# "col_2",
-# "col_3",
-# (SELECT  COUNT("NGO") FROM {{source('pytest_intermediate', 'arithmetic_add')}}
-# ) AS "count__ngo",(SELECT  COUNT(DISTINCT "Month") FROM {{source('pytest_intermediate', 'arithmetic_add')}}
-# ) AS "distinctmonths"
+# _input."col_1",
+# _input."col_2",
+# _input."col_3",
+# _agg."count__ngo",
+# _agg."distinctmonths"
+# FROM {{source('pytest_intermediate', 'arithmetic_add')}} AS _input
+# CROSS JOIN (
+# SELECT
+# COUNT("NGO") AS "count__ngo",
+# COUNT(DISTINCT "Month") AS "distinctmonths"
 # FROM {{source('pytest_intermediate', 'arithmetic_add')}}
+# ) AS _agg
 
 
 def select_from(input_table: dict):
@@ -66,33 +75,37 @@ def aggregate_dbt_sql(
     aggregate_on: list[dict] = config.get("aggregate_on", [])
     input_table = config["input"]
 
-    dbt_code = "SELECT\n"
-
-    if len(source_columns) > 0:
-        dbt_code += ",\n".join(
-            [quote_columnname(col_name, warehouse.name) for col_name in source_columns]
-        )
-        dbt_code += ",\n"
-
+    # all the aggregates are computed in one scan of the input, and joined
+    # back onto each of its rows
+    aggregates = []
     for agg_col in aggregate_on:
-        dbt_code += "(SELECT "
+        column = quote_columnname(agg_col["column"], warehouse.name)
         if agg_col["operation"] == "count":
-            dbt_code += (
-                f" COUNT({quote_columnname(agg_col['column'], warehouse.name)}) "
-            )
+            aggregate = f"COUNT({column})"
         elif agg_col["operation"] == "countdistinct":
-            dbt_code += f" COUNT(DISTINCT {quote_columnname(agg_col['column'], warehouse.name)}) "
+            aggregate = f"COUNT(DISTINCT {column})"
         else:
-            dbt_code += f" {agg_col['operation'].upper()}({quote_columnname(agg_col['column'], warehouse.name)}) "
-        dbt_code += select_from(input_table)
-        dbt_code += ")"
-        dbt_code += (
-            f" AS {quote_columnname(agg_col['output_column_name'], warehouse.name)},"
+            aggregate = f"{agg_col['operation'].upper()}({column})"
+        aggregates.append(
+            f"{aggregate} AS {quote_columnname(agg_col['output_column_name'], warehouse.name)}"
         )
 
-    dbt_code = dbt_code[:-1]  # remove the last comma
-    dbt_code += "\n"
-    dbt_code += select_from(input_table)
+    select_list = [
+        f"_input.{quote_columnname(col_name, warehouse.name)}"
+        for col_name in source_columns
+    ] + [
+        f"_agg.{quote_columnname(agg_col['output_column_name'], warehouse.name)}"
+        for agg_col in aggregate_on
+    ]
+
+    dbt_code = "SELECT\n"
+    dbt_code += ",\n".join(select_list) + "\n"
+    dbt_code += select_from(input_table).rstrip("\n") + " AS _input\n"
+    if aggregates:
+        dbt_code += "CROSS JOIN (\nSELECT\n"
+        dbt_code += ",\n".join(aggregates) + "\n"
+        dbt_code += select_from(input_table)
+        dbt_code += ") AS _agg\n"
 
     return dbt_code, source_columns + [
         col["output_column_name"] for col in aggregate_on
@@ -105,12 +118,12 @@ def aggregate(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "aggregate")
 
     select_statement, output_cols = aggregate_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
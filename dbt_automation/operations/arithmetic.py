@@ -2,23 +2,33 @@
 This file contains the airthmetic operations for dbt automation
 """
 
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
 # pylint:disable=unused-argument,logging-fstring-interpolation
-def arithmetic_dbt_sql(config: dict, warehouse: WarehouseInterface):
+def arithmetic_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
     """
-    performs arithmetic operations: +/-/*//
-    config["input"] is dict {"source_name": "", "input_name": "", "input_type": ""}
+    the (output column, expression) pairs of the arithmetic operation
+    column_sql maps an input column to its sql, by default its quoted name
+    returns None if an operand computed upstream can't be passed to the
+    dbt_utils macros, which take their operands as jinja strings
     """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     operator = config["operator"]
     operands = config["operands"]  # {"is_col": true, "value": "1"}[]
     output_col_name = config["output_column_name"]
@@ -33,55 +43,44 @@ def arithmetic_dbt_sql(config: dict, warehouse: WarehouseInterface):
     if operator == "div" and len(operands) != 2:
         raise ValueError("Division requires exactly two operands")
 
-    dbt_code = "SELECT "
-
-    dbt_code += ", ".join(
-        [quote_columnname(col, warehouse.name) for col in source_columns]
-    )
-
-    # dbt_utils function safe_add, safe_subtract, safe_divide
-    # takes input as single quoted fields for column eg. 'field1'. regardless of the warehouse
+    operand_sqls = []
+    for operand in operands:
+        if not operand["is_col"]:
+            operand_sqls.append(quote_constvalue(str(operand["value"]), warehouse.name))
+            continue
+        operand_sql = column_sql(str(operand["value"]))
+        if operator != "mul":
+            # dbt_utils function safe_add, safe_subtract, safe_divide
+            # takes input as single quoted fields for column eg. 'field1'. regardless of the warehouse
+            if operand_sql != quote_columnname(
+                str(operand["value"]), warehouse.name
+            ) and any(char in operand_sql for char in "'{}\\"):
+                return None
+            operand_sql = quote_constvalue(operand_sql, warehouse.name)
+        operand_sqls.append(operand_sql)
 
     if operator == "add":
-        dbt_code += ","
-        dbt_code += "{{dbt_utils.safe_add(["
-        for operand in operands:
-            dbt_code += f"{quote_constvalue(quote_columnname(str(operand['value']), warehouse.name), warehouse.name) if operand['is_col'] else quote_constvalue(str(operand['value']), warehouse.name)},"
-        dbt_code = dbt_code[:-1]
-        dbt_code += "])}}"
-        dbt_code += f" AS {quote_columnname(output_col_name, warehouse.name)} "
-
-    if operator == "mul":
-        dbt_code += ","
-        for operand in operands:
-            dbt_code += f"{quote_columnname(str(operand['value']), warehouse.name) if operand['is_col'] else quote_constvalue(str(operand['value']), warehouse.name)} * "
-        dbt_code = dbt_code[:-2]
-        dbt_code += f" AS {quote_columnname(output_col_name, warehouse.name)} "
-
-    if operator == "sub":
-        dbt_code += ","
-        dbt_code += "{{dbt_utils.safe_subtract(["
-        for operand in operands:
-            dbt_code += f"{quote_constvalue(quote_columnname(str(operand['value']), warehouse.name), warehouse.name) if operand['is_col'] else quote_constvalue(str(operand['value']), warehouse.name)},"
-        dbt_code = dbt_code[:-1]
-        dbt_code += "])}}"
-        dbt_code += f" AS {quote_columnname(output_col_name, warehouse.name)} "
-
-    if operator == "div":
-        dbt_code += ","
-        dbt_code += "{{dbt_utils.safe_divide("
-        for operand in operands:
-            dbt_code += f"{quote_constvalue(quote_columnname(str(operand['value']), warehouse.name), warehouse.name) if operand['is_col'] else quote_constvalue(str(operand['value']), warehouse.name)},"
-        dbt_code += ")}}"
-        dbt_code += f" AS {quote_columnname(output_col_name, warehouse.name)} "
-
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += "\n FROM " + select_from + "\n"
+        arithmetic_sql = "{{dbt_utils.safe_add([" + ",".join(operand_sqls) + "])}}"
+    elif operator == "sub":
+        arithmetic_sql = "{{dbt_utils.safe_subtract([" + ",".join(operand_sqls) + "])}}"
+    elif operator == "div":
+        arithmetic_sql = "{{dbt_utils.safe_divide(" + ",".join(operand_sqls) + ",)}}"
     else:
-        dbt_code += "\n FROM " + "{{" + select_from + "}}" + "\n"
+        arithmetic_sql = " * ".join(operand_sqls)
+
+    return [(col, column_sql(col)) for col in source_columns] + [
+        (output_col_name, arithmetic_sql)
+    ]
 
-    return dbt_code, source_columns + [output_col_name]
+
+def arithmetic_dbt_sql(config: dict, warehouse: WarehouseInterface):
+    """
+    performs arithmetic operations: +/-/*//
+    config["input"] is dict {"source_name": "", "input_name": "", "input_type": ""}
+    """
+    projection = arithmetic_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def arithmetic(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -90,12 +89,12 @@ def arithmetic(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "arithmetic")
 
     select_statement, output_cols = arithmetic_dbt_sql(config, warehouse)
-    dbt_sql += dbt_sql + "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(config["dest_schema"])
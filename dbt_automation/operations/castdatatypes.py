@@ -1,12 +1,16 @@
 """generates a model which casts columns to specified SQL data types"""
 
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.postgres import PostgresClient
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 
 basicConfig(level=INFO)
@@ -18,43 +22,50 @@ WAREHOUSE_COLUMN_TYPES = {
 }
 
 
-# pylint:disable=logging-fstring-interpolation
-def cast_datatypes_sql(
-    config: dict,
-    warehouse: WarehouseInterface,
-):
+def cast_datatypes_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
     """
-    Generate SQL code for the cast_datatypes operation.
+    the (output column, expression) pairs of the cast_datatypes operation
+    column_sql maps an input column to its sql, by default its quoted name
     """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     columns = config.get("columns", [])
     source_columns = config["source_columns"]
 
-    dbt_code = "SELECT\n"
-
-    select_from = source_or_ref(**config["input"])
-
-    cast_columnnames = [c["columnname"] for c in columns]
-
-    for column in source_columns:
-        if column not in cast_columnnames:
-            dbt_code += f"{quote_columnname(column, warehouse.name)},\n"
+    cast_columnnames = [column["columnname"] for column in columns]
 
+    # the columns which aren't cast keep their order, followed by the cast ones
+    projection = [
+        (column, column_sql(column))
+        for column in source_columns
+        if column not in cast_columnnames
+    ]
     for column in columns:
         if "columntype" in column:
             warehouse_column_type = WAREHOUSE_COLUMN_TYPES[warehouse.name].get(
                 column["columntype"], column["columntype"]
             )
-            dbt_code += f"CAST({quote_columnname(column['columnname'], warehouse.name)} AS {warehouse_column_type}) AS {quote_columnname(column['columnname'], warehouse.name)},\n"
-
-    dbt_code = dbt_code.rstrip(",\n") + "\n"
+            projection.append(
+                (
+                    column["columnname"],
+                    f"CAST({column_sql(column['columnname'])} AS {warehouse_column_type})",
+                )
+            )
+    return projection
 
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += f"FROM {select_from}\n"
-    else:
-        dbt_code += f"FROM {{{{{select_from}}}}}\n"
 
-    return dbt_code, source_columns
+# pylint:disable=logging-fstring-interpolation
+def cast_datatypes_sql(
+    config: dict,
+    warehouse: WarehouseInterface,
+):
+    """
+    Generate SQL code for the cast_datatypes operation.
+    """
+    projection = cast_datatypes_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [column for column, _ in projection]
 
 
 def cast_datatypes(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -63,12 +74,12 @@ def cast_datatypes(config: dict, warehouse: WarehouseInterface, project_dir: str
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "castdatatypes")
 
     select_statement, output_cols = cast_datatypes_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
 
@@ -1,25 +1,31 @@
 """generates a model which coalesces columns"""
 
 import datetime
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
 # pylint:disable=unused-argument,logging-fstring-interpolation
-def coalesce_columns_dbt_sql(
-    config: dict,
-    warehouse: WarehouseInterface,
-):
+def coalesce_columns_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
     """
-    Generate SQL code for the coalesce_columns operation.
+    the (output column, expression) pairs of the coalescecolumns operation
+    column_sql maps an input column to its sql, by default its quoted name
     """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     source_columns = config["source_columns"]
     coalesce_columns = config.get("columns", [])
     output_col_name = config["output_column_name"]
@@ -39,32 +45,26 @@ def coalesce_columns_dbt_sql(
     logger.info("using default value")
     logger.info(default_value)
 
-    dbt_code = "SELECT\n"
-
-    select_from = source_or_ref(**config["input"])
-
-    for col_name in source_columns:
-        dbt_code += f"{quote_columnname(col_name, warehouse.name)},\n"
-
-    dbt_code += (
+    coalesce_sql = (
         "COALESCE("
-        + ", ".join(
-            [
-                quote_columnname(col_name, warehouse.name)
-                for col_name in coalesce_columns
-            ]
-            + [default_value]
-        )
-        + f") AS {quote_columnname(output_col_name, warehouse.name)}\n"
+        + ", ".join([column_sql(col_name) for col_name in coalesce_columns] + [default_value])
+        + ")"
     )
+    return [(col_name, column_sql(col_name)) for col_name in source_columns] + [
+        (output_col_name, coalesce_sql)
+    ]
 
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += f"FROM {select_from}\n"
-    else:
-        dbt_code += f"FROM {{{{{select_from}}}}}\n"
 
-    return dbt_code, source_columns + [output_col_name]
+def coalesce_columns_dbt_sql(
+    config: dict,
+    warehouse: WarehouseInterface,
+):
+    """
+    Generate SQL code for the coalesce_columns operation.
+    """
+    projection = coalesce_columns_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col_name for col_name, _ in projection]
 
 
 def coalesce_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -73,12 +73,12 @@ def coalesce_columns(config: dict, warehouse: WarehouseInterface, project_dir: s
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "coalescecolumns")
 
     select_statement, output_cols = coalesce_columns_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
@@ -2,50 +2,54 @@
 This file takes care of dbt string concat operations
 """
 
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
-def concat_columns_dbt_sql(
-    config: dict,
-    warehouse: WarehouseInterface,
-):
+def concat_columns_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
     """
-    Generate SQL code for the concat_columns operation.
+    the (output column, expression) pairs of the concat operation
+    column_sql maps an input column to its sql, by default its quoted name
     """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     output_column_name = config["output_column_name"]
     concat_columns = config["columns"]
     source_columns = config["source_columns"]
 
-    dbt_code = "SELECT " + ", ".join(
-        [quote_columnname(col, warehouse.name) for col in source_columns]
-    )
-
     concat_fields = ",".join(
         [
-            (
-                quote_columnname(col["name"], warehouse.name)
-                if col["is_col"]
-                else f"'{col['name']}'"
-            )
+            (column_sql(col["name"]) if col["is_col"] else f"'{col['name']}'")
             for col in concat_columns
         ]
     )
-    dbt_code += f", CONCAT({concat_fields}) AS {quote_columnname(output_column_name, warehouse.name)}"
+    return [(col, column_sql(col)) for col in source_columns] + [
+        (output_column_name, f"CONCAT({concat_fields})")
+    ]
 
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += f"\nFROM {select_from}\n"
-    else:
-        dbt_code += f"\nFROM {{{{ {select_from} }}}}\n"
 
-    return dbt_code, source_columns + [output_column_name]
+def concat_columns_dbt_sql(
+    config: dict,
+    warehouse: WarehouseInterface,
+):
+    """
+    Generate SQL code for the concat_columns operation.
+    """
+    projection = concat_columns_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def concat_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -54,12 +58,12 @@ def concat_columns(config: dict, warehouse: WarehouseInterface, project_dir: str
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "concat")
 
     select_statement, output_cols = concat_columns_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
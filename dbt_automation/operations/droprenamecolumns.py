@@ -1,16 +1,35 @@
 """drop and rename columns"""
 
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
+def drop_columns_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
+    """
+    the (output column, expression) pairs of the dropcolumns operation
+    column_sql maps an input column to its sql, by default its quoted name
+    """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
+    columns = config.get("columns", [])
+    source_columns = config["source_columns"]
+
+    return [(col, column_sql(col)) for col in source_columns if col not in columns]
+
+
 # pylint:disable=unused-argument,logging-fstring-interpolation
 def drop_columns_dbt_sql(
     config: dict,
@@ -19,22 +38,9 @@ def drop_columns_dbt_sql(
     """
     Generate SQL code for dropping columns from the source.
     """
-    columns = config.get("columns", [])
-    source_columns = config["source_columns"]
-
-    remaining_cols = [col for col in source_columns if col not in columns]
-
-    dbt_code = "SELECT " + ", ".join(
-        [quote_columnname(col, warehouse.name) for col in remaining_cols]
-    )
-
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += f"\nFROM {select_from}\n"
-    else:
-        dbt_code += f"\nFROM {{{{ {select_from} }}}}\n"
-
-    return dbt_code, remaining_cols
+    projection = drop_columns_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def drop_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -43,12 +49,12 @@ def drop_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "dropcolumns")
 
     select_statement, output_cols = drop_columns_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
@@ -60,38 +66,30 @@ def drop_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
     return model_sql_path, output_cols
 
 
-def rename_columns_dbt_sql(
-    config: dict,
-    warehouse: WarehouseInterface,
-):
-    """Generate SQL code for renaming columns in a model."""
+def rename_columns_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
+    """
+    the (output column, expression) pairs of the renamecolumns operation
+    column_sql maps an input column to its sql, by default its quoted name
+    """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     columns = config.get("columns", {})
     source_columns = config["source_columns"]
 
-    selected_columns = [col for col in source_columns if col not in columns]
-    dbt_code = "SELECT "
-
-    if selected_columns:
-        dbt_code += (
-            ", ".join(
-                [quote_columnname(col, warehouse.name) for col in selected_columns]
-            )
-            + ", "
-        )
-
-    # Rename columns
-    for old_name, new_name in columns.items():
-        dbt_code += f"{quote_columnname(old_name, warehouse.name)} AS {quote_columnname(new_name, warehouse.name)}, "
+    projection = [(col, column_sql(col)) for col in source_columns if col not in columns]
+    projection += [(new_name, column_sql(old_name)) for old_name, new_name in columns.items()]
+    return projection
 
-    dbt_code = dbt_code[:-2]  # Remove trailing comma and space
-    select_from = source_or_ref(**config["input"])
 
-    if config["input"]["input_type"] == "cte":
-        dbt_code += "\n FROM " + select_from + "\n"
-    else:
-        dbt_code += "\n FROM " + "{{" + select_from + "}}" + "\n"
-
-    return dbt_code, selected_columns + list(columns.values())
+def rename_columns_dbt_sql(
+    config: dict,
+    warehouse: WarehouseInterface,
+):
+    """Generate SQL code for renaming columns in a model."""
+    projection = rename_columns_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def rename_columns(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -100,12 +98,12 @@ def rename_columns(config: dict, warehouse: WarehouseInterface, project_dir: str
     output_model_name = config["output_name"]
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "renamecolumns")
 
     select_statement, output_cols = rename_columns_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
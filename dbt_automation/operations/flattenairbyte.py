@@ -1,14 +1,32 @@
 """generates models to flatten airbyte raw data"""
 
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging import basicConfig, getLogger, INFO
+from pathlib import Path
 
 from dbt_automation.utils.sourceschemas import get_source
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.dbtconfigs import mk_model_config
-from dbt_automation.utils.columnutils import make_cleaned_column_names, dedup_list
+from dbt_automation.utils.columnutils import (
+    cleaned_column_name,
+    make_cleaned_column_names,
+    dedup_list,
+)
 from dbt_automation.utils.warehouseclient import get_client
+from dbt_automation.utils.jsonkeys import (
+    JsonKeyStore,
+    discover_json_keys,
+    infer_json_types,
+)
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+from dbt_automation.utils.materialization import (
+    check_incremental_safe,
+    incremental_config_args,
+    incremental_options,
+    incremental_select,
+)
 
 
 basicConfig(level=INFO)
@@ -20,6 +38,35 @@ def flatten_operation(config: dict, warehouse: WarehouseInterface, project_dir:
     """
     This function does the flatten operation for all sources (raw tables) in the sources.yml.
     By default, _airbyte_data field is used to flatten
+    config["key_discovery"] optionally controls how the json keys are found:
+        mode: full (default) | sample | incremental, see jsonkeys.discover_json_keys
+        sample_percent: for the sample mode
+        keystore: path of the yaml file persisting the keys found so far,
+            defaults to jsonkeys.yml in the project_dir
+    config["parse_json_once"] extracts all the fields from one parse of the json
+    per row rather than one parse per field; off by default. on postgres nested
+    values then come out as normalized json text
+    config["infer_types"] optionally types the columns from a sample of the rows
+    instead of leaving them all text; true, or
+        sample_rows: the number of rows to sample, default 10000
+        min_share: the share of a key's non-null values which must have a type, default 0.95
+    it implies parse_json_once
+    config["nested"] optionally flattens nested objects into a column per leaf path
+    instead of a json column per top-level key:
+        max_depth: how many keys deep to descend, default 3
+        explode: a list of paths (lists of keys) to json arrays; each array is
+            also written out as a child model <model>_<path> with one row per
+            element, keyed by _airbyte_ab_id and _index
+    paths are discovered with a full scan, or a sampled one in the sample
+    key_discovery mode; only top-level keys are typed by infer_types
+    config["incremental"] optionally makes the models incremental, so each dbt run
+    only flattens the rows emitted since the last one; true, or a dict as in
+    materialization.incremental_options. the models then also hold
+    _airbyte_emitted_at. the child models of exploded arrays stay tables
+    config["max_workers"] optionally flattens that many tables concurrently,
+    each worker using its own warehouse connection. tables which fail are
+    logged, and reported in an error once the others are done; no models are
+    written then. with a single worker the first error is raised as is
     """
 
     dbtproject = dbtProject(project_dir)
@@ -42,58 +89,215 @@ def flatten_operation(config: dict, warehouse: WarehouseInterface, project_dir:
         logger.error("no source for schema %s in %s", SOURCE_SCHEMA, sources_filename)
         sys.exit(1)
 
-    # for every table in the source, generate an output model file
-    models = []
-
-    for srctable in source["tables"]:
-        modelname = srctable["name"]
-        tablename = srctable["identifier"]
-        logger.info(f"flattening table {tablename}")
+    if config.get("incremental"):
+        check_incremental_safe(["flatten"])
 
-        sql_columns = []
-        json_fields = []
-        # get the field names from the json objects
-        json_fields = warehouse.get_json_columnspec(
-            SOURCE_SCHEMA, tablename, "_airbyte_data"
+    key_discovery = config.get("key_discovery", {})
+    keystore = None
+    if key_discovery.get("mode", "full") != "full" or "keystore" in key_discovery:
+        keystore = JsonKeyStore(
+            key_discovery.get("keystore", Path(project_dir) / "jsonkeys.yml")
         )
 
-        # convert to sql-friendly column names
-        sql_columns = make_cleaned_column_names(json_fields)
-
-        # after cleaning we may have duplicates
-        sql_columns = dedup_list(sql_columns)
-
-        # create the configuration
-        model_config = mk_model_config(DEST_SCHEMA, modelname, sql_columns)
-        models.append(model_config)
+    max_workers = config.get("max_workers", 1)
+    worker_state = threading.local()
+    worker_clients = []
+    worker_clients_lock = threading.Lock()
+
+    def flatten_srctable(srctable: dict):
+        """discover the keys of one table and generate its model"""
+        if max_workers > 1:
+            # each worker thread gets its own client, i.e. its own connection
+            if not hasattr(worker_state, "warehouse"):
+                # one connection per worker, and one for the caller's client
+                worker_state.warehouse = warehouse.worker_client(
+                    maxconn=max_workers + 1
+                )
+                with worker_clients_lock:
+                    worker_clients.append(worker_state.warehouse)
+            return flatten_table(
+                config, worker_state.warehouse, source, srctable, keystore
+            )
+        return flatten_table(config, warehouse, source, srctable, keystore)
 
-        # and the .sql model
-        model_sql = mk_dbtmodel(
-            warehouse,
-            DEST_SCHEMA,
-            source["name"],  # pass the source in the yaml file
-            modelname,
-            zip(json_fields, sql_columns),
+    # for every table in the source, generate an output model file
+    # models are written in the order of the sources.yml regardless of max_workers
+    results = []
+    if max_workers > 1:
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(flatten_srctable, srctable)
+                    for srctable in source["tables"]
+                ]
+                for srctable, future in zip(source["tables"], futures):
+                    try:
+                        results.append((srctable, future.result(), None))
+                    except Exception as error:  # pylint:disable=broad-except
+                        results.append((srctable, None, error))
+        finally:
+            for worker_client in worker_clients:
+                if worker_client is not warehouse:
+                    worker_client.close()
+    else:
+        for srctable in source["tables"]:
+            results.append((srctable, flatten_srctable(srctable), None))
+
+    failed_tables = []
+    for srctable, _, error in results:
+        if error is not None:
+            logger.error(f"failed to flatten {srctable['identifier']}: {error}")
+            failed_tables.append(srctable["identifier"])
+    if failed_tables:
+        # writing the others would leave a models.yml without the failed tables
+        raise RuntimeError(
+            f"failed to flatten {', '.join(failed_tables)}; no models were written"
         )
-        dbtproject.write_model(DEST_SCHEMA, modelname, model_sql, logger=logger)
 
-        logger.info(f"completed flattening {tablename}")
+    models = []
+    for srctable, result, _ in results:
+        for model_config, model_sql in result:
+            models.append(model_config)
+            dbtproject.write_model(
+                DEST_SCHEMA, model_config["name"], model_sql, logger=logger
+            )
+        logger.info(f"completed flattening {srctable['identifier']}")
 
     # finally write the yml with the models configuration
     models_yml_path = dbtproject.write_model_config(DEST_SCHEMA, models, logger=logger)
+    logger.info(f"model files: {dbtproject.write_counts()}")
+
     return models_yml_path
 
 
-# ================================================================================
-def mk_dbtmodel(
-    warehouse, dest_schema: str, sourcename: str, srctablename: str, columntuples: list
+def flatten_table(
+    config: dict,
+    warehouse: WarehouseInterface,
+    source: dict,
+    srctable: dict,
+    keystore: JsonKeyStore = None,
 ):
-    """create the .sql model for this table"""
+    """
+    returns [(model config, .sql model)] flattening one raw table: its own model
+    followed by the child models of any exploded arrays
+    """
+    key_discovery = config.get("key_discovery", {})
+    nested = config.get("nested")
+    modelname = srctable["name"]
+    tablename = srctable["identifier"]
+    logger.info(f"flattening table {tablename}")
+
+    if nested:
+        if key_discovery.get("mode", "full") == "incremental":
+            raise ValueError("nested flattening does not support incremental key discovery")
+        # get the paths to the leaves of the json objects; a top-level key is a
+        # plain field, a deeper path a tuple of keys
+        paths = warehouse.get_json_paths(
+            config["source_schema"],
+            tablename,
+            "_airbyte_data",
+            max_depth=nested.get("max_depth", 3),
+            sample_percent=(
+                key_discovery.get("sample_percent", 10)
+                if key_discovery.get("mode") == "sample"
+                else None
+            ),
+        )
+        json_fields = [path[0] if len(path) == 1 else tuple(path) for path in paths]
+    else:
+        # get the field names from the json objects
+        discovered = discover_json_keys(
+            warehouse,
+            config["source_schema"],
+            tablename,
+            "_airbyte_data",
+            mode=key_discovery.get("mode", "full"),
+            sample_percent=key_discovery.get("sample_percent", 10),
+            keystore=keystore,
+        )
+        json_fields = discovered["keys"]
+
+    column_types = None
+    type_inference = config.get("infer_types")
+    if type_inference:
+        if not isinstance(type_inference, dict):
+            type_inference = {}
+        column_types = infer_json_types(
+            warehouse,
+            config["source_schema"],
+            tablename,
+            "_airbyte_data",
+            json_fields,
+            sample_rows=type_inference.get("sample_rows", 10000),
+            min_share=type_inference.get("min_share", 0.95),
+        )
+
+    # convert to sql-friendly column names
+    sql_columns = make_cleaned_column_names(
+        [
+            json_field if isinstance(json_field, str) else "_".join(json_field)
+            for json_field in json_fields
+        ]
+    )
+
+    # after cleaning we may have duplicates
+    sql_columns = dedup_list(sql_columns)
+
+    # create the configuration
+    model_config = mk_model_config(config["dest_schema"], modelname, sql_columns)
+    if config.get("incremental"):
+        model_config["columns"].insert(1, {"name": "_airbyte_emitted_at", "description": ""})
+
+    # and the .sql model
+    model_sql = mk_dbtmodel(
+        warehouse,
+        config["dest_schema"],
+        source["name"],  # pass the source in the yaml file
+        modelname,
+        zip(json_fields, sql_columns),
+        parse_json_once=config.get("parse_json_once", False),
+        column_types=column_types,
+        incremental=config.get("incremental"),
+    )
+    models = [(model_config, model_sql)]
+
+    for path in (nested or {}).get("explode", []):
+        child_modelname = "_".join(
+            [modelname] + [cleaned_column_name(key) for key in path]
+        )
+        child_config = mk_model_config(
+            config["dest_schema"], child_modelname, ["_index", "value"]
+        )
+        # a row per array element, so _airbyte_ab_id repeats
+        child_config["columns"][0]["tests"] = ["not_null"]
+        models.append(
+            (
+                child_config,
+                mk_explode_dbtmodel(
+                    warehouse,
+                    config["dest_schema"],
+                    source["name"],
+                    modelname,
+                    path,
+                ),
+            )
+        )
+    return models
+
 
-    dbtmodel = f"""
+# ================================================================================
+def mk_model_header(dest_schema: str, incremental: dict = None) -> str:
+    """
+    the config block at the top of the flatten models
+    incremental: the incremental_options, for an incremental model
+    """
+    materialization = "materialized='table',"
+    if incremental is not None:
+        materialization = ",\n    ".join(incremental_config_args(incremental)) + ","
+    return f"""
 {{{{ 
   config(
-    materialized='table',
+    {materialization}
     schema='{dest_schema}',
     indexes=[
       {{'columns': ['_airbyte_ab_id'], 'type': 'hash'}}
@@ -101,19 +305,77 @@ def mk_dbtmodel(
   ) 
 }}}}
     """
-    dbtmodel += "SELECT _airbyte_ab_id "
-    dbtmodel += "\n"
 
-    for json_field, sql_column in columntuples:
-        dbtmodel += (
-            ","
-            + warehouse.json_extract_op("_airbyte_data", json_field, sql_column)
-            + "\n"
+
+def mk_dbtmodel(
+    warehouse,
+    dest_schema: str,
+    sourcename: str,
+    srctablename: str,
+    columntuples: list,
+    parse_json_once: bool = False,
+    column_types: dict = None,
+    incremental=None,
+):
+    """
+    create the .sql model for this table
+    a json_field in columntuples may be a tuple of keys, for a nested path
+    column_types: {json_field: type} for typed columns, which need parse_json_once
+    incremental: the flatten config's "incremental", for an incremental model
+    """
+    incremental_config = {"incremental": incremental}
+    options = incremental_options(incremental_config, warehouse)
+    copied_columns = ["_airbyte_ab_id"]
+    if options is not None:
+        copied_columns.append("_airbyte_emitted_at")
+
+    dbtmodel = mk_model_header(dest_schema, options)
+    if parse_json_once or column_types:
+        select = warehouse.json_flatten_sql(
+            "_airbyte_data",
+            columntuples,
+            copied_columns,
+            f"{{{{source('{sourcename}','{srctablename}')}}}}",
+            column_types=column_types,
         )
+        dbtmodel += incremental_select(
+            select, copied_columns, incremental_config, warehouse
+        )
+        return dbtmodel
+
+    select = f"SELECT {', '.join(copied_columns)} "
+    select += "\n"
 
-    dbtmodel += f"FROM {{{{source('{sourcename}','{srctablename}')}}}}"
-    dbtmodel += "\n"
-    return dbtmodel
+    for json_field, sql_column in columntuples:
+        if isinstance(json_field, str):
+            extract_op = warehouse.json_extract_op("_airbyte_data", json_field, sql_column)
+        else:
+            extract_op = warehouse.json_extract_path_op(
+                "_airbyte_data", list(json_field), sql_column
+            )
+        select += "," + extract_op + "\n"
+
+    select += f"FROM {{{{source('{sourcename}','{srctablename}')}}}}"
+    select += "\n"
+    return dbtmodel + incremental_select(
+        select, copied_columns, incremental_config, warehouse
+    )
+
+
+def mk_explode_dbtmodel(
+    warehouse,
+    dest_schema: str,
+    sourcename: str,
+    srctablename: str,
+    path: list,
+):
+    """create the .sql model with a row per element of the json array at the path"""
+    return mk_model_header(dest_schema) + warehouse.json_explode_sql(
+        "_airbyte_data",
+        list(path),
+        ["_airbyte_ab_id"],
+        f"{{{{source('{sourcename}','{srctablename}')}}}}",
+    )
 
 
 # ================================================================================
@@ -7,11 +7,52 @@ from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.columnutils import make_cleaned_column_names, dedup_list
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
+def flattened_columns(config: dict) -> tuple:
+    """
+    the json fields copied, a key or a tuple of keys each, and the names of the
+    columns they are copied into
+    """
+    json_column = config["json_column"]
+    json_columns_to_copy = [
+        json_field if isinstance(json_field, str) else tuple(json_field)
+        for json_field in config["json_columns_to_copy"]
+    ]
+
+    sql_columns = make_cleaned_column_names(
+        [
+            json_field if isinstance(json_field, str) else "_".join(json_field)
+            for json_field in json_columns_to_copy
+        ]
+    )
+
+    sql_columns = [f"{json_column}_{col}" for col in sql_columns]
+
+    # after cleaning we may have duplicates
+    sql_columns = dedup_list(sql_columns)
+    return json_columns_to_copy, sql_columns
+
+
+def output_columns_(source_columns, sql_columns: list) -> list:
+    """the source_columns, which may be "*", followed by the flattened columns"""
+    if source_columns == "*":
+        return ["*"] + sql_columns
+    return source_columns + sql_columns
+
+
+def flattenjson_columns(config: dict) -> tuple:
+    """the columns read besides the source_columns, and the columns added"""
+    return [config["json_column"]], flattened_columns(config)[1]
+
+
 # pylint:disable=unused-argument,logging-fstring-interpolation
 def flattenjson_dbt_sql(
     config: dict,
@@ -24,36 +65,45 @@ def flattenjson_dbt_sql(
     output_name: name of the output model
     source_columns: list of columns to copy from the input model
     json_column: name of the json column to flatten
-    json_columns_to_copy: list of columns to copy from the json_column
+    json_columns_to_copy: list of columns to copy from the json_column; a list of
+        keys copies the value at that path into nested objects
+    parse_json_once: parse the json once per row rather than once per field
+        copied out of it. on postgres the json values must be objects
     """
     source_columns = config["source_columns"]
     json_column = config["json_column"]
-    json_columns_to_copy = config["json_columns_to_copy"]
+    json_columns_to_copy, sql_columns = flattened_columns(config)
+
+    select_from = source_or_ref(**config["input"])
+    if config["input"]["input_type"] != "cte":
+        select_from = "{{" + select_from + "}}"
+
+    if config.get("parse_json_once", False):
+        dbt_code = warehouse.json_flatten_sql(
+            json_column,
+            zip(json_columns_to_copy, sql_columns),
+            source_columns,
+            select_from,
+        )
+        return dbt_code, output_columns_(source_columns, sql_columns)
 
     if source_columns == "*":
         dbt_code = "SELECT *\n"
     else:
         dbt_code = f"SELECT {', '.join([quote_columnname(col, warehouse.name) for col in source_columns])}\n"
 
-    sql_columns = make_cleaned_column_names(json_columns_to_copy)
-
-    sql_columns = [f"{json_column}_{col}" for col in sql_columns]
-
-    # after cleaning we may have duplicates
-    sql_columns = dedup_list(sql_columns)
-
     for json_field, sql_column in zip(json_columns_to_copy, sql_columns):
-        dbt_code += (
-            "," + warehouse.json_extract_op(json_column, json_field, sql_column) + "\n"
-        )
+        if isinstance(json_field, str):
+            extract_op = warehouse.json_extract_op(json_column, json_field, sql_column)
+        else:
+            extract_op = warehouse.json_extract_path_op(
+                json_column, list(json_field), sql_column
+            )
+        dbt_code += "," + extract_op + "\n"
 
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += "\n FROM " + select_from + "\n"
-    else:
-        dbt_code += "\n FROM " + "{{" + select_from + "}}" + "\n"
+    dbt_code += "\n FROM " + select_from + "\n"
 
-    return dbt_code, source_columns + sql_columns
+    return dbt_code, output_columns_(source_columns, sql_columns)
 
 
 def flattenjson(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -63,12 +113,12 @@ def flattenjson(config: dict, warehouse: WarehouseInterface, project_dir: str):
 
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "flattenjson")
 
     select_statement, output_cols = flattenjson_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dest_schema = config["dest_schema"]
     output_name = config["output_name"]
@@ -8,11 +8,31 @@ from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterfa
 from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
+def generic_function_columns(config: dict) -> tuple:
+    """the columns read besides the source_columns, and the columns added"""
+    reads = []
+    for computed_column in config["computed_columns"]:
+        reads += [
+            str(operand["value"])
+            for operand in computed_column["operands"]
+            if operand["is_col"]
+        ]
+    adds = [
+        computed_column["output_column_name"]
+        for computed_column in config["computed_columns"]
+    ]
+    return reads, adds
+
+
 def generic_function_dbt_sql(
     config: dict,
     warehouse: WarehouseInterface,
@@ -59,9 +79,7 @@ def generic_function(config: dict, warehouse: WarehouseInterface, project_dir: s
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "generic")
 
     select_statement, output_cols = generic_function_dbt_sql(config, warehouse)
 
@@ -70,6 +88,6 @@ def generic_function(config: dict, warehouse: WarehouseInterface, project_dir: s
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
-    model_sql_path = dbtproject.write_model(dest_schema, output_name, dbt_sql + select_statement)
+    model_sql_path = dbtproject.write_model(dest_schema, output_name, dbt_sql + incremental_select(select_statement, output_cols, config, warehouse))
 
     return model_sql_path, output_cols
\ No newline at end of file
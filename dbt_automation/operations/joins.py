@@ -6,6 +6,10 @@ from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 # sql, len_output_set = joins.joins_sql({
 #     "input": {
@@ -46,78 +50,202 @@ from dbt_automation.utils.tableutils import source_or_ref
 #    ON "t1"."NGO" = "t2"."NGO"
 #
 # and len_output_set = 5 (columns)
+#
+# more inputs can be joined in the same SELECT, each with its own join_type
+# and join_on; join_on may be a list of conditions, for composite keys
+#
+#     "other_inputs": [
+#         {..., "seq": 2},
+#         {
+#             ...,
+#             "seq": 3,
+#             "join_type": "left",
+#             "join_on": [
+#                 {"key1": "NGO", "key2": "NGO", "compare_with": "="},
+#                 {"key1": "Month", "key2": "Month", "compare_with": "=",
+#                  "key1_input": "arithmetic_div"},
+#             ],
+#         },
+#     ],
+#
+# key1 is a column of the first input unless key1_input names another one
+
+JOIN_TYPES = ["inner", "left", "full outer"]
+
+
+def from_relation(input_table: dict, alias: str) -> str:
+    """the input as it appears in the FROM clause"""
+    relation = source_or_ref(**input_table)
+    if input_table["input_type"] != "cte":
+        relation = "{{" + relation + "}}"
+    return relation + " " + alias
+
+
+def join_conditions(config: dict, input_tables: list) -> list:
+    """
+    the join conditions as (left position, key1, compare_with, right position, key2),
+    positions being indexes into input_tables. each input after the first joins
+    with its own join_on, or the operation's join_on
+    """
+    input_names = [table["input"]["input_name"] for table in input_tables]
+    conditions = []
+    for position, input_table in enumerate(input_tables[1:], start=1):
+        join_on = input_table.get("join_on", config.get("join_on", {}))
+        if isinstance(join_on, dict):
+            join_on = [join_on]
+        if not join_on:
+            raise ValueError(f"no join_on for {input_names[position]}")
+        for condition in join_on:
+            left_position = 0
+            if "key1_input" in condition:
+                if input_names.count(condition["key1_input"]) != 1:
+                    raise ValueError(
+                        f"key1_input {condition['key1_input']} must name exactly one input"
+                    )
+                left_position = input_names.index(condition["key1_input"])
+            if left_position == position:
+                raise ValueError(f"{input_names[position]} cannot join with itself")
+            conditions.append(
+                (
+                    left_position,
+                    condition["key1"],
+                    condition.get("compare_with", "="),
+                    position,
+                    condition["key2"],
+                )
+            )
+    return conditions
+
+
+def join_order(config: dict, input_tables: list, conditions: list) -> list:
+    """
+    the order in which to join the inputs, as positions into input_tables
+    they are joined in seq order, unless all the joins are inner and row_counts
+    gives the size of every input: then the largest input comes first and the
+    others follow smallest first, so that the hash tables are built on the
+    smaller inputs. every input still joins onto one already joined
+    """
+    in_seq_order = list(range(len(input_tables)))
+    row_counts = config.get("row_counts")
+    join_types = [
+        input_table.get("join_type", config.get("join_type", ""))
+        for input_table in input_tables[1:]
+    ]
+    if not row_counts or any(join_type != "inner" for join_type in join_types):
+        return in_seq_order
+    sizes = [row_counts.get(table["input"]["input_name"]) for table in input_tables]
+    if any(size is None for size in sizes):
+        return in_seq_order
+
+    order = [max(in_seq_order, key=lambda position: sizes[position])]
+    remaining = sorted(
+        set(in_seq_order) - set(order), key=lambda position: sizes[position]
+    )
+    while remaining:
+        for position in remaining:
+            if any(
+                {left, right} - {position} <= set(order)
+                for left, _, _, right, _ in conditions
+                if position in (left, right)
+            ):
+                break
+        else:
+            # nothing left connects to what is joined; keep the seq order
+            return in_seq_order
+        order.append(position)
+        remaining.remove(position)
+    return order
 
 
 def joins_sql(
     config: dict,
     warehouse: WarehouseInterface,
 ):
-    """Create a JOIN operation."""
+    """
+    Create a JOIN operation of two or more inputs, in one SELECT.
+    input tables are aliased t1, t2, ... in seq order; a column already
+    selected from an earlier input is suffixed with its input's number
+    join_type and join_on apply to every input after the first unless the
+    input has its own; join_on may be a list of conditions, all of which
+    must hold. row_counts: optional {input_name: number of rows}, to order
+    inner joins by size
+    """
 
     input_tables = [
         {"input": config["input"], "source_columns": config["source_columns"], "seq": 1}
     ] + config.get("other_inputs", [])
     input_tables.sort(key=lambda x: x["seq"])
-    join_type: str = config.get("join_type", "")
-    join_on = config.get("join_on", {})
-
-    if join_type not in ["inner", "left", "full outer"]:
-        raise ValueError(f"join type {join_type} not supported")
 
-    if len(input_tables) != 2:
+    if len(input_tables) < 2:
         raise ValueError(
-            f"join operation requires exactly 2 input tables not {len(input_tables)}"
+            f"join operation requires at least 2 input tables not {len(input_tables)}"
         )
+    for input_table in input_tables[1:]:
+        join_type = input_table.get("join_type", config.get("join_type", ""))
+        if join_type not in JOIN_TYPES:
+            raise ValueError(f"join type {join_type} not supported")
 
-    aliases = ["t1", "t2"]
+    aliases = [f"t{i+1}" for i in range(len(input_tables))]
 
     # select
     dbt_code = "\nSELECT "
 
-    output_set = set()  # to check for duplicate column names
+    output_cols = []  # to check for duplicate column names
     for i, (alias, input_table) in enumerate(zip(aliases, input_tables)):
         source_columns = input_table["source_columns"]
 
         for col_name in source_columns:
             dbt_code += f"{quote_columnname(alias, warehouse.name)}.{quote_columnname(col_name, warehouse.name)}"
-            if col_name in output_set:
+            if col_name in output_cols:
                 dbt_code += (
                     f" AS {quote_columnname(col_name + f'_{i+1}', warehouse.name)},\n"
                 )
-                output_set.add(col_name + f"_{i+1}")
+                output_cols.append(col_name + f"_{i+1}")
             else:
                 dbt_code += ",\n"
-                output_set.add(col_name)
+                output_cols.append(col_name)
 
     dbt_code = dbt_code[:-2]
 
-    table1 = input_tables[0]["input"]
-    select_from = source_or_ref(**table1)
-    if table1["input_type"] == "cte":
-        dbt_code += "\n FROM " + select_from + " " + aliases[0] + "\n"
-    else:
-        dbt_code += "\n FROM " + "{{" + select_from + "}}" + " " + aliases[0] + "\n"
+    conditions = join_conditions(config, input_tables)
+    order = join_order(config, input_tables, conditions)
+
+    first = order[0]
+    dbt_code += (
+        "\n FROM " + from_relation(input_tables[first]["input"], aliases[first]) + "\n"
+    )
 
     # join
-    table2 = input_tables[1]["input"]
-    join_with = source_or_ref(**table2)
-    if table2["input_type"] == "cte":
-        dbt_code += f" {join_type.upper()} JOIN " + join_with + " " + aliases[1] + "\n"
-    else:
+    joined = {first}
+    for position in order[1:]:
+        input_table = input_tables[position]
+        # an input moved ahead of its seq position by join_order is joined
+        # inner like all the others
+        join_type = input_table.get("join_type", config.get("join_type", "inner"))
+        on_conditions = []
+        for left, key1, compare_with, right, key2 in conditions:
+            if position not in (left, right):
+                continue
+            if not {left, right} - {position} <= joined:
+                continue
+            on_conditions.append(
+                f"{quote_columnname(aliases[left], warehouse.name)}.{quote_columnname(key1, warehouse.name)}"
+                f" {compare_with} "
+                f"{quote_columnname(aliases[right], warehouse.name)}.{quote_columnname(key2, warehouse.name)}"
+            )
+        if not on_conditions:
+            raise ValueError(
+                f"{input_table['input']['input_name']} doesn't join onto an earlier input"
+            )
         dbt_code += (
             f" {join_type.upper()} JOIN "
-            + "{{"
-            + join_with
-            + "}}"
-            + " "
-            + aliases[1]
+            + from_relation(input_table["input"], aliases[position])
             + "\n"
         )
+        dbt_code += " ON " + "\n AND ".join(on_conditions) + "\n"
+        joined.add(position)
 
-    dbt_code += f" ON {quote_columnname(aliases[0], warehouse.name)}.{quote_columnname(join_on['key1'], warehouse.name)}"
-    dbt_code += f" {join_on['compare_with']} {quote_columnname(aliases[1], warehouse.name)}.{quote_columnname(join_on['key2'], warehouse.name)}\n"
-
-    return dbt_code, list(output_set)
+    return dbt_code, output_cols
 
 
 def join(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -127,13 +255,13 @@ def join(config: dict, warehouse: WarehouseInterface, project_dir: str):
     dest_schema = config["dest_schema"]
     output_model_name = config["output_name"]
     dbt_sql = ""
-    if config["input"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+    if config["input"]["input_type"] != "cte":
+        dbt_sql = model_config_header(config, warehouse, "join")
 
     select_statement, output_cols = joins_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
@@ -9,7 +9,11 @@ from dotenv import load_dotenv
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
-from dbt_automation.utils.columnutils import quote_constvalue
+from dbt_automation.utils.columnutils import quote_columnname, quote_stringliteral
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
@@ -37,18 +41,87 @@ logger = getLogger()
 #     ],
 # }, wc_client)
 
-# {{ dbt_utils.union_relations(relations=[
-#     source('pytest_intermediate', 'arithmetic_add'),
-#     source('pytest_intermediate', 'arithmetic_div')
-#     ] , include=['NGO','measure2','Month','measure1'])
-# }}
+# SELECT
+#     CAST('{{ source('pytest_intermediate', 'arithmetic_add') }}' AS varchar) AS "_dbt_source_relation",
+#     "NGO", "Month", "measure1", "measure2"
+# FROM {{ source('pytest_intermediate', 'arithmetic_add') }}
+# UNION ALL
+# SELECT
+#     CAST('{{ source('pytest_intermediate', 'arithmetic_div') }}' AS varchar) AS "_dbt_source_relation",
+#     "NGO", "Month", "measure1", CAST(NULL AS numeric) AS "measure2"
+# FROM {{ source('pytest_intermediate', 'arithmetic_div') }}
+
+# column types which can't be written in a CAST as information_schema reports them
+UNCASTABLE_TYPE_PREFIXES = ["USER-DEFINED", "ARRAY", "STRUCT"]
+
+
+def input_relation_(input_table: dict, config: dict) -> tuple:
+    """
+    the (schema, table) of an input, looked up in the dbt project at
+    config["project_dir"], or None with a warning if it can't be
+    """
+    name = input_table["input_name"]
+    if not config.get("project_dir"):
+        logger.warning("no project_dir to look %s up in, its columns are not type-aligned", name)
+        return None
+    try:
+        return dbtProject(config["project_dir"]).input_relation(input_table)
+    except ValueError as error:
+        logger.warning("%s, the columns of %s are not type-aligned", error, name)
+        return None
+
+
+def input_column_types(
+    input_tables: list, config: dict, warehouse: WarehouseInterface
+) -> list:
+    """
+    the {column: data type} of each input's table, read with one metadata query
+    per schema; empty for ctes. the tables are looked up in the dbt project at
+    config["project_dir"]; an input which can't be looked up, or whose table
+    the warehouse doesn't have yet, is logged and left untyped
+    """
+    relations = [
+        input_relation_(table["input"], config)
+        if table["input"]["input_type"] != "cte"
+        else None
+        for table in input_tables
+    ]
+    schema_columns = {
+        schema: warehouse.get_schema_columns(schema)
+        for schema in {relation[0] for relation in relations if relation}
+    }
+
+    column_types = []
+    for relation in relations:
+        table_columns = []
+        if relation is not None:
+            schema, table = relation
+            table_columns = schema_columns[schema].get(table)
+            if table_columns is None:
+                logger.warning(
+                    "no columns found for %s.%s, its columns are not type-aligned",
+                    schema,
+                    table,
+                )
+                table_columns = []
+        column_types.append(
+            {column["name"]: column["data_type"] for column in table_columns}
+        )
+    return column_types
 
 
 # pylint:disable=unused-argument,logging-fstring-interpolation
 def union_tables_sql(config, warehouse: WarehouseInterface):
     """
-    Generates SQL code for unioning tables using the dbt_utils union_relations macro.
-    NOTE: THIS OPERATION WONT WORK WITH CTES AS OFF NOW
+    Generates SQL code for unioning tables as a UNION ALL of one SELECT per input.
+    each SELECT lists every output column, padding the columns its input lacks
+    with NULLs, and starts with the input's name in _dbt_source_relation as
+    dbt_utils.union_relations does. no metadata is queried when dbt compiles,
+    so the operation also works on ctes
+    align_types: cast each column to its type in the first input having it, using
+        the tables' columns read from the warehouse (one query per schema); on by
+        default. the tables are looked up in the dbt project at project_dir; the
+        columns of those which can't be are padded with plain NULLs
     """
     input_tables = [
         {"input": config["input"], "source_columns": config["source_columns"]}
@@ -62,40 +135,76 @@ def union_tables_sql(config, warehouse: WarehouseInterface):
             raise ValueError("Duplicate inputs found")
         names.add(name)
 
-    relations = "["
+    # the columns in the order they are first seen
+    output_cols = []
     for table in input_tables:
-        relations += f"{source_or_ref(**table['input'])},"
-    relations = relations[:-1]
-    relations += "]"
-    dbt_code = ""
-
-    output_cols = set()
-    for table in input_tables:
-        output_cols.update(table["source_columns"])
+        for col in table["source_columns"]:
+            if col not in output_cols:
+                output_cols.append(col)
+
+    column_types = [{} for _ in input_tables]
+    if config.get("align_types", True):
+        column_types = input_column_types(input_tables, config, warehouse)
+
+    # the type of each column is its type in the first input which has it
+    common_types = {}
+    for table_types in column_types:
+        for col, data_type in table_types.items():
+            if col in output_cols and not any(
+                data_type.upper().startswith(prefix)
+                for prefix in UNCASTABLE_TYPE_PREFIXES
+            ):
+                common_types.setdefault(col, data_type)
+
+    string_type = "STRING" if warehouse.name == "bigquery" else "varchar"
+    selects = []
+    for table, table_types in zip(input_tables, column_types):
+        relation = source_or_ref(**table["input"])
+        relation_name = quote_stringliteral(relation, warehouse.name)
+        if table["input"]["input_type"] != "cte":
+            relation = "{{ " + relation + " }}"
+            # rendered by dbt into the relation's quoted name
+            relation_name = "'" + relation + "'"
+
+        select_list = [
+            f"CAST({relation_name} AS {string_type})"
+            f" AS {quote_columnname('_dbt_source_relation', warehouse.name)}"
+        ]
+        for col in output_cols:
+            quoted_col = quote_columnname(col, warehouse.name)
+            common_type = common_types.get(col)
+            if col not in table["source_columns"]:
+                value = f"CAST(NULL AS {common_type})" if common_type else "NULL"
+            elif common_type and col in table_types and table_types[col] != common_type:
+                value = f"CAST({quoted_col} AS {common_type})"
+            else:
+                select_list.append(quoted_col)
+                continue
+            select_list.append(f"{value} AS {quoted_col}")
+
+        selects.append(
+            "SELECT\n    " + ",\n    ".join(select_list) + f"\nFROM {relation}\n"
+        )
 
-    # pylint:disable=consider-using-f-string
-    dbt_code += "{{ dbt_utils.union_relations("
-    dbt_code += (
-        f"relations={relations} , "
-        + f"include=[{','.join([quote_constvalue(col, 'postgres') for col in list(output_cols)])}]"
-    )
-    dbt_code += ")}}"
+    dbt_code = "UNION ALL\n".join(selects)
 
-    return dbt_code, list(output_cols)
+    return dbt_code, ["_dbt_source_relation"] + output_cols
 
 
 def union_tables(config, warehouse: WarehouseInterface, project_dir):
-    """Generates a dbt model which uses the dbt_utils union_relations macro to union tables."""
+    """Generates a dbt model which unions tables."""
     dest_schema = config["dest_schema"]
     output_model_name = config["output_name"]
     dbt_sql = ""
-    if config["input"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+    if config["input"]["input_type"] != "cte":
+        dbt_sql = model_config_header(config, warehouse, "unionall")
 
-    select_statement, output_cols = union_tables_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    select_statement, output_cols = union_tables_sql(
+        {**config, "project_dir": project_dir}, warehouse
+    )
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
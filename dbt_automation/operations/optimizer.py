@@ -0,0 +1,384 @@
+"""
+optimizes mergeoperations chains: where filters are pushed ahead of the row-wise
+operations they don't depend on, columns which no later step reads are pruned
+from each step, and runs of row-wise projections, e.g. a rename followed by a
+cast and a concat, are fused into one SELECT whose expressions are composed from
+each other, instead of a CTE per operation nested in the next
+"""
+
+import re
+
+from dbt_automation.operations.registry import (
+    OUTPUT_APPEND,
+    get_columns,
+    get_operation,
+    get_projection,
+    get_sql_generator,
+)
+from dbt_automation.utils.columnutils import quote_columnname
+from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+from dbt_automation.utils.tableutils import projection_sql
+
+
+LITERAL = re.compile(r"NULL|TRUE|FALSE|-?\d+(\.\d+)?|'([^']|'')*'", re.IGNORECASE)
+
+
+class CannotFuse(Exception):
+    """
+    an operation reads a column which the operations fused before it don't
+    output, or reads a computed column more than once
+    """
+
+
+def is_fusable(op_type: str) -> bool:
+    """whether the operation maps each row to one row by a projection of its input"""
+    spec = get_operation(op_type)
+    return spec["row_wise"] and spec["projection"] is not None
+
+
+def filter_columns(operation: dict) -> list:
+    """
+    the columns a where operation's clauses compare, or None if it filters
+    with a raw sql snippet
+    """
+    columns, _ = get_columns(operation["type"])(operation["config"])
+    if not columns:
+        return None
+    return list(dict.fromkeys(columns))
+
+
+def passes_through(operation: dict, column: str, warehouse: WarehouseInterface) -> bool:
+    """
+    whether a row-wise operation outputs this column of its input unchanged, so
+    that filtering rows on the column before or after the operation is the same
+    """
+    spec = get_operation(operation["type"])
+    if not spec["row_wise"]:
+        return False
+    if spec["projection"] is not None:
+        projection = get_projection(operation["type"])(operation["config"], warehouse)
+        if projection is not None:
+            output_columns = [output_column for output_column, _ in projection]
+            return output_columns.count(column) == 1 and (
+                column,
+                quote_columnname(column, warehouse.name),
+            ) in projection
+    # the source_columns followed by new columns
+    source_columns = operation["config"].get("source_columns")
+    return (
+        spec["output"] == OUTPUT_APPEND
+        and isinstance(source_columns, list)
+        and column in source_columns
+    )
+
+
+def only_selects_columns(operation: dict, warehouse: WarehouseInterface) -> bool:
+    """whether a projection only selects or renames columns, computing nothing"""
+    if get_operation(operation["type"])["projection"] is None:
+        return False
+    projection = get_projection(operation["type"])(operation["config"], warehouse)
+    return projection is not None and all(
+        is_column_(expression, warehouse) for _, expression in projection
+    )
+
+
+def push_down_filters(operations: list, warehouse: WarehouseInterface) -> tuple:
+    """
+    moves each where operation with structured clauses ahead of the row-wise
+    operations before it which pass the columns it compares through unchanged,
+    so that those operations run over the filtered rows only, unless all of
+    them only select or rename columns. the moved where
+    selects every column of its new input; in its old place a dropcolumns which
+    drops nothing keeps the where's output columns, and is fused with the
+    projections around it
+    returns the rewritten operations, and a line explaining each move
+    """
+    operations = list(operations)
+    # the position of each operation in the config, to explain the moves
+    steps = list(range(1, len(operations) + 1))
+    explanation = []
+    position = 0
+    while position < len(operations):
+        operation = operations[position]
+        columns = filter_columns(operation) if operation["type"] == "where" else None
+        target = position
+        while (
+            columns
+            and target > 0
+            and all(
+                passes_through(operations[target - 1], column, warehouse)
+                for column in columns
+            )
+        ):
+            target -= 1
+        # filtering ahead of steps which compute nothing saves nothing, and
+        # would need a step restoring the where's columns after them
+        if all(
+            only_selects_columns(operations[moved_past], warehouse)
+            for moved_past in range(target, position)
+        ):
+            target = position
+        if target == position:
+            position += 1
+            continue
+
+        explanation.append(
+            f"where on {', '.join(columns)} (step {steps[position]}) moved ahead of "
+            + ", ".join(
+                f"{operations[moved_past]['type']} (step {steps[moved_past]})"
+                for moved_past in range(target, position)
+            )
+        )
+        pushed = {"type": "where", "config": {**operation["config"], "source_columns": "*"}}
+        projections = []
+        if operation["config"]["source_columns"] != "*":
+            projections = [
+                {
+                    "type": "dropcolumns",
+                    "config": {
+                        "source_columns": operation["config"]["source_columns"],
+                        "columns": [],
+                    },
+                }
+            ]
+        operations = (
+            operations[:target]
+            + [pushed]
+            + operations[target:position]
+            + projections
+            + operations[position + 1 :]
+        )
+        steps = (
+            steps[:target]
+            + [steps[position]]
+            + steps[target:position]
+            + [steps[position]] * len(projections)
+            + steps[position + 1 :]
+        )
+        position += 1 + len(projections)
+
+    return operations, explanation
+
+
+def narrow_(operation: dict, live: list, warehouse: WarehouseInterface) -> tuple:
+    """
+    the operation with its source_columns narrowed to the live columns, those
+    which later steps read, or all of them if live is None
+    returns the operation and the columns it reads from its input, in the order
+    first read, or None if they aren't known
+    """
+    spec = get_operation(operation["type"])
+    config = operation["config"]
+    source_columns = config.get("source_columns")
+    if spec["projection"] is None and spec["columns"] is None:
+        return operation, None
+
+    if spec["projection"] is not None:
+        narrowed = source_columns
+        if live is not None and isinstance(source_columns, list):
+            narrowed = [column for column in source_columns if column in live]
+        reads = []
+
+        def column_sql(column: str) -> str:
+            reads.append(column)
+            return quote_columnname(column, warehouse.name)
+
+        config = {**config, "source_columns": narrowed}
+        projection = get_projection(operation["type"])(config, warehouse, column_sql)
+        if projection is None:
+            # the operation reads the columns of a sql snippet too
+            reads = None
+        elif not projection:
+            return operation, None
+        else:
+            reads = list(dict.fromkeys(reads))
+
+    else:
+        other_reads, adds = get_columns(operation["type"])(config)
+        narrowed = source_columns
+        if live is not None:
+            if source_columns == "*":
+                narrowed = [column for column in live if column not in adds]
+            else:
+                narrowed = [column for column in source_columns if column in live]
+        if not narrowed:
+            return operation, None
+        reads = None
+        if other_reads is not None and narrowed != "*":
+            reads = list(dict.fromkeys(narrowed + other_reads))
+
+    return {**operation, "config": {**operation["config"], "source_columns": narrowed}}, reads
+
+
+def prune_columns(operations: list, warehouse: WarehouseInterface) -> tuple:
+    """
+    works back from the last operation, whose output is kept whole, narrowing
+    each operation's source_columns to the columns the operations after it read,
+    "*" included, down to the columns the first one reads from the input
+    the operations must already have their as_cte
+    returns the narrowed operations, and a line for each which was narrowed
+    """
+    live = None
+    pruned = []
+    explanation = []
+    for operation in reversed(operations):
+        narrowed, reads = narrow_(operation, live, warehouse)
+        source_columns = operation["config"].get("source_columns")
+        narrowed_columns = narrowed["config"].get("source_columns")
+        if source_columns == "*" and narrowed_columns != "*":
+            explanation.append(
+                f"{operation['as_cte']} ({operation['type']}): source_columns * "
+                f"narrowed to {len(narrowed_columns)}"
+            )
+        elif source_columns != narrowed_columns:
+            explanation.append(
+                f"{operation['as_cte']} ({operation['type']}): "
+                f"{len(source_columns) - len(narrowed_columns)} unused source_columns pruned"
+            )
+        pruned.insert(0, narrowed)
+        live = reads
+    return pruned, list(reversed(explanation))
+
+
+def is_column_(expression: str, warehouse: WarehouseInterface) -> bool:
+    """whether the expression is a quoted column name"""
+    quote = quote_columnname("", warehouse.name)[0]
+    return (
+        len(expression) > 1
+        and expression[0] == quote
+        and expression[-1] == quote
+        and quote not in expression[1:-1]
+    )
+
+
+def is_trivial_(expression: str, warehouse: WarehouseInterface) -> bool:
+    """whether the expression is a quoted column name or a literal"""
+    return is_column_(expression, warehouse) or LITERAL.fullmatch(expression) is not None
+
+
+def is_atomic_(expression: str, warehouse: WarehouseInterface) -> bool:
+    """
+    whether the expression needs no parentheses to be an operand: a quoted
+    column name, a function call, or an expression already in parentheses
+    """
+    if is_column_(expression, warehouse):
+        return True
+    function_call = re.match(r"[A-Za-z_][A-Za-z_0-9]*\(|\(", expression)
+    if function_call is None:
+        return False
+    # the parenthesis opened first must be the one closed last
+    depth = 0
+    in_string = False
+    start = function_call.end() - 1
+    for position, char in enumerate(expression[start:], start=start):
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return position == len(expression) - 1
+    return False
+
+
+def compose_projection(
+    operation: dict, warehouse: WarehouseInterface, upstream: list = None
+) -> list:
+    """
+    the operation's (output column, expression) pairs, with the columns it reads
+    replaced by their expressions in the upstream projection, or read from the
+    operation's input if there is no upstream
+    returns None if the operation can't be composed this way. an upstream
+    expression other than a column or a literal may only be read once, else
+    pasting it in at each reference would recompute it, and a chain of such
+    operations would grow the sql exponentially
+    """
+    upstream_columns = dict(upstream) if upstream is not None else None
+    computed_reads = set()
+
+    def column_sql(column: str) -> str:
+        if upstream_columns is None:
+            return quote_columnname(column, warehouse.name)
+        if column not in upstream_columns:
+            raise CannotFuse(column)
+        expression = upstream_columns[column]
+        if not is_trivial_(expression, warehouse):
+            if column in computed_reads:
+                raise CannotFuse(column)
+            computed_reads.add(column)
+        if is_atomic_(expression, warehouse):
+            return expression
+        return f"({expression})"
+
+    try:
+        projection = get_projection(operation["type"])(
+            operation["config"], warehouse, column_sql
+        )
+    except CannotFuse:
+        return None
+    if projection is None:
+        return None
+
+    output_columns = [column for column, _ in projection]
+    # duplicate or wildcard outputs can't be looked up by name downstream
+    if "*" in output_columns or len(set(output_columns)) != len(output_columns):
+        return None
+    return projection
+
+
+def operation_step_(operation: dict, warehouse: WarehouseInterface) -> tuple:
+    """the operation generated on its own, as (as_cte, sql, output columns)"""
+    sql, output_cols = get_sql_generator(operation["type"])(
+        operation["config"], warehouse
+    )
+    return operation["as_cte"], sql, output_cols
+
+
+def fused_step_(run: list, projection: list, warehouse: WarehouseInterface) -> tuple:
+    """a run of operations as one SELECT from the first one's input"""
+    if len(run) == 1:
+        return operation_step_(run[0], warehouse)
+    sql = (
+        f"-- {', '.join(operation['as_cte'] for operation in run)} fused: "
+        + ", ".join(operation["type"] for operation in run)
+        + "\n"
+        + projection_sql(projection, run[0]["config"]["input"], warehouse.name)
+    )
+    return run[-1]["as_cte"], sql, [column for column, _ in projection]
+
+
+def optimize_operations_sql(operations: list, warehouse: WarehouseInterface) -> list:
+    """
+    the steps of a mergeoperations chain as (as_cte, sql, output columns), each
+    run of consecutive fusable operations becoming one step named after its
+    last operation. the operations' inputs must already point at their
+    predecessors' ctes
+    """
+    steps = []
+    run = []
+    projection = None
+    for operation in operations:
+        if run and is_fusable(operation["type"]):
+            composed = compose_projection(operation, warehouse, projection)
+            if composed is not None:
+                run.append(operation)
+                projection = composed
+                continue
+
+        if run:
+            steps.append(fused_step_(run, projection, warehouse))
+            run = []
+
+        if is_fusable(operation["type"]):
+            projection = compose_projection(operation, warehouse)
+            if projection is not None:
+                run = [operation]
+                continue
+        steps.append(operation_step_(operation, warehouse))
+
+    if run:
+        steps.append(fused_step_(run, projection, warehouse))
+    return steps
@@ -5,14 +5,20 @@ Generates a dbt model for pivot
 from logging import basicConfig, getLogger, INFO
 
 from dbt_automation.utils.dbtproject import dbtProject
-from dbt_automation.utils.columnutils import quote_columnname
+from dbt_automation.utils.columnutils import quote_columnname, quote_stringliteral
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
+# the most columns a pivot makes unless max_pivot_columns says otherwise
+MAX_PIVOT_COLUMNS = 100
+
 
 def select_from(input_table: dict):
     """generates the correct FROM clause for the input table"""
@@ -22,69 +28,136 @@ def select_from(input_table: dict):
     return f"FROM {{{{{selectfrom}}}}}\n"
 
 
+def discover_pivot_values(config: dict, warehouse: WarehouseInterface) -> list:
+    """
+    queries the distinct values of the pivot column, see pivot_dbt_sql
+    """
+    discover_values = config["discover_values"]
+    if not isinstance(discover_values, dict):
+        discover_values = {}
+    max_columns = config.get("max_pivot_columns", MAX_PIVOT_COLUMNS)
+
+    schema = discover_values.get("schema")
+    table = discover_values.get("table")
+    if schema is None or table is None:
+        if not config.get("project_dir"):
+            raise ValueError(
+                "discover_values needs a schema and table, or the project_dir to "
+                "look the input's table up in"
+            )
+        input_schema, input_table = dbtProject(config["project_dir"]).input_relation(
+            config["input"]
+        )
+        schema = schema or input_schema
+        table = table or input_table
+
+    top_k = discover_values.get("top_k")
+    if top_k:
+        return warehouse.get_distinct_values(
+            schema,
+            table,
+            config["pivot_column_name"],
+            limit=min(top_k, max_columns),
+            top_k=True,
+        )
+    # one more than allowed, to tell whether there are too many
+    values = warehouse.get_distinct_values(
+        schema, table, config["pivot_column_name"], limit=max_columns + 1
+    )
+    if len(values) > max_columns:
+        raise ValueError(
+            f"{config['pivot_column_name']} has more than {max_columns} values; "
+            "set discover_values.top_k or raise max_pivot_columns"
+        )
+    return values
+
+
 # pylint:disable=unused-argument,logging-fstring-interpolation
 def pivot_dbt_sql(
     config: dict,
     warehouse: WarehouseInterface,
 ):
     """
-    Generate SQL code for the coalesce_columns operation.
+    Generate SQL code for the pivot operation: a row per distinct combination
+    of the source_columns, with a column per value of the pivot column counting
+    the rows having that value. the counts are COUNT(*) FILTER (WHERE ...) on
+    postgres and a native PIVOT on bigquery
+    pivot_column_values: the values to make columns of, or
+    discover_values: true, or {schema, table, top_k} to query the values from
+        the given table, or else the input's table as declared in the dbt
+        project at project_dir; a cte input needs the table given. the values
+        are cached with the table's metadata. top_k keeps the most frequent values
+    max_pivot_columns: fails rather than make more columns than this
     """
     source_columns = config.get("source_columns", [])
     pivot_column_values = config.get("pivot_column_values", [])
     pivot_column_name = config.get("pivot_column_name", None)
     input_table = config["input"]
+    max_columns = config.get("max_pivot_columns", MAX_PIVOT_COLUMNS)
 
     if not pivot_column_name:
         raise ValueError("Pivot column name not provided")
 
-    dbt_code = "SELECT\n"
-
-    if len(source_columns) > 0:
-        dbt_code += ",\n".join(
-            [quote_columnname(col_name, warehouse.name) for col_name in source_columns]
+    if not pivot_column_values and config.get("discover_values"):
+        pivot_column_values = discover_pivot_values(config, warehouse)
+        logger.info(f"pivoting on {len(pivot_column_values)} values of {pivot_column_name}")
+    if len(pivot_column_values) == 0:
+        raise ValueError("No values to pivot on")
+    if len(pivot_column_values) > max_columns:
+        raise ValueError(
+            f"pivoting on {len(pivot_column_values)} values would make more than "
+            f"{max_columns} columns; raise max_pivot_columns to allow it"
         )
-        dbt_code += ",\n"
 
-    dbt_code += "{{ dbt_utils.pivot("
-    dbt_code += quote_constvalue(
-        quote_columnname(pivot_column_name, warehouse.name), warehouse.name
-    )
-    dbt_code += ", "
-    dbt_code += (
-        "["
-        + ",".join(
-            [
-                quote_constvalue(pivot_val, warehouse.name)
-                for pivot_val in pivot_column_values
-            ]
+    quoted_pivot_column = quote_columnname(pivot_column_name, warehouse.name)
+    quoted_source_columns = [
+        quote_columnname(col_name, warehouse.name) for col_name in source_columns
+    ]
+
+    if warehouse.name == "bigquery":
+        pivot_values = ", ".join(
+            f"{quote_stringliteral(pivot_val, warehouse.name)} AS {quote_columnname(pivot_val, warehouse.name)}"
+            for pivot_val in pivot_column_values
         )
-        + "]"
-    )
-    dbt_code += ")}}\n"
+        dbt_code = "SELECT *\nFROM (\nSELECT "
+        dbt_code += ", ".join(quoted_source_columns + [quoted_pivot_column])
+        dbt_code += ", 1 AS _pivot_count\n"
+        dbt_code += select_from(input_table)
+        dbt_code += ")\n"
+        dbt_code += (
+            f"PIVOT (COUNT(_pivot_count) FOR {quoted_pivot_column} IN ({pivot_values}))\n"
+        )
+        return dbt_code, source_columns + pivot_column_values
 
+    counts = [
+        f"COUNT(*) FILTER (WHERE {quoted_pivot_column} = "
+        f"{quote_stringliteral(pivot_val, warehouse.name)}) AS {quote_columnname(pivot_val, warehouse.name)}"
+        for pivot_val in pivot_column_values
+    ]
+    dbt_code = "SELECT\n"
+    dbt_code += ",\n".join(quoted_source_columns + counts) + "\n"
     dbt_code += select_from(input_table)
     if len(source_columns) > 0:
         dbt_code += "GROUP BY "
-        dbt_code += ",".join(
-            [quote_columnname(col_name, warehouse.name) for col_name in source_columns]
-        )
+        dbt_code += ",".join(quoted_source_columns)
 
     return dbt_code, source_columns + pivot_column_values
 
 
 def pivot(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
-    Perform coalescing of columns and generate a DBT model.
+    Perform pivoting of a column and generate a DBT model.
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "pivot")
 
-    select_statement, output_cols = pivot_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    select_statement, output_cols = pivot_dbt_sql(
+        {**config, "project_dir": project_dir}, warehouse
+    )
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
@@ -1,6 +1,10 @@
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 def raw_generic_dbt_sql(
     config: str,
@@ -39,9 +43,7 @@ def generic_sql_function(config: dict, warehouse: WarehouseInterface, project_di
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "rawsql")
 
     select_statement, output_cols = raw_generic_dbt_sql(config, warehouse)
 
@@ -50,6 +52,6 @@ def generic_sql_function(config: dict, warehouse: WarehouseInterface, project_di
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
-    model_sql_path = dbtproject.write_model(dest_schema, output_name, dbt_sql + select_statement)
+    model_sql_path = dbtproject.write_model(dest_schema, output_name, dbt_sql + incremental_select(select_statement, output_cols, config, warehouse))
 
     return model_sql_path, output_cols
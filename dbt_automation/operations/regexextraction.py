@@ -1,49 +1,46 @@
 """extract from a regex"""
 
+from functools import partial
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 
-def regex_extraction_sql(
-    config: dict,
-    warehouse: WarehouseInterface,
-):
-    """Given a regex and a column name, extract the regex from the column."""
+def regex_extraction_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
+    """
+    the (output column, expression) pairs of the regexextraction operation
+    column_sql maps an input column to its sql, by default its quoted name
+    """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     columns = config.get("columns", {})
     source_columns = config["source_columns"]
 
-    dbt_code = f"\nSELECT "
-
-    select_expressions = []
+    projection = [(col, column_sql(col)) for col in source_columns if col not in columns]
 
     for col_name, regex in columns.items():
         if warehouse.name == "postgres":
-            select_expressions.append(
-                f"substring({quote_columnname(col_name, warehouse.name)} FROM '{regex}') AS {quote_columnname(col_name, warehouse.name)}"
-            )
+            projection.append((col_name, f"substring({column_sql(col_name)} FROM '{regex}')"))
         elif warehouse.name == "bigquery":
-            select_expressions.append(
-                f"REGEXP_EXTRACT({quote_columnname(col_name, warehouse.name)}, r'{regex}') AS {quote_columnname(col_name, warehouse.name)}"
-            )
+            projection.append((col_name, f"REGEXP_EXTRACT({column_sql(col_name)}, r'{regex}')"))
 
-    dbt_code += ", ".join(select_expressions)
+    return projection
 
-    non_regex_columns = [col for col in source_columns if col not in columns]
-    dbt_code += ", " + ", ".join(
-        [quote_columnname(col, warehouse.name) for col in non_regex_columns]
-    )
 
-    dbt_code = dbt_code.rstrip(", ")
-
-    select_from = source_or_ref(**config["input"])
-    if config["input"]["input_type"] == "cte":
-        dbt_code += "\n FROM " + select_from + "\n"
-    else:
-        dbt_code += "\n FROM " + "{{" + select_from + "}}" + "\n"
-
-    return dbt_code, non_regex_columns + list(columns.keys())
+def regex_extraction_sql(
+    config: dict,
+    warehouse: WarehouseInterface,
+):
+    """Given a regex and a column name, extract the regex from the column."""
+    projection = regex_extraction_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def regex_extraction(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -54,12 +51,12 @@ def regex_extraction(config: dict, warehouse: WarehouseInterface, project_dir: s
     output_model_name = config["output_name"]
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "regexextraction")
 
     select_statement, output_cols = regex_extraction_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(dest_schema)
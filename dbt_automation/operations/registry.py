@@ -0,0 +1,210 @@
+"""
+the registry of operations: maps each operation type to the module implementing it,
+its sql generator, its model writer and some metadata. modules are imported only
+when an operation of that type is first used
+"""
+
+import importlib
+
+# how an operation's output columns relate to its source_columns
+OUTPUT_SOURCE_COLUMNS = "source_columns"  # exactly the source_columns
+OUTPUT_APPEND = "append"  # the source_columns followed by new columns
+OUTPUT_COMPUTED = "computed"  # worked out by the operation, e.g. drops, renames, joins
+OUTPUT_NONE = "none"  # not known, e.g. raw sql
+
+
+def operation(
+    module: str,
+    sql: str = None,
+    writer: str = None,
+    row_wise: bool = False,
+    output: str = OUTPUT_COMPUTED,
+    incremental_safe: bool = None,
+    projection: str = None,
+    columns: str = None,
+) -> dict:
+    """
+    describes an operation
+    module: the module under dbt_automation.operations implementing it
+    sql: the name of its (sql, output_columns) generator, if it has one
+    writer: the name of the function writing its dbt model
+    row_wise: whether it maps each input row to exactly one output row
+    output: one of the OUTPUT_* contracts above
+    incremental_safe: whether its model can be materialized incrementally, i.e.
+        new input rows only add or replace output rows of their own; defaults
+        to row_wise
+    projection: the name of its (output column, expression) generator, for
+        row-wise operations which are a plain projection of their input; the
+        optimizer fuses runs of these into one SELECT
+    columns: the name of its (columns read besides source_columns, columns added)
+        function, for other operations which pass their source_columns through;
+        the optimizer prunes the source_columns no later step needs
+    operations with a sql generator are cte_safe, i.e. they can be a step of
+    a mergeoperations chain
+    """
+    return {
+        "module": module,
+        "sql": sql,
+        "writer": writer,
+        "cte_safe": sql is not None,
+        "row_wise": row_wise,
+        "output": output,
+        "incremental_safe": row_wise if incremental_safe is None else incremental_safe,
+        "projection": projection,
+        "columns": columns,
+    }
+
+
+OPERATIONS = {
+    "scaffold": operation("scaffold", writer="scaffold"),
+    "syncsources": operation("syncsources", writer="sync_sources"),
+    "flatten": operation(
+        "flattenairbyte", writer="flatten_operation", incremental_safe=True
+    ),
+    "mergeoperations": operation("mergeoperations", writer="merge_operations"),
+    "flattenjson": operation(
+        "flattenjson",
+        "flattenjson_dbt_sql",
+        "flattenjson",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        columns="flattenjson_columns",
+    ),
+    # not incremental_safe: one watermark can't follow inputs loaded at different times
+    "unionall": operation("mergetables", "union_tables_sql", "union_tables"),
+    "castdatatypes": operation(
+        "castdatatypes",
+        "cast_datatypes_sql",
+        "cast_datatypes",
+        row_wise=True,
+        output=OUTPUT_SOURCE_COLUMNS,
+        projection="cast_datatypes_projection",
+    ),
+    "coalescecolumns": operation(
+        "coalescecolumns",
+        "coalesce_columns_dbt_sql",
+        "coalesce_columns",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        projection="coalesce_columns_projection",
+    ),
+    "arithmetic": operation(
+        "arithmetic",
+        "arithmetic_dbt_sql",
+        "arithmetic",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        projection="arithmetic_projection",
+    ),
+    "concat": operation(
+        "concatcolumns",
+        "concat_columns_dbt_sql",
+        "concat_columns",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        projection="concat_columns_projection",
+    ),
+    "dropcolumns": operation(
+        "droprenamecolumns",
+        "drop_columns_dbt_sql",
+        "drop_columns",
+        row_wise=True,
+        projection="drop_columns_projection",
+    ),
+    "renamecolumns": operation(
+        "droprenamecolumns",
+        "rename_columns_dbt_sql",
+        "rename_columns",
+        row_wise=True,
+        projection="rename_columns_projection",
+    ),
+    "regexextraction": operation(
+        "regexextraction",
+        "regex_extraction_sql",
+        "regex_extraction",
+        row_wise=True,
+        projection="regex_extraction_projection",
+    ),
+    "replace": operation(
+        "replace",
+        "replace_dbt_sql",
+        "replace",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        projection="replace_projection",
+    ),
+    "join": operation("joins", "joins_sql", "join"),
+    "where": operation(
+        "wherefilter",
+        "where_filter_sql",
+        "where_filter",
+        output=OUTPUT_SOURCE_COLUMNS,
+        incremental_safe=True,
+        columns="where_filter_columns",
+    ),
+    "groupby": operation(
+        "groupby", "groupby_dbt_sql", "groupby", output=OUTPUT_APPEND
+    ),
+    "aggregate": operation(
+        "aggregate", "aggregate_dbt_sql", "aggregate", output=OUTPUT_APPEND
+    ),
+    "casewhen": operation(
+        "casewhen",
+        "casewhen_dbt_sql",
+        "casewhen",
+        row_wise=True,
+        output=OUTPUT_APPEND,
+        projection="casewhen_projection",
+    ),
+    "pivot": operation("pivot", "pivot_dbt_sql", "pivot", output=OUTPUT_APPEND),
+    "unpivot": operation("unpivot", "unpivot_dbt_sql", "unpivot"),
+    "generic": operation(
+        "generic",
+        "generic_function_dbt_sql",
+        "generic_function",
+        row_wise=True,
+        output=OUTPUT_SOURCE_COLUMNS,
+        columns="generic_function_columns",
+    ),
+    "rawsql": operation(
+        "rawsql", "raw_generic_dbt_sql", "generic_sql_function", output=OUTPUT_NONE
+    ),
+}
+# mergeoperations has always accepted this older name for unionall
+OPERATIONS["union_tables"] = OPERATIONS["unionall"]
+
+
+def get_operation(op_type: str) -> dict:
+    """returns the registry entry for this operation type"""
+    if op_type not in OPERATIONS:
+        raise ValueError(f"unknown operation type {op_type}")
+    return OPERATIONS[op_type]
+
+
+def load_(op_type: str, role: str):
+    """imports the operation's module and returns the function playing this role"""
+    spec = get_operation(op_type)
+    if spec[role] is None:
+        raise ValueError(f"operation {op_type} has no {role} function")
+    module = importlib.import_module(f"dbt_automation.operations.{spec['module']}")
+    return getattr(module, spec[role])
+
+
+def get_sql_generator(op_type: str):
+    """returns the function generating (sql, output_columns) for this operation"""
+    return load_(op_type, "sql")
+
+
+def get_projection(op_type: str):
+    """returns the function generating (output column, expression) pairs for this operation"""
+    return load_(op_type, "projection")
+
+
+def get_columns(op_type: str):
+    """returns the function giving (columns read besides source_columns, columns added)"""
+    return load_(op_type, "columns")
+
+
+def get_writer(op_type: str):
+    """returns the function writing the dbt model for this operation"""
+    return load_(op_type, "writer")
@@ -3,54 +3,54 @@ This file contains the replace operation for dbt automation
 Note this operation does a full replace of the column value(s)
 """
 
+from functools import partial
 from logging import basicConfig, getLogger, INFO
 from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 
-from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.tableutils import projection_sql
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
-# pylint:disable=unused-argument,logging-fstring-interpolation
-def replace_dbt_sql(config: dict, warehouse: WarehouseInterface):
+def replace_projection(
+    config: dict, warehouse: WarehouseInterface, column_sql=None
+) -> list:
     """
-    performs a replace on a column using REPLACE
-    config["input"] is dict {"source_name": "", "input_name": "", "input_type": ""}
+    the (output column, expression) pairs of the replace operation
+    column_sql maps an input column to its sql, by default its quoted name
     """
+    column_sql = column_sql or partial(quote_columnname, warehouse=warehouse.name)
     source_columns = config.get("source_columns", [])
     columns = config.get("columns", [])
-    output_columns = []
 
-    dbt_code = "SELECT\n"
-
-    for col_name in source_columns:
-        dbt_code += f"{quote_columnname(col_name, warehouse.name)},\n"
+    projection = [(col_name, column_sql(col_name)) for col_name in source_columns]
 
     for column_dict in columns:
-        col_name = column_dict["col_name"]
-        output_col_name = column_dict["output_column_name"]
-
-        """REPLACE(REPLACE( ... ), "find" , "replace") As output_name"""
-        replace_sql_str = f"{quote_columnname(col_name, warehouse.name)}"
+        # REPLACE(REPLACE( ... ), "find" , "replace") As output_name
+        replace_sql_str = column_sql(column_dict["col_name"])
         for op in column_dict["replace_ops"]:
             replace_sql_str = f"REPLACE({replace_sql_str}, {quote_constvalue(op['find'], warehouse.name)}, {quote_constvalue(op['replace'], warehouse.name)})"
-        replace_sql_str += f" AS {quote_columnname(output_col_name, warehouse.name)}, "
-
-        dbt_code += replace_sql_str
-        output_columns.append(output_col_name)
+        projection.append((column_dict["output_column_name"], replace_sql_str))
 
-    dbt_code = dbt_code[:-2] + f"\n"
-    select_from = source_or_ref(**config["input"])
+    return projection
 
-    if config["input"]["input_type"] == "cte":
-        dbt_code += f"FROM {select_from}\n"
-    else:
-        dbt_code += f"FROM {{{{{select_from}}}}}\n"
 
-    return dbt_code, source_columns + output_columns
+# pylint:disable=unused-argument,logging-fstring-interpolation
+def replace_dbt_sql(config: dict, warehouse: WarehouseInterface):
+    """
+    performs a replace on a column using REPLACE
+    config["input"] is dict {"source_name": "", "input_name": "", "input_type": ""}
+    """
+    projection = replace_projection(config, warehouse)
+    dbt_code = projection_sql(projection, config["input"], warehouse.name)
+    return dbt_code, [col for col, _ in projection]
 
 
 def replace(config: dict, warehouse: WarehouseInterface, project_dir: str):
@@ -59,12 +59,12 @@ def replace(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "replace")
 
     select_statement, output_cols = replace_dbt_sql(config, warehouse)
-    dbt_sql += dbt_sql + "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbtproject = dbtProject(project_dir)
     dbtproject.ensure_models_dir(config["dest_schema"])
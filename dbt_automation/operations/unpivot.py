@@ -1,15 +1,19 @@
 """
 Generates a dbt model for unpivot
-This operation will only work in the chain of mergeoperations if its at the first step
+The unpivot is done in one scan of the input from the known unpivot_columns, so
+the operation can be at any step of a chain of mergeoperations
 """
 
 from logging import basicConfig, getLogger, INFO
 
 from dbt_automation.utils.dbtproject import dbtProject
-from dbt_automation.utils.columnutils import quote_columnname
+from dbt_automation.utils.columnutils import quote_columnname, quote_stringliteral
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
-from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
@@ -21,9 +25,14 @@ def unpivot_dbt_sql(
     warehouse: WarehouseInterface,
 ):
     """
-    Generate SQL code for the coalesce_columns operation.
+    Generate SQL code for the unpivot operation: a row per input row and
+    unpivot column, holding the exclude_columns, the column's name in the
+    unpivot_field_name column and its value cast to cast_to in the
+    unpivot_value_name column
+    postgres pairs the rows with CROSS JOIN LATERAL (VALUES ...), bigquery
+    with the UNNEST of an array of structs; unlike bigquery's UNPIVOT this
+    keeps the null values, as the union of one select per column did
     """
-    source_columns = config.get("source_columns", [])  # all columns
     exclude_columns = config.get(
         "exclude_columns", []
     )  # exclude from unpivot but keep in the resulting table
@@ -32,52 +41,64 @@ def unpivot_dbt_sql(
     field_name = config.get("unpivot_field_name", "field_name")
     value_name = config.get("unpivot_value_name", "value")
     cast_datatype_to = config.get("cast_to", "varchar")
-    if not cast_datatype_to and warehouse.name == "bigquery":
+    if warehouse.name == "bigquery" and (
+        not cast_datatype_to or cast_datatype_to.lower() == "varchar"
+    ):
         cast_datatype_to = "STRING"
 
     if len(unpivot_on_columns) == 0:
         raise ValueError("No columns specified for unpivot")
 
-    output_columns = list(set(exclude_columns) | set(unpivot_on_columns))  # union
-    remove_columns = list(set(source_columns) - set(output_columns))
+    select_from = source_or_ref(**input_table)
+    if input_table["input_type"] != "cte":
+        select_from = "{{" + select_from + "}}"
 
-    dbt_code = "{{ unpivot("
-    dbt_code += source_or_ref(**input_table)
-    dbt_code += ", exclude="
-    dbt_code += (
-        "["
-        + ",".join(
-            [quote_constvalue(col_name, warehouse.name) for col_name in exclude_columns]
-        )
-        + "] ,"
+    quoted_field_name = quote_columnname(field_name, warehouse.name)
+    quoted_value_name = quote_columnname(value_name, warehouse.name)
+
+    dbt_code = "SELECT "
+    dbt_code += ", ".join(
+        [f"_input.{quote_columnname(col, warehouse.name)}" for col in exclude_columns]
+        + [f"_unpivot.{quoted_field_name}", f"_unpivot.{quoted_value_name}"]
     )
-    dbt_code += f"cast_to={quote_constvalue(cast_datatype_to, warehouse.name)}, "
-    dbt_code += "remove="
-    dbt_code += (
-        "["
-        + ",".join(
-            [quote_constvalue(col_name, warehouse.name) for col_name in remove_columns]
+    dbt_code += f"\nFROM {select_from} AS _input\n"
+
+    values = [
+        (
+            quote_stringliteral(col_name, warehouse.name),
+            f"CAST(_input.{quote_columnname(col_name, warehouse.name)} AS {cast_datatype_to})",
+        )
+        for col_name in unpivot_on_columns
+    ]
+    if warehouse.name == "bigquery":
+        structs = [
+            f"STRUCT({field} AS {quoted_field_name}, {value} AS {quoted_value_name})"
+            for field, value in values
+        ]
+        dbt_code += "CROSS JOIN UNNEST([\n  " + ",\n  ".join(structs) + "\n]) AS _unpivot\n"
+    else:
+        rows = [f"({field}, {value})" for field, value in values]
+        dbt_code += (
+            "CROSS JOIN LATERAL (VALUES\n  "
+            + ",\n  ".join(rows)
+            + f"\n) AS _unpivot({quoted_field_name}, {quoted_value_name})\n"
         )
-        + "] ,"
-    )
-    dbt_code += f"field_name={quote_constvalue(field_name, warehouse.name)}, value_name={quote_constvalue(value_name, warehouse.name)}"
-    dbt_code += ")}}\n"
 
-    return dbt_code, output_columns
+    return dbt_code, exclude_columns + [field_name, value_name]
 
 
 def unpivot(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
-    Perform coalescing of columns and generate a DBT model.
+    Perform unpivoting of columns and generate a DBT model.
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "unpivot")
 
     select_statement, output_cols = unpivot_dbt_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
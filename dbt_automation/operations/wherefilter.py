@@ -6,6 +6,10 @@ from dbt_automation.utils.dbtproject import dbtProject
 from dbt_automation.utils.columnutils import quote_columnname, quote_constvalue
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
 from dbt_automation.utils.tableutils import source_or_ref
+from dbt_automation.utils.materialization import (
+    incremental_select,
+    model_config_header,
+)
 
 basicConfig(level=INFO)
 logger = getLogger()
@@ -56,6 +60,21 @@ logger = getLogger()
 #       WHERE (CAST(`Iron`, INT64) > CAST(`Nitrate`, INT64))
 
 
+def where_filter_columns(config: dict) -> tuple:
+    """
+    the columns read besides the source_columns, None for a raw sql filter, and
+    the columns added
+    """
+    if config.get("where_type", "and") == "sql":
+        return None, []
+    reads = []
+    for clause in config.get("clauses", []):
+        reads.append(clause["column"])
+        if clause["operand"]["is_col"]:
+            reads.append(clause["operand"]["value"])
+    return reads, []
+
+
 # pylint:disable=unused-argument,logging-fstring-interpolation
 def where_filter_sql(
     config: dict,
@@ -74,9 +93,12 @@ def where_filter_sql(
 
     select_from = source_or_ref(**input_table)
 
-    dbt_code += ",\n".join(
-        [quote_columnname(col_name, warehouse.name) for col_name in source_columns]
-    )
+    if source_columns == "*":
+        dbt_code += "*"
+    else:
+        dbt_code += ",\n".join(
+            [quote_columnname(col_name, warehouse.name) for col_name in source_columns]
+        )
     dbt_code += "\n"
 
     select_from = source_or_ref(**input_table)
@@ -119,12 +141,12 @@ def where_filter(config: dict, warehouse: WarehouseInterface, project_dir: str):
     """
     dbt_sql = ""
     if config["input"]["input_type"] != "cte":
-        dbt_sql = (
-            "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
-        )
+        dbt_sql = model_config_header(config, warehouse, "where")
 
     select_statement, output_cols = where_filter_sql(config, warehouse)
-    dbt_sql += "\n" + select_statement
+    dbt_sql += "\n" + incremental_select(
+        select_statement, output_cols, config, warehouse
+    )
 
     dbt_project = dbtProject(project_dir)
     dbt_project.ensure_models_dir(config["dest_schema"])
@@ -1,24 +1,63 @@
 """utilities for working with bigquery"""
 
 from logging import basicConfig, getLogger, INFO
+import datetime
+import decimal
+import io
 import os
+import time
+from itertools import islice
+from typing import Iterable
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 from google.oauth2 import service_account
 import json
 from dbt_automation.utils.columnutils import quote_columnname
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+from dbt_automation.utils.pagination import decode_continuation_token, sort_keys
+from dbt_automation.utils.jsonkeys import (
+    DATE_PATTERN,
+    INTEGER_PATTERN,
+    TIMESTAMP_PATTERN,
+    keystats_from_rows,
+    leaf_paths,
+    split_json_keys_path,
+)
+from dbt_automation.utils.connectionpool import connection_fingerprint
+from dbt_automation.utils.metadatacache import MetadataCache, cached_metadata
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
+def query_parameter(name: str, value) -> bigquery.ScalarQueryParameter:
+    """a query parameter typed according to the python type of the value"""
+    if isinstance(value, bool):
+        param_type = "BOOL"
+    elif isinstance(value, int):
+        param_type = "INT64"
+    elif isinstance(value, float):
+        param_type = "FLOAT64"
+    elif isinstance(value, decimal.Decimal):
+        param_type = "BIGNUMERIC"
+    elif isinstance(value, datetime.datetime):
+        param_type = "TIMESTAMP" if value.tzinfo is not None else "DATETIME"
+    elif isinstance(value, datetime.date):
+        param_type = "DATE"
+    else:
+        param_type = "STRING"
+    return bigquery.ScalarQueryParameter(name, param_type, value)
+
+
 class BigQueryClient(WarehouseInterface):
     """a bigquery client that can be used as a context manager"""
 
-    def __init__(self, conn_info=None, location=None):
+    def __init__(
+        self, conn_info=None, location=None, metadata_cache: MetadataCache = None
+    ):
         self.name = "bigquery"
         self.bqclient = None
+        self.metadata_cache = metadata_cache
         if conn_info is None:  # take creds from env
             creds_file = open(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
             conn_info = json.load(creds_file)
@@ -28,31 +67,106 @@ class BigQueryClient(WarehouseInterface):
         self.bqclient = bigquery.Client(credentials=creds1, project=creds1.project_id)
         self.conn_info = conn_info
         self.location = location or "asia-south1"
+        self.fingerprint = connection_fingerprint(
+            {"project": creds1.project_id, "client_email": creds1.service_account_email}
+        )
+
+    def worker_client(self, maxconn: int = None):
+        """returns a client for use by another thread; bigquery clients are thread-safe"""
+        return self
 
     def execute(self, statement: str, **kwargs) -> list:
         """run a query and return the results"""
         query_job = self.bqclient.query(statement, location=self.location, **kwargs)
         return query_job.result()
 
+    def execute_stream(
+        self, statement: str, itersize: int = 2000, as_dict: bool = False, **kwargs
+    ):
+        """
+        run a query and yield the rows lazily, fetching itersize rows per page
+        rows are tuples, or dicts if as_dict is set
+        """
+        query_job = self.bqclient.query(statement, location=self.location, **kwargs)
+        for row in query_job.result(page_size=itersize):
+            yield dict(row) if as_dict else tuple(row.values())
+
+    def cached_(self, kind: str, loader, schema: str = None, table: str = None):
+        """loader() through the metadata cache, if this client has one"""
+        return cached_metadata(
+            self.metadata_cache, self.fingerprint, kind, loader, schema, table
+        )
+
+    def invalidate_(self, schema: str = None, table: str = None):
+        """forgets cached metadata after a schema or table changes"""
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(self.fingerprint, schema, table)
+
     def get_tables(self, schema: str) -> list:
         """returns the list of table names in the given schema"""
-        tables = self.bqclient.list_tables(schema)
-        return [x.table_id for x in tables]
+
+        def load():
+            tables = self.bqclient.list_tables(schema)
+            return [x.table_id for x in tables]
+
+        return self.cached_("tables", load, schema)
 
     def get_schemas(self) -> list:
         """returns the list of schema names in the given connection"""
-        datasets = self.bqclient.list_datasets()
-        return [x.dataset_id for x in datasets if x.dataset_id != "airbyte_internal"]
+
+        def load():
+            datasets = self.bqclient.list_datasets()
+            return [
+                x.dataset_id for x in datasets if x.dataset_id != "airbyte_internal"
+            ]
+
+        return self.cached_("schemas", load)
 
     def get_table_columns(self, schema: str, table: str) -> list:
         """fetch the list of columns from a BigQuery table along with their data types."""
-        table_ref = f"{schema}.{table}"
-        table: bigquery.Table = self.bqclient.get_table(table_ref)
-        columns = [
-            {"name": field.name, "data_type": field.field_type}
-            for field in table.schema
-        ]
-        return columns
+
+        def load():
+            bqtable: bigquery.Table = self.bqclient.get_table(f"{schema}.{table}")
+            return [
+                {"name": field.name, "data_type": field.field_type}
+                for field in bqtable.schema
+            ]
+
+        return self.cached_("columns", load, schema, table)
+
+    def get_schema_columns(self, schema: str, tables: list = None) -> dict:
+        """
+        returns {table: [{"name": ..., "data_type": ...}, ...]} for every table
+        in the schema, or only for the given tables, in one query
+        data types are standard sql names (INT64), not the legacy names (INTEGER)
+        get_table_columns reports
+        """
+
+        def load():
+            query = f"""
+                SELECT table_name, column_name, data_type
+                FROM `{self.bqclient.project}`.`{schema}`.INFORMATION_SCHEMA.COLUMNS
+            """
+            params = []
+            if tables is not None:
+                query += "WHERE table_name IN UNNEST(@tables)\n"
+                params.append(
+                    bigquery.ArrayQueryParameter("tables", "STRING", list(tables))
+                )
+            query += "ORDER BY table_name, ordinal_position"
+
+            schema_columns = {}
+            for row in self.execute(
+                query, job_config=bigquery.QueryJobConfig(query_parameters=params)
+            ):
+                schema_columns.setdefault(row["table_name"], []).append(
+                    {"name": row["column_name"], "data_type": row["data_type"]}
+                )
+            return schema_columns
+
+        if tables is not None:
+            return load()
+        return self.cached_("schema_columns", load, schema)
 
     def get_table_data(
         self,
@@ -62,10 +176,15 @@ class BigQueryClient(WarehouseInterface):
         page: int = 1,
         order_by: str = None,
         order: int = 1,  # ASC
+        after: str = None,
+        tiebreaker: str = None,
     ) -> list:
-        """returns limited rows from the specified table in the given schema"""
-
-        offset = max((page - 1) * limit, 0)
+        """
+        returns limited rows from the specified table in the given schema
+        if a tiebreaker (a unique column) is given, rows are paged by keyset:
+        the next page starts after the continuation token `after`, see
+        pagination.next_continuation_token. otherwise `page` is used as an offset
+        """
         # total_rows = self.execute(
         #     f"SELECT COUNT(*) as total_rows FROM `{schema}`.`{table}`"
         # )
@@ -76,19 +195,54 @@ class BigQueryClient(WarehouseInterface):
             SELECT * 
             FROM `{schema}`.`{table}`
             """
-
-        # order
-        if order_by:
+        kwargs = {}
+
+        if tiebreaker:
+            keys = sort_keys(order_by, tiebreaker)
+            if after:
+                values = decode_continuation_token(after)
+                if len(values) != len(keys):
+                    raise ValueError("continuation token does not match order_by")
+                # no row comparisons in bigquery:
+                # (a, b) > (x, y) becomes a > x OR (a = x AND b > y)
+                comparison = ">" if order == 1 else "<"
+                params = [
+                    query_parameter(f"k{i}", value) for i, value in enumerate(values)
+                ]
+                disjuncts = []
+                for i, key in enumerate(keys):
+                    conjuncts = [
+                        f"{quote_columnname(prev_key, 'bigquery')} = @k{j}"
+                        for j, prev_key in enumerate(keys[:i])
+                    ]
+                    conjuncts.append(
+                        f"{quote_columnname(key, 'bigquery')} {comparison} @k{i}"
+                    )
+                    disjuncts.append("(" + " AND ".join(conjuncts) + ")")
+                query += f"""
+            WHERE {" OR ".join(disjuncts)}
+            """
+                kwargs["job_config"] = bigquery.QueryJobConfig(query_parameters=params)
             query += f"""
+            ORDER BY {", ".join([f'{quote_columnname(key, "bigquery")} {"ASC" if order == 1 else "DESC"}' for key in keys])}
+            LIMIT {limit}
+            """
+
+        else:
+            offset = max((page - 1) * limit, 0)
+
+            # order
+            if order_by:
+                query += f"""
             ORDER BY {quote_columnname(order_by, "bigquery")} {"ASC" if order == 1 else "DESC"}
             """
 
-        # offset, limit
-        query += f"""
+            # offset, limit
+            query += f"""
             LIMIT {limit} OFFSET {offset}
             """
 
-        result = self.execute(query)
+        result = self.execute(query, **kwargs)
         rows = [dict(record) for record in result]
 
         return rows
@@ -97,31 +251,199 @@ class BigQueryClient(WarehouseInterface):
         """fetch the list of columns from a BigQuery table."""
         return self.get_table_columns(schema, table_id)
 
+    def json_scan_(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+    ) -> tuple:
+        """
+        a subquery parsing the json in this column once per row, restricted to
+        the sample / watermark range / row limit; returns (sql, query parameters)
+        the watermark range lets bigquery prune partitions on _airbyte_emitted_at
+        """
+        tablesample = ""
+        if sample_percent is not None:
+            tablesample = f"TABLESAMPLE SYSTEM ({float(sample_percent)} PERCENT)"
+
+        conditions = [f"{quote_columnname(column, 'bigquery')} IS NOT NULL"]
+        params = []
+        if watermark_column and after is not None:
+            conditions.append(f"{quote_columnname(watermark_column, 'bigquery')} > @after")
+            params.append(query_parameter("after", after))
+        if watermark_column and until is not None:
+            conditions.append(f"{quote_columnname(watermark_column, 'bigquery')} <= @until")
+            params.append(query_parameter("until", until))
+
+        limit = f"LIMIT {int(max_rows)}" if max_rows is not None else ""
+
+        sql = f"""
+            SELECT SAFE.PARSE_JSON(
+                {quote_columnname(column, 'bigquery')}, wide_number_mode=>'round'
+            ) AS doc
+            FROM `{schema}`.`{table}` {tablesample}
+            WHERE {" AND ".join(conditions)}
+            {limit}
+        """
+        return sql, params
+
     def get_json_columnspec(
-        self, schema: str, table: str, column: str, *args
-    ):  # pylint:disable=unused-argument
-        """get the column schema from the specified json field for this table"""
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+    ):
+        """
+        get the column schema from the specified json field for this table
+        sample_percent: only read this percentage of the table's blocks
+        watermark_column, after, until: only read rows with after < watermark_column <= until
+        max_rows: only read this many rows
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, watermark_column, after, until, max_rows
+        )
         query = self.execute(
-            f'''
-                    CREATE TEMP FUNCTION jsonObjectKeys(input STRING)
-                    RETURNS Array<String>
-                    LANGUAGE js AS """
-                    return Object.keys(JSON.parse(input));
-                    """;
-                    WITH keys AS (
-                    SELECT
-                        jsonObjectKeys({column}) AS keys
-                    FROM
-                        `{schema}`.`{table}`
-                    WHERE {column} IS NOT NULL
-                    )
-                    SELECT
-                    DISTINCT k
-                    FROM keys
-                    CROSS JOIN UNNEST(keys.keys) AS k
-                ''',
+            f"""
+                SELECT DISTINCT k
+                FROM ({scan}) AS docs
+                CROSS JOIN UNNEST(JSON_KEYS(docs.doc, 1)) AS k
+            """,
+            job_config=bigquery.QueryJobConfig(query_parameters=params),
+        )
+        # JSON_KEYS quotes keys such as "a.b", which aren't json path identifiers
+        return list(
+            dict.fromkeys(split_json_keys_path(json_field["k"])[0] for json_field in query)
         )
-        return [json_field["k"] for json_field in query]
+
+    def get_json_keystats(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+        value_classes: bool = False,
+    ) -> dict:
+        """
+        like get_json_columnspec, but in the same pass counts how often each
+        key occurs and the json types of its values
+        returns {key: {"count": n, "types": {"string": n1, "number": n2, ...}}}
+        value_classes: count integer / numeric numbers and date / timestamp / other
+            strings separately rather than just number and string, for type inference
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, watermark_column, after, until, max_rows
+        )
+        # JSON_KEYS quotes keys such as "a.b"; they are looked up unquoted
+        value = "docs.doc[IF(STARTS_WITH(k, '\"'), JSON_VALUE(PARSE_JSON(k)), k)]"
+        value_type = f"JSON_TYPE({value})"
+        if value_classes:
+            value_type = f"""CASE JSON_TYPE({value})
+                    WHEN 'number' THEN IF(
+                        REGEXP_CONTAINS(TO_JSON_STRING({value}), r'{INTEGER_PATTERN}'),
+                        'integer', 'numeric')
+                    WHEN 'string' THEN CASE
+                        WHEN REGEXP_CONTAINS(JSON_VALUE({value}), r'{DATE_PATTERN}') THEN 'date'
+                        WHEN REGEXP_CONTAINS(JSON_VALUE({value}), r'{TIMESTAMP_PATTERN}')
+                            THEN 'timestamp'
+                        ELSE 'string' END
+                    ELSE JSON_TYPE({value}) END"""
+        query = self.execute(
+            f"""
+                SELECT k, {value_type} AS json_type, COUNT(*) AS n
+                FROM ({scan}) AS docs
+                CROSS JOIN UNNEST(JSON_KEYS(docs.doc, 1)) AS k
+                GROUP BY k, json_type
+            """,
+            job_config=bigquery.QueryJobConfig(query_parameters=params),
+        )
+        return keystats_from_rows(
+            (split_json_keys_path(row["k"])[0], row["json_type"], row["n"])
+            for row in query
+        )
+
+    def get_json_paths(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        max_depth: int = 3,
+        sample_percent: float = None,
+        max_rows: int = None,
+    ) -> list:
+        """
+        finds the paths to the leaves of the json objects in this column, descending
+        into nested objects up to max_depth keys deep. a leaf is a value which is not
+        an object, an empty object, or an object at max_depth
+        JSON_KEYS doesn't say which values are objects, so a key which holds an object
+        in some rows and a scalar in others yields only the paths beneath it
+        returns a sorted list of paths, each a list of keys
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, max_rows=max_rows
+        )
+        query = self.execute(
+            f"""
+                SELECT DISTINCT k
+                FROM ({scan}) AS docs
+                CROSS JOIN UNNEST(JSON_KEYS(docs.doc, {int(max_depth)})) AS k
+            """,
+            job_config=bigquery.QueryJobConfig(query_parameters=params),
+        )
+        return leaf_paths([split_json_keys_path(row["k"]) for row in query])
+
+    def get_distinct_values(
+        self, schema: str, table: str, column: str, limit: int = 100, top_k: bool = False
+    ) -> list:
+        """
+        returns at most limit distinct non-null values of the column, as strings,
+        in sorted order or, with top_k, the most frequent first. cached in the
+        metadata cache like the table's other metadata
+        """
+
+        def load():
+            quoted_column = quote_columnname(column, "bigquery")
+            order = "COUNT(*) DESC, value" if top_k else "value"
+            resultset = self.execute(
+                f"""SELECT CAST({quoted_column} AS STRING) AS value
+                FROM `{schema}`.`{table}`
+                WHERE {quoted_column} IS NOT NULL
+                GROUP BY value
+                ORDER BY {order}
+                LIMIT @limit
+                """,
+                job_config=bigquery.QueryJobConfig(
+                    query_parameters=[query_parameter("limit", limit)]
+                ),
+            )
+            return [row["value"] for row in resultset]
+
+        kind = f"distinct_values_{'top' if top_k else 'sorted'}_{limit}_{column}"
+        return self.cached_(kind, load, schema, table)
+
+    def get_max_value(self, schema: str, table: str, column: str):
+        """returns the largest value in this column, e.g. the latest timestamp"""
+        resultset = self.execute(
+            f"""SELECT MAX({quote_columnname(column, 'bigquery')}) AS max_value
+            FROM `{schema}`.`{table}`
+            """
+        )
+        for row in resultset:
+            return row["max_value"]
+        return None
 
     def schema_exists_(self, schema: str) -> bool:
         """checks if the schema exists"""
@@ -136,6 +458,7 @@ class BigQueryClient(WarehouseInterface):
         if not self.schema_exists_(schema):
             self.bqclient.create_dataset(schema)
             logger.info("created schema %s", schema)
+            self.invalidate_(schema)
 
     def ensure_table(self, schema: str, table: str, columns: list):
         """creates the table if it doesn't exist"""
@@ -145,6 +468,7 @@ class BigQueryClient(WarehouseInterface):
             bqtable.schema = [bigquery.SchemaField(col, "STRING") for col in columns]
             self.bqclient.create_table(bqtable)
             logger.info("created table %s.%s", schema, table)
+            self.invalidate_(schema, table)
 
     def table_exists_(self, schema: str, table: str) -> bool:
         """checks if the table exists"""
@@ -161,21 +485,159 @@ class BigQueryClient(WarehouseInterface):
             logger.info("dropping table %s.%s", schema, table)
             table_ref = f"{self.bqclient.project}.{schema}.{table}"
             self.bqclient.delete_table(table_ref)
+            self.invalidate_(schema, table)
 
     def insert_row(self, schema: str, table: str, row: dict):
         """inserts a row into the table"""
+        self.insert_rows(schema, table, [row])
+
+    def insert_rows(
+        self, schema: str, table: str, rows: Iterable[dict], batch_size: int = 10000
+    ) -> int:
+        """
+        inserts rows into the table using one load job per batch_size rows.
+        each batch is serialized into an in-memory newline-delimited json buffer;
+        load jobs are not billed, unlike streaming inserts
+        returns the number of rows inserted
+        """
+        start_time = time.monotonic()
+        rows = iter(rows)
+        n_rows = 0
         table_ref = f"{self.bqclient.project}.{schema}.{table}"
-        bqtable = self.bqclient.get_table(table_ref)
-        errors = self.bqclient.insert_rows(bqtable, [row])
-        if errors:
-            # pylint:disable=logging-fstring-interpolation
-            logger.error(f"row insertion failed: {errors}")
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+
+        batch = list(islice(rows, batch_size))
+        while len(batch) > 0:
+            buffer = io.BytesIO()
+            for row in batch:
+                buffer.write(json.dumps(row, default=str).encode("utf-8"))
+                buffer.write(b"\n")
+            buffer.seek(0)
+            load_job = self.bqclient.load_table_from_file(
+                buffer, table_ref, location=self.location, job_config=job_config
+            )
+            load_job.result()
+            n_rows += len(batch)
+            batch = list(islice(rows, batch_size))
+
+        elapsed = time.monotonic() - start_time
+        logger.info(
+            "inserted %d rows into %s.%s in %.2fs (%.0f rows/sec)",
+            n_rows,
+            schema,
+            table,
+            elapsed,
+            n_rows / elapsed if elapsed > 0 else n_rows,
+        )
+        return n_rows
 
     def json_extract_op(self, json_column: str, json_field: str, sql_column: str):
         """outputs a sql query snippet for extracting a json field"""
         json_field = json_field.replace("'", "\\'")
         return f"json_value({json_column}, '$.\"{json_field}\"') as `{sql_column}`"
 
+    @staticmethod
+    def json_path_(path: list) -> str:
+        """a JSONPath string literal for the keys of a json path"""
+        escaped_keys = [
+            key.replace("\\", "\\\\").replace('"', '\\"').replace("'", "\\'")
+            for key in path
+        ]
+        return "'$" + "".join(f'."{key}"' for key in escaped_keys) + "'"
+
+    def json_extract_path_op(self, json_column: str, path: list, sql_column: str):
+        """outputs a sql query snippet for extracting the value at a path into nested json objects"""
+        return f"json_value({json_column}, {self.json_path_(path)}) as `{sql_column}`"
+
+    def json_explode_sql(
+        self, json_column: str, path: list, select_columns, from_sql: str
+    ) -> str:
+        """
+        a SELECT with one row per element of the json array at the path, holding the
+        select_columns (a list, or "*"), the element's position _index and the element
+        as a json string in value. rows where there is no array at the path are left out
+        """
+        source_alias = "_src"
+        if select_columns == "*":
+            select_list = [f"{source_alias}.*"]
+        else:
+            select_list = [
+                f"{source_alias}.{quote_columnname(col, 'bigquery')}"
+                for col in select_columns
+            ]
+        select_list += ["_index", "_elem AS value"]
+        return (
+            "SELECT " + "\n, ".join(select_list) + "\n"
+            f"FROM {from_sql} AS {source_alias}\n"
+            f"CROSS JOIN UNNEST(JSON_QUERY_ARRAY({source_alias}.{quote_columnname(json_column, 'bigquery')}, "
+            f"{self.json_path_(path)})) AS _elem WITH OFFSET AS _index\n"
+        )
+
+    def json_flatten_sql(
+        self,
+        json_column: str,
+        columntuples: list,
+        select_columns,
+        from_sql: str,
+        column_types: dict = None,
+    ) -> str:
+        """
+        a SELECT of select_columns (a list, or "*") and of each (json_field, sql_column)
+        in columntuples, which parses json_column once per row with SAFE.PARSE_JSON
+        and extracts every field from the parsed value, instead of parsing the json
+        string once per field
+        a json_field may be a list of keys, for a path into nested objects
+        column_types: {json_field: type} for fields which should not be strings, see
+            jsonkeys.INFERRED_TYPES; paths are given as tuples. values which don't
+            fit the type become NULL
+        """
+        column_types = column_types or {}
+        source_alias = "_src"
+        if select_columns == "*":
+            select_list = [f"{source_alias}.* EXCEPT (_doc)"]
+        else:
+            select_list = [
+                f"{source_alias}.{quote_columnname(col, 'bigquery')}"
+                for col in select_columns
+            ]
+
+        for json_field, sql_column in columntuples:
+            if isinstance(json_field, str):
+                path, type_key = [json_field], json_field
+            else:
+                path, type_key = list(json_field), tuple(json_field)
+            value = f"{source_alias}._doc"
+            for key in path:
+                escaped_key = key.replace("\\", "\\\\").replace("'", "\\'")
+                value += f"['{escaped_key}']"
+            select_list.append(
+                f"{self.safe_cast_(value, column_types.get(type_key, 'string'))}"
+                f" as `{sql_column}`"
+            )
+
+        sql = "SELECT " + "\n, ".join(select_list) + "\n"
+        sql += (
+            f"FROM (SELECT *, SAFE.PARSE_JSON({quote_columnname(json_column, 'bigquery')}, "
+            f"wide_number_mode=>'round') AS _doc FROM {from_sql}) AS {source_alias}\n"
+        )
+        return sql
+
+    @staticmethod
+    def safe_cast_(value: str, column_type: str) -> str:
+        """converts a JSON value to the type, or to NULL if it doesn't fit the type"""
+        return {
+            "string": f"JSON_VALUE({value})",
+            "integer": f"SAFE.INT64({value})",
+            "numeric": f"SAFE.FLOAT64({value}, wide_number_mode=>'round')",
+            "boolean": f"SAFE.BOOL({value})",
+            "date": f"SAFE_CAST(JSON_VALUE({value}) AS DATE)",
+            "timestamp": f"SAFE_CAST(JSON_VALUE({value}) AS TIMESTAMP)",
+            "json": value,
+        }[column_type]
+
     def close(self):
         """closing the connection and releasing system resources"""
         try:
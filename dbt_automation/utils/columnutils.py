@@ -59,6 +59,16 @@ def quote_columnname(colname: str, warehouse: str):
         raise ValueError(f"unsupported warehouse: {warehouse}")
 
 
+def quote_stringliteral(value: str, warehouse: str):
+    """a string constant holding exactly value, e.g. a column name or a column value"""
+    if warehouse == "postgres":
+        return "'" + value.replace("'", "''") + "'"
+    elif warehouse == "bigquery":
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    else:
+        raise ValueError(f"unsupported warehouse: {warehouse}")
+
+
 def quote_constvalue(value: str, warehouse: str):
     """encloses a constant string value inside proper quotes"""
     if value is None or value.strip().lower() == "none":
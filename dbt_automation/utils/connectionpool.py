@@ -0,0 +1,271 @@
+"""a pool of warm postgres connections shared by PostgresClient instances"""
+
+import hashlib
+import json
+import threading
+import time
+from logging import basicConfig, getLogger, INFO
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from sshtunnel import SSHTunnelForwarder
+
+basicConfig(level=INFO)
+logger = getLogger()
+
+# one pool per connection fingerprint, one tunnel per (ssh_host, host, port)
+_POOLS = {}
+_TUNNELS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def connection_fingerprint(conn_info: dict) -> str:
+    """returns a stable hash identifying the warehouse connection in conn_info"""
+    serialized = json.dumps(conn_info, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def tunnel_key(conn_info: dict) -> tuple:
+    """ssh tunnels are shared between all connections to the same remote server"""
+    return (conn_info["ssh_host"], conn_info["host"], conn_info["port"])
+
+
+def acquire_tunnel(conn_info: dict) -> SSHTunnelForwarder:
+    """starts the ssh tunnel for this connection, or reuses a running one"""
+    key = tunnel_key(conn_info)
+    with _REGISTRY_LOCK:
+        if key in _TUNNELS:
+            tunnel, refcount = _TUNNELS[key]
+            if tunnel.is_active:
+                _TUNNELS[key] = (tunnel, refcount + 1)
+                return tunnel
+            tunnel.stop()
+
+        tunnel = SSHTunnelForwarder(
+            (conn_info["ssh_host"], conn_info["ssh_port"]),
+            remote_bind_address=(conn_info["host"], conn_info["port"]),
+            ssh_pkey=conn_info.get("ssh_pkey"),
+            ssh_username=conn_info.get("ssh_username"),
+            ssh_password=conn_info.get("ssh_password"),
+            ssh_private_key_password=conn_info.get("ssh_private_key_password"),
+        )
+        tunnel.start()
+        _TUNNELS[key] = (tunnel, 1)
+        logger.info("started ssh tunnel to %s", conn_info["ssh_host"])
+        return tunnel
+
+
+def release_tunnel(conn_info: dict):
+    """stops the ssh tunnel once its last user has released it"""
+    key = tunnel_key(conn_info)
+    with _REGISTRY_LOCK:
+        if key not in _TUNNELS:
+            return
+        tunnel, refcount = _TUNNELS[key]
+        if refcount > 1:
+            _TUNNELS[key] = (tunnel, refcount - 1)
+            return
+        del _TUNNELS[key]
+    tunnel.stop()
+    logger.info("stopped ssh tunnel to %s", conn_info["ssh_host"])
+
+
+class PostgresConnectionPool:
+    """
+    a thread-safe pool of psycopg2 connections to one warehouse
+    - getconn() checks out a connection for the exclusive use of the caller
+    - putconn() returns it; it is kept warm for the next caller
+    - connections which have been idle for longer than health_check_after
+      are pinged before being handed out, broken ones are replaced
+    - connections idle for longer than idle_timeout are closed
+    - reserve(n) raises maxconn to at least n until the matching release(n),
+      after which the pool shrinks back to the maxconn it was created with
+    """
+
+    def __init__(
+        self,
+        conn_info: dict,
+        connect,
+        maxconn: int = 10,
+        idle_timeout: float = 300,
+        health_check_after: float = 30,
+        checkout_timeout: float = 30,
+    ):
+        self.conn_info = dict(conn_info)
+        self.connect = connect
+        self.maxconn = maxconn
+        self.base_maxconn = maxconn
+        self.reservations = []  # the maxconn asked for by each reserve()
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+
+        self.idle = []  # list of (connection, returned_at), most recent last
+        self.checked_out = 0
+        self.closed = False
+        self.lock = threading.Condition()
+
+        self.tunnel = None
+        self.connect_info = dict(conn_info)
+        if "ssh_host" in conn_info:
+            self.tunnel = acquire_tunnel(conn_info)
+            self.connect_info["host"] = "localhost"
+            self.connect_info["port"] = self.tunnel.local_bind_port
+
+    def getconn(self):
+        """checks out a healthy connection, opening a new one if none are idle"""
+        deadline = time.monotonic() + self.checkout_timeout
+        with self.lock:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                self.evict_idle_()
+
+                while self.idle:
+                    connection, returned_at = self.idle.pop()
+                    recently_used = (
+                        time.monotonic() - returned_at < self.health_check_after
+                    )
+                    if not connection.closed and (
+                        recently_used or self.is_healthy_(connection)
+                    ):
+                        self.checked_out += 1
+                        return connection
+                    self.discard_(connection)
+
+                if self.checked_out < self.maxconn:
+                    # reserve the slot now, connect outside the lock
+                    self.checked_out += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.lock.wait(remaining):
+                    raise PoolError("connection pool exhausted")
+
+        try:
+            return self.connect(self.connect_info)
+        except Exception:
+            with self.lock:
+                self.checked_out -= 1
+                self.lock.notify()
+            raise
+
+    def putconn(self, connection, close: bool = False):
+        """returns a connection to the pool"""
+        with self.lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+            over_cap = self.checked_out + len(self.idle) >= self.maxconn
+            if close or self.closed or connection.closed or over_cap:
+                self.discard_(connection)
+            else:
+                try:
+                    if connection.status != extensions.STATUS_READY:
+                        connection.rollback()
+                    self.idle.append((connection, time.monotonic()))
+                except psycopg2.Error:
+                    self.discard_(connection)
+            self.lock.notify()
+
+    def reserve(self, maxconn: int):
+        """lets the pool hold at least maxconn connections until release(maxconn)"""
+        with self.lock:
+            self.reservations.append(maxconn)
+            self.resize_()
+
+    def release(self, maxconn: int):
+        """ends a reserve(maxconn); connections above the cap are closed as
+        they are returned"""
+        with self.lock:
+            if maxconn in self.reservations:
+                self.reservations.remove(maxconn)
+            self.resize_()
+            while self.idle and self.checked_out + len(self.idle) > self.maxconn:
+                connection, _ = self.idle.pop(0)
+                self.discard_(connection)
+
+    def evict_idle(self):
+        """closes connections which have been idle for longer than idle_timeout"""
+        with self.lock:
+            self.evict_idle_()
+
+    def closeall(self):
+        """closes all idle connections and stops the tunnel; checked out
+        connections are closed when they are returned"""
+        with self.lock:
+            self.closed = True
+            for connection, _ in self.idle:
+                self.discard_(connection)
+            self.idle = []
+            self.lock.notify_all()
+        if self.tunnel is not None:
+            release_tunnel(self.conn_info)
+            self.tunnel = None
+
+    def resize_(self):
+        """sets maxconn from the reservations, for callers holding the lock"""
+        self.maxconn = max([self.base_maxconn] + self.reservations)
+        self.lock.notify_all()
+
+    def evict_idle_(self):
+        """evict_idle, for callers already holding the lock"""
+        now = time.monotonic()
+        keep = []
+        for connection, returned_at in self.idle:
+            if now - returned_at > self.idle_timeout:
+                self.discard_(connection)
+            else:
+                keep.append((connection, returned_at))
+        self.idle = keep
+
+    @staticmethod
+    def is_healthy_(connection) -> bool:
+        """pings the server over this connection"""
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def discard_(connection):
+        """closes a connection we are not going to reuse"""
+        try:
+            connection.close()
+        except psycopg2.Error:
+            logger.error("something went wrong while closing a pooled connection")
+
+
+def get_pool(conn_info: dict, connect, **kwargs) -> PostgresConnectionPool:
+    """
+    returns the shared pool for this connection, creating it if required
+    kwargs only apply to a new pool; use reserve() to grow an existing one
+    """
+    fingerprint = connection_fingerprint(conn_info)
+    with _REGISTRY_LOCK:
+        pool = _POOLS.get(fingerprint)
+        if pool is not None and not pool.closed:
+            return pool
+
+    # create outside the lock since starting a tunnel takes the lock
+    pool = PostgresConnectionPool(conn_info, connect, **kwargs)
+    with _REGISTRY_LOCK:
+        existing = _POOLS.get(fingerprint)
+        if existing is None or existing.closed:
+            _POOLS[fingerprint] = pool
+            return pool
+
+    pool.closeall()
+    return existing
+
+
+def close_all_pools():
+    """closes every pool, e.g. when a worker process shuts down"""
+    with _REGISTRY_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.closeall()
@@ -1,16 +1,166 @@
 """the dbt project structure"""
 
+import hashlib
 import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 import yaml
 
 
+# the schema set in a model's config() block
+MODEL_SCHEMA = re.compile(r"config\([^)]*\bschema\s*=\s*['\"]([^'\"]+)['\"]")
+
+
+def file_mode() -> int:
+    """the mode open() gives new files under the process's umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# read once, since os.umask can only be read by setting it
+FILE_MODE = file_mode()
+
+
+def content_hash(content: str) -> str:
+    """a hash of a file's content, to tell whether it has changed"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def write_file_atomically(filename: Path, content: str) -> bool:
+    """
+    writes content to filename via a temp file and a rename, so readers never see
+    a partial file. leaves the file alone if its content is unchanged, returning
+    False in that case and True if the file was written
+    """
+    filename = Path(filename)
+    if filename.exists():
+        with open(filename, "r", encoding="utf-8") as existing:
+            if content_hash(existing.read()) == content_hash(content):
+                return False
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=filename.parent, suffix=".tmp", delete=False
+    ) as tmpfile:
+        tmpfile.write(content)
+    # temp files are created readable by their owner only
+    os.chmod(tmpfile.name, FILE_MODE)
+    os.replace(tmpfile.name, filename)
+    return True
+
+
+class ModelBatch:
+    """the files written to a dbt project inside dbtProject.batch(), held until the batch ends"""
+
+    def __init__(self, project_dir: str, max_workers: int = 8):
+        self.project_dir = project_dir
+        self.max_workers = max_workers
+        self.files = {}  # filename => content; a later write replaces an earlier one
+        self.ensured_dirs = set()
+        self.manifest = None
+        self.lock = threading.Lock()
+
+    def ensure_dir(self, dirname: Path):
+        """creates the directory the first time it is asked for"""
+        with self.lock:
+            if dirname in self.ensured_dirs:
+                return
+            self.ensured_dirs.add(dirname)
+        os.makedirs(dirname, exist_ok=True)
+
+    def add(self, filename: Path, content: str):
+        """buffers a file to be written when the batch ends"""
+        with self.lock:
+            self.files[Path(filename)] = content
+
+    def buffered(self) -> dict:
+        """the files buffered so far, as {filename: content}"""
+        with self.lock:
+            return dict(self.files)
+
+    def flush(self) -> dict:
+        """
+        writes the buffered files in parallel, skipping those whose content is
+        unchanged. returns {"written": [...], "unchanged": [...]}, with paths
+        relative to the project dir
+        """
+        with self.lock:
+            files = self.files
+            self.files = {}
+        for dirname in {filename.parent for filename in files}:
+            self.ensure_dir(dirname)
+
+        filenames = sorted(files)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            written = list(
+                executor.map(
+                    lambda filename: write_file_atomically(filename, files[filename]),
+                    filenames,
+                )
+            )
+
+        self.manifest = {"written": [], "unchanged": []}
+        for filename, was_written in zip(filenames, written):
+            self.manifest["written" if was_written else "unchanged"].append(
+                filename.resolve().relative_to(Path(self.project_dir).resolve())
+            )
+        return self.manifest
+
+
 class dbtProject:  # pylint:disable=invalid-name
     """the folder and files in a dbt project"""
 
+    # the batch in progress in this thread for each project dir, see batch()
+    _batches = threading.local()
+
     def __init__(self, project_dir: str):
         """constructor"""
         self.project_dir = project_dir
+        # files written by this instance, and files left alone as unchanged
+        self.written = 0
+        self.skipped = 0
+
+    def batch_key_(self) -> str:
+        """identifies the project dir, however it was spelled"""
+        return str(Path(self.project_dir).resolve())
+
+    @staticmethod
+    def batches_() -> dict:
+        """the batches in progress in this thread, by project dir"""
+        if not hasattr(dbtProject._batches, "by_project"):
+            dbtProject._batches.by_project = {}
+        return dbtProject._batches.by_project
+
+    def active_batch_(self) -> ModelBatch:
+        """the batch in progress for this project in this thread, if any"""
+        return dbtProject.batches_().get(self.batch_key_())
+
+    @contextmanager
+    def batch(self, max_workers: int = 8):
+        """
+        within this context, models and model configs written to this project by
+        any dbtProject instance in this thread are buffered and written together when the context
+        exits; each folder is created once. nothing is written if the context
+        exits with an exception. the yielded ModelBatch's manifest lists the
+        files which were written and those which were unchanged
+        """
+        key = self.batch_key_()
+        batches = dbtProject.batches_()
+        if key in batches:
+            # the outermost batch writes everything
+            yield batches[key]
+            return
+
+        model_batch = ModelBatch(self.project_dir, max_workers)
+        batches[key] = model_batch
+        try:
+            yield model_batch
+        finally:
+            del batches[key]
+        model_batch.flush()
 
     def sources_filename(self, schema: str) -> str:
         """returns the pathname of the sources.yml in the folder for the given schema"""
@@ -23,13 +173,97 @@ class dbtProject:  # pylint:disable=invalid-name
     def ensure_models_dir(self, schema: str, subdir="") -> None:
         """ensures the existence of the output models folder for the given schema"""
         output_schema_dir = self.models_dir(schema, subdir)
-        if not os.path.exists(output_schema_dir):
+        model_batch = self.active_batch_()
+        if model_batch is not None:
+            model_batch.ensure_dir(output_schema_dir)
+        elif not os.path.exists(output_schema_dir):
             os.makedirs(output_schema_dir)
 
     def strip_project_dir(self, child_dir: Path) -> str:
         """removes the leading project_dir from the child_dir"""
         return child_dir.relative_to(self.project_dir)
 
+    def read_models_(self, name: str) -> dict:
+        """
+        the files under models/ with this name, as {filename: content}, sorted
+        by filename. files buffered in this thread's batch are read in place of
+        those on disk, so that an operation sees the models written before it
+        """
+        models_dir = Path(self.project_dir).resolve() / "models"
+        files = {}
+        for filename in models_dir.rglob(name):
+            with open(filename, "r", encoding="utf-8") as model_file:
+                files[filename.resolve()] = model_file.read()
+        model_batch = self.active_batch_()
+        if model_batch is not None:
+            for filename, content in model_batch.buffered().items():
+                filename = filename.resolve()
+                if filename.name == name and models_dir in filename.parents:
+                    files[filename] = content
+        return dict(sorted(files.items()))
+
+    def input_relation(self, input_table: dict) -> tuple:
+        """
+        the (schema, table) in the warehouse of an operation's source or model
+        input: a source's schema and identifier from the sources.yml declaring
+        it, which default to the source and table names as in dbt, or the
+        schema set in the config of the model's .sql, as written so far in a
+        batch in progress
+        raises ValueError if they can't be found
+        """
+        models_dir = Path(self.project_dir) / "models"
+        input_name = input_table["input_name"]
+        if input_table["input_type"] == "source":
+            source_name = input_table["source_name"]
+            for sources_yml in self.read_models_("sources.yml").values():
+                sources = (yaml.safe_load(sources_yml) or {}).get("sources") or []
+                for source in sources:
+                    if source.get("name") != source_name:
+                        continue
+                    for table in source.get("tables") or []:
+                        if table.get("name") == input_name:
+                            return (
+                                source.get("schema", source_name),
+                                table.get("identifier", input_name),
+                            )
+            raise ValueError(
+                f"no table {input_name} in a source {source_name} in the sources.yml "
+                f"files under {models_dir}"
+            )
+
+        if input_table["input_type"] == "model":
+            models = list(self.read_models_(f"{input_name}.sql").values())
+            if len(models) != 1:
+                raise ValueError(
+                    f"found {len(models)} models named {input_name} under {models_dir}"
+                )
+            match = MODEL_SCHEMA.search(models[0])
+            if match is None:
+                raise ValueError(f"model {input_name} doesn't set its schema in its config")
+            return match.group(1), input_name
+
+        raise ValueError(f"a {input_table['input_type']} input has no table in the warehouse")
+
+    def write_file_(self, filename: Path, content: str, logger=None):
+        """
+        writes the file now, or when the batch in progress ends. a file whose
+        content is unchanged is not rewritten, so its mtime is kept and dbt's
+        partial parsing doesn't re-parse it
+        """
+        model_batch = self.active_batch_()
+        if model_batch is not None:
+            model_batch.add(filename, content)
+        elif write_file_atomically(filename, content):
+            self.written += 1
+        else:
+            self.skipped += 1
+            if logger:
+                logger.info("unchanged %s", filename)
+
+    def write_counts(self) -> dict:
+        """the number of files written and skipped as unchanged outside of batches"""
+        return {"written": self.written, "skipped": self.skipped}
+
     def write_model(
         self, schema: str, modelname: str, model_sql: str, **kwargs
     ) -> None:
@@ -42,11 +276,9 @@ class dbtProject:  # pylint:disable=invalid-name
         model_filename = Path(self.models_dir(schema, kwargs.get("subdir", ""))) / (
             modelname + ".sql"
         )
-        with open(model_filename, "w", encoding="utf-8") as outfile:
-            if kwargs.get("logger"):
-                kwargs["logger"].info("[write_model] %s", model_filename)
-            outfile.write(model_sql)
-            outfile.close()
+        if kwargs.get("logger"):
+            kwargs["logger"].info("[write_model] %s", model_filename)
+        self.write_file_(model_filename, model_sql, kwargs.get("logger"))
 
         return self.strip_project_dir(model_filename)
 
@@ -56,17 +288,19 @@ class dbtProject:  # pylint:disable=invalid-name
         models_filename = (
             Path(self.models_dir(schema, kwargs.get("subdir", ""))) / "models.yml"
         )
-        with open(models_filename, "w", encoding="utf-8") as models_file:
-            if kwargs.get("logger"):
-                kwargs["logger"].info("writing %s", models_filename)
+        if kwargs.get("logger"):
+            kwargs["logger"].info("writing %s", models_filename)
+        self.write_file_(
+            models_filename,
             yaml.safe_dump(
                 {
                     "version": 2,
                     "models": models,
                 },
-                models_file,
                 sort_keys=False,
-            )
+            ),
+            kwargs.get("logger"),
+        )
 
         return self.strip_project_dir(models_filename)
 
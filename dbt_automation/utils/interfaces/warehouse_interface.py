@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterable
 
 
 class WarehouseInterface(ABC):
@@ -6,6 +7,10 @@ class WarehouseInterface(ABC):
     def execute(self, statement: str):
         pass
 
+    @abstractmethod
+    def execute_stream(self, statement: str, itersize: int = 2000, as_dict=False):
+        pass
+
     @abstractmethod
     def get_tables(self, schema: str):
         pass
@@ -23,6 +28,8 @@ class WarehouseInterface(ABC):
         page: int = 1,
         order_by: str = None,
         order: int = 1,  # ASC
+        after: str = None,
+        tiebreaker: str = None,
     ):
         pass
 
@@ -35,7 +42,54 @@ class WarehouseInterface(ABC):
         pass
 
     @abstractmethod
-    def get_json_columnspec(self, schema: str, table: str, column: str):
+    def get_schema_columns(self, schema: str, tables: list = None) -> dict:
+        pass
+
+    @abstractmethod
+    def get_json_columnspec(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+    ):
+        pass
+
+    @abstractmethod
+    def get_json_keystats(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+        value_classes: bool = False,
+    ) -> dict:
+        pass
+
+    @abstractmethod
+    def get_json_paths(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        max_depth: int = 3,
+        sample_percent: float = None,
+        max_rows: int = None,
+    ) -> list:
+        pass
+
+    @abstractmethod
+    def get_distinct_values(
+        self, schema: str, table: str, column: str, limit: int = 100, top_k: bool = False
+    ) -> list:
         pass
 
     @abstractmethod
@@ -54,10 +108,41 @@ class WarehouseInterface(ABC):
     def insert_row(self, schema: str, table: str, row: dict):
         pass
 
+    @abstractmethod
+    def insert_rows(
+        self, schema: str, table: str, rows: Iterable[dict], batch_size: int = 1000
+    ):
+        pass
+
     @abstractmethod
     def json_extract_op(self, json_column: str, json_field: str, sql_column: str):
         pass
 
+    @abstractmethod
+    def json_extract_path_op(self, json_column: str, path: list, sql_column: str):
+        pass
+
+    @abstractmethod
+    def json_explode_sql(
+        self, json_column: str, path: list, select_columns, from_sql: str
+    ) -> str:
+        pass
+
+    @abstractmethod
+    def json_flatten_sql(
+        self,
+        json_column: str,
+        columntuples: list,
+        select_columns,
+        from_sql: str,
+        column_types: dict = None,
+    ) -> str:
+        pass
+
+    @abstractmethod
+    def worker_client(self, maxconn: int = None):
+        pass
+
     @abstractmethod
     def close(self):
         pass
@@ -0,0 +1,281 @@
+"""discovers the keys of the json objects in a column, fully, by sampling or incrementally"""
+
+import datetime
+import threading
+from logging import basicConfig, getLogger, INFO
+from pathlib import Path
+import yaml
+
+from dbt_automation.utils.dbtproject import write_file_atomically
+from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+
+basicConfig(level=INFO)
+logger = getLogger()
+
+DISCOVERY_MODES = ["full", "sample", "incremental"]
+
+# the classes json values are sorted into for type inference, besides the
+# json types boolean, object, array and null
+INTEGER_PATTERN = r"^-?[0-9]{1,18}$"
+NUMERIC_PATTERN = r"^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$"
+DATE_PATTERN = r"^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$"
+TIMESTAMP_PATTERN = (
+    r"^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])[T ]"
+    r"([01][0-9]|2[0-3]):[0-5][0-9](:[0-5][0-9](\.[0-9]+)?)?(Z|[-+][0-9]{2}(:?[0-9]{2})?)?$"
+)
+# the types a flattened column can have
+INFERRED_TYPES = ["string", "integer", "numeric", "boolean", "date", "timestamp", "json"]
+
+
+class JsonKeyStore:
+    """
+    a yaml file holding the keys found so far in each json column, and the
+    watermark up to which the column has been scanned
+    """
+
+    def __init__(self, filename: str):
+        self.filename = Path(filename)
+        self.lock = threading.Lock()
+        self.entries = None
+
+    @staticmethod
+    def entry_name(schema: str, table: str, column: str) -> str:
+        """the key under which a json column is stored"""
+        return f"{schema}.{table}.{column}"
+
+    def load_(self) -> dict:
+        """reads the store from disk the first time it is needed"""
+        if self.entries is None:
+            self.entries = {}
+            if self.filename.exists():
+                with open(self.filename, "r", encoding="utf-8") as storefile:
+                    self.entries = yaml.safe_load(storefile) or {}
+        return self.entries
+
+    def get(self, schema: str, table: str, column: str) -> dict:
+        """returns {"keys": [...], "watermark": ...} or None"""
+        with self.lock:
+            entry = self.load_().get(self.entry_name(schema, table, column))
+        if entry is None:
+            return None
+        watermark = entry.get("watermark")
+        if watermark is not None:
+            watermark = datetime.datetime.fromisoformat(watermark)
+        return {"keys": list(entry["keys"]), "watermark": watermark}
+
+    def put(self, schema: str, table: str, column: str, keys: list, watermark):
+        """saves the keys and watermark for this column"""
+        with self.lock:
+            self.load_()[self.entry_name(schema, table, column)] = {
+                "keys": list(keys),
+                "watermark": watermark.isoformat() if watermark is not None else None,
+            }
+            self.save_()
+
+    def save_(self):
+        """writes the store atomically"""
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        write_file_atomically(self.filename, yaml.safe_dump(self.entries, sort_keys=True))
+
+
+def merge_keys(known_keys: list, found_keys: list) -> tuple:
+    """known keys keep their order, new ones are appended in sorted order"""
+    new_keys = sorted(set(found_keys) - set(known_keys))
+    return list(known_keys) + new_keys, new_keys
+
+
+def split_json_keys_path(dotted_path: str) -> list:
+    """
+    splits a path returned by bigquery's JSON_KEYS into its keys, e.g.
+    'a."b.c".d' => ["a", "b.c", "d"]. keys with dots or other special characters
+    are double-quoted, with their quotes and backslashes escaped
+    """
+    keys = []
+    key = ""
+    quoted = False
+    escaped = False
+    for char in dotted_path:
+        if escaped:
+            key += char
+            escaped = False
+        elif quoted and char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "." and not quoted:
+            keys.append(key)
+            key = ""
+        else:
+            key += char
+    keys.append(key)
+    return keys
+
+
+def leaf_paths(paths: list) -> list:
+    """the paths which no other path descends from, sorted"""
+    parents = set()
+    for path in paths:
+        for depth in range(1, len(path)):
+            parents.add(tuple(path[:depth]))
+    return sorted(list(path) for path in paths if tuple(path) not in parents)
+
+
+def keystats_from_rows(rows) -> dict:
+    """
+    folds (key, json_type, count) rows into
+    {key: {"count": n, "types": {json_type: n, ...}}}
+    """
+    keystats = {}
+    for key, json_type, count in rows:
+        stats = keystats.setdefault(key, {"count": 0, "types": {}})
+        stats["count"] += count
+        stats["types"][json_type] = stats["types"].get(json_type, 0) + count
+    return keystats
+
+
+def dominant_type(value_classes: dict, min_share: float = 0.95) -> str:
+    """
+    picks the type of a column from the counts of its values' classes, see
+    get_json_keystats(..., value_classes=True). nulls are ignored; integers
+    mixed with decimals are numeric, dates mixed with timestamps are timestamps.
+    returns "string" if no type covers min_share of the values
+    """
+    counts = {}
+    for value_class, count in value_classes.items():
+        if value_class == "null":
+            continue
+        if value_class in ["object", "array"]:
+            value_class = "json"
+        counts[value_class] = counts.get(value_class, 0) + count
+    total = sum(counts.values())
+    if total == 0:
+        return "string"
+
+    for value_type, count in counts.items():
+        if value_type in INFERRED_TYPES and count >= min_share * total:
+            return value_type
+    for value_type, members in [
+        ("numeric", ["integer", "numeric"]),
+        ("timestamp", ["date", "timestamp"]),
+    ]:
+        if sum(counts.get(member, 0) for member in members) >= min_share * total:
+            return value_type
+    return "string"
+
+
+def infer_json_types(
+    warehouse: WarehouseInterface,
+    schema: str,
+    table: str,
+    column: str,
+    keys: list,
+    sample_rows: int = 10000,
+    sample_percent: float = None,
+    min_share: float = 0.95,
+) -> dict:
+    """
+    infers the type of each key's values from at most sample_rows rows
+    returns {key: one of INFERRED_TYPES}
+    """
+    keystats = warehouse.get_json_keystats(
+        schema,
+        table,
+        column,
+        sample_percent=sample_percent,
+        max_rows=sample_rows,
+        value_classes=True,
+    )
+    column_types = {}
+    for key in keys:
+        column_types[key] = "string"
+        if key in keystats:
+            column_types[key] = dominant_type(keystats[key]["types"], min_share)
+    logger.info(
+        "inferred types for %s.%s.%s: %s",
+        schema,
+        table,
+        column,
+        {key: value_type for key, value_type in column_types.items() if value_type != "string"},
+    )
+    return column_types
+
+
+def discover_json_keys(
+    warehouse: WarehouseInterface,
+    schema: str,
+    table: str,
+    column: str = "_airbyte_data",
+    mode: str = "full",
+    sample_percent: float = 10,
+    keystore: JsonKeyStore = None,
+    watermark_column: str = "_airbyte_emitted_at",
+) -> dict:
+    """
+    finds the keys of the json objects in schema.table.column
+    full: scans every row
+    sample: scans sample_percent of the table, and adds to the keys already in the keystore
+    incremental: scans rows whose watermark_column is newer than the stored watermark,
+        and adds to the keys already in the keystore. falls back to a full scan
+        the first time a column is seen
+    returns {"keys": [...], "new_keys": [...], "watermark": ...}
+    """
+    if mode not in DISCOVERY_MODES:
+        raise ValueError(f"unknown key discovery mode {mode}")
+    if mode == "incremental" and keystore is None:
+        raise ValueError("incremental key discovery requires a keystore")
+
+    stored = None
+    if keystore is not None:
+        stored = keystore.get(schema, table, column)
+    known_keys = stored["keys"] if stored else []
+    watermark = stored["watermark"] if stored else None
+
+    if mode == "sample":
+        found_keys = warehouse.get_json_columnspec(
+            schema, table, column, sample_percent=sample_percent
+        )
+        keys, new_keys = merge_keys(known_keys, found_keys)
+
+    elif mode == "full" and keystore is None:
+        found_keys = warehouse.get_json_columnspec(schema, table, column)
+        keys, new_keys = merge_keys([], found_keys)
+
+    else:
+        # read the watermark before scanning; rows landing during the scan
+        # are scanned again by the next incremental run, which is harmless
+        until = warehouse.get_max_value(schema, table, watermark_column)
+        if mode == "incremental" and watermark is not None:
+            found_keys = []
+            if until is not None and until > watermark:
+                found_keys = warehouse.get_json_columnspec(
+                    schema,
+                    table,
+                    column,
+                    watermark_column=watermark_column,
+                    after=watermark,
+                    until=until,
+                )
+            keys, new_keys = merge_keys(known_keys, found_keys)
+        else:
+            found_keys = warehouse.get_json_columnspec(schema, table, column)
+            # a full scan also forgets keys which no longer appear
+            still_present = set(found_keys)
+            keys, new_keys = merge_keys(
+                [key for key in known_keys if key in still_present], found_keys
+            )
+        if until is not None:
+            watermark = until
+
+    logger.info(
+        "%s key discovery on %s.%s.%s: %d keys, %d new",
+        mode,
+        schema,
+        table,
+        column,
+        len(keys),
+        len(new_keys),
+    )
+    if keystore is not None:
+        keystore.put(schema, table, column, keys, watermark)
+
+    return {"keys": keys, "new_keys": new_keys, "watermark": watermark}
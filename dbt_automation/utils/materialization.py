@@ -0,0 +1,106 @@
+"""how generated models are materialized: rebuilt as tables, or updated incrementally"""
+
+from dbt_automation.utils.columnutils import quote_columnname
+from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+
+# the dbt incremental_strategy used on each warehouse when the config doesn't name one
+INCREMENTAL_STRATEGIES = {
+    "postgres": "delete+insert",
+    "bigquery": "merge",
+}
+DEFAULT_UNIQUE_KEY = "_airbyte_ab_id"
+DEFAULT_WATERMARK_COLUMN = "_airbyte_emitted_at"
+
+
+def incremental_options(config: dict, warehouse: WarehouseInterface) -> dict:
+    """
+    reads config["incremental"], which is true or a dict of
+        unique_key: default _airbyte_ab_id
+        watermark_column: the column the is_incremental() filter compares, default _airbyte_emitted_at
+        strategy: the dbt incremental_strategy, default from INCREMENTAL_STRATEGIES
+    returns the options with their defaults filled in, or None if the model is a table
+    """
+    incremental = config.get("incremental")
+    if not incremental:
+        return None
+    if not isinstance(incremental, dict):
+        incremental = {}
+    if warehouse.name not in INCREMENTAL_STRATEGIES and "strategy" not in incremental:
+        raise ValueError(f"no incremental strategy for warehouse {warehouse.name}")
+    return {
+        "unique_key": incremental.get("unique_key", DEFAULT_UNIQUE_KEY),
+        "watermark_column": incremental.get(
+            "watermark_column", DEFAULT_WATERMARK_COLUMN
+        ),
+        "strategy": incremental.get("strategy", INCREMENTAL_STRATEGIES.get(warehouse.name)),
+    }
+
+
+def check_incremental_safe(op_types: list):
+    """
+    raises a ValueError unless every one of these operations maps each input row
+    to output rows of its own, so that new input rows only add or replace output rows
+    """
+    # imported here since the registry imports the operations lazily too
+    from dbt_automation.operations.registry import (  # pylint:disable=import-outside-toplevel
+        get_operation,
+    )
+
+    for op_type in op_types:
+        if not get_operation(op_type)["incremental_safe"]:
+            raise ValueError(f"operation {op_type} cannot be materialized incrementally")
+
+
+def incremental_config_args(options: dict) -> list:
+    """the arguments of dbt's config() making a model incremental"""
+    return [
+        "materialized='incremental'",
+        f"unique_key='{options['unique_key']}'",
+        f"incremental_strategy='{options['strategy']}'",
+    ]
+
+
+def model_config_header(config: dict, warehouse: WarehouseInterface, *op_types) -> str:
+    """
+    the {{ config(...) }} line at the top of a model generated by these operations:
+    a table, or an incremental model if config["incremental"] is set
+    """
+    options = incremental_options(config, warehouse)
+    if options is None:
+        return "{{ config(materialized='table', schema='" + config["dest_schema"] + "') }}"
+
+    check_incremental_safe(op_types)
+    config_args = incremental_config_args(options) + [f"schema='{config['dest_schema']}'"]
+    return "{{ config(" + ", ".join(config_args) + ") }}"
+
+
+def incremental_select(
+    select_statement: str, output_cols: list, config: dict, warehouse: WarehouseInterface
+) -> str:
+    """
+    wraps a model's SELECT so that incremental runs only read the rows whose
+    watermark column is at least the latest one already in the model. the
+    warehouses push the filter down to the scan of the input, and the unique_key
+    replaces rows which are read again
+    returns the select statement as is if the model is a table
+    """
+    options = incremental_options(config, warehouse)
+    if options is None:
+        return select_statement
+
+    watermark_column = options["watermark_column"]
+    for column in [watermark_column, options["unique_key"]]:
+        if "*" not in output_cols and column not in output_cols:
+            raise ValueError(
+                f"an incremental model needs the {column} column in its output"
+            )
+    quoted_watermark = quote_columnname(watermark_column, warehouse.name)
+    return (
+        "SELECT * FROM (\n"
+        + select_statement.rstrip()
+        + "\n) AS _incremental\n"
+        + "{% if is_incremental() %}\n"
+        + f"WHERE _incremental.{quoted_watermark} >= "
+        + f"(SELECT MAX({quoted_watermark}) FROM {{{{ this }}}})\n"
+        + "{% endif %}\n"
+    )
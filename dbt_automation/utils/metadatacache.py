@@ -0,0 +1,175 @@
+"""caches schema metadata (schema lists, table lists, column specs) fetched by the warehouse clients"""
+
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import quote
+
+
+class MetadataCache(ABC):
+    """
+    a cache of warehouse metadata with a time-to-live
+    entries are keyed by (connection fingerprint, schema, table, kind); schema
+    and table are None for entries which describe the whole warehouse or schema
+    subclasses decide where the entries live
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def get_(self, key: tuple):
+        """returns (found, value) for an unexpired entry"""
+
+    @abstractmethod
+    def put_(self, key: tuple, value, expires_at: float):
+        """stores an entry"""
+
+    @abstractmethod
+    def invalidate(self, fingerprint: str, schema: str = None, table: str = None):
+        """
+        forgets what is cached about this table, or this schema, or the
+        whole warehouse. invalidating a table also forgets its schema's
+        table listing; invalidating a schema also forgets the schema listing
+        """
+
+    def get_or_load(self, key: tuple, loader):
+        """returns the cached value for key, calling loader() on a miss"""
+        with self.lock:
+            found, value = self.get_(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = loader()
+        with self.lock:
+            self.put_(key, value, time.time() + self.ttl)
+        return value
+
+    def stats(self) -> dict:
+        """hit and miss counters"""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class MemoryMetadataCache(MetadataCache):
+    """an in-process cache which evicts the least recently used entries beyond maxsize"""
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get_(self, key: tuple):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        # callers may modify what they get back
+        return True, copy.deepcopy(value)
+
+    def put_(self, key: tuple, value, expires_at: float):
+        self.entries[key] = (copy.deepcopy(value), expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, fingerprint: str, schema: str = None, table: str = None):
+        with self.lock:
+            for key in list(self.entries):
+                key_fingerprint, key_schema, key_table, _ = key
+                if key_fingerprint != fingerprint:
+                    continue
+                if schema is None:
+                    stale = True
+                elif table is None:
+                    stale = key_schema in (schema, None)
+                else:
+                    stale = key_schema == schema and key_table in (table, None)
+                if stale:
+                    del self.entries[key]
+
+
+class DiskMetadataCache(MetadataCache):
+    """
+    a cache in a directory, which can be shared by several processes
+    each entry is a json file at
+        <directory>/<fingerprint>/[s_<schema>/[t_<table>/]]<kind>.json
+    """
+
+    def __init__(self, directory: str, ttl: float = 300):
+        super().__init__(ttl)
+        self.directory = Path(directory)
+
+    def path_(self, fingerprint: str, schema: str = None, table: str = None) -> Path:
+        """the directory holding the entries for this warehouse / schema / table"""
+        path = self.directory / fingerprint
+        if schema is not None:
+            path = path / f"s_{quote(schema, safe='')}"
+            if table is not None:
+                path = path / f"t_{quote(table, safe='')}"
+        return path
+
+    def get_(self, key: tuple):
+        fingerprint, schema, table, kind = key
+        entryfile = self.path_(fingerprint, schema, table) / f"{quote(kind, safe='')}.json"
+        try:
+            with open(entryfile, "r", encoding="utf-8") as entry:
+                cached = json.load(entry)
+        except (OSError, ValueError):
+            return False, None
+        if cached["expires_at"] < time.time():
+            return False, None
+        return True, cached["value"]
+
+    def put_(self, key: tuple, value, expires_at: float):
+        fingerprint, schema, table, kind = key
+        entrydir = self.path_(fingerprint, schema, table)
+        entrydir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=entrydir, suffix=".tmp", delete=False
+        ) as tmpfile:
+            json.dump({"expires_at": expires_at, "value": value}, tmpfile)
+        os.replace(tmpfile.name, entrydir / f"{quote(kind, safe='')}.json")
+
+    def invalidate(self, fingerprint: str, schema: str = None, table: str = None):
+        with self.lock:
+            if schema is None:
+                shutil.rmtree(self.path_(fingerprint), ignore_errors=True)
+                return
+            if table is None:
+                shutil.rmtree(self.path_(fingerprint, schema), ignore_errors=True)
+                parent = self.path_(fingerprint)
+            else:
+                shutil.rmtree(self.path_(fingerprint, schema, table), ignore_errors=True)
+                parent = self.path_(fingerprint, schema)
+            for entryfile in parent.glob("*.json"):
+                entryfile.unlink(missing_ok=True)
+
+
+def cached_metadata(
+    cache: MetadataCache,
+    fingerprint: str,
+    kind: str,
+    loader,
+    schema: str = None,
+    table: str = None,
+):
+    """loader() through the cache if there is one"""
+    if cache is None:
+        return loader()
+    return cache.get_or_load((fingerprint, schema, table, kind), loader)
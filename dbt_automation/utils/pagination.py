@@ -0,0 +1,63 @@
+"""continuation tokens for keyset (seek) pagination through table data"""
+
+import base64
+import datetime
+import decimal
+import json
+
+
+def encode_value(value):
+    """tags values which don't survive a json round trip with their type"""
+    if isinstance(value, datetime.datetime):
+        return {"t": "datetime", "v": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"t": "date", "v": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"t": "decimal", "v": str(value)}
+    return {"t": "json", "v": value}
+
+
+def decode_value(tagged: dict):
+    """reverses encode_value"""
+    if tagged["t"] == "datetime":
+        return datetime.datetime.fromisoformat(tagged["v"])
+    if tagged["t"] == "date":
+        return datetime.date.fromisoformat(tagged["v"])
+    if tagged["t"] == "decimal":
+        return decimal.Decimal(tagged["v"])
+    return tagged["v"]
+
+
+def encode_continuation_token(values: list) -> str:
+    """encodes the sort key values of the last row of a page into an opaque token"""
+    payload = json.dumps([encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_continuation_token(token: str) -> list:
+    """decodes a token created by encode_continuation_token"""
+    try:
+        payload = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        return [decode_value(tagged) for tagged in json.loads(payload)]
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError("invalid continuation token") from error
+
+
+def next_continuation_token(rows: list, order_by: str, tiebreaker: str) -> str:
+    """
+    returns the token for the page after these rows, to be passed back to
+    get_table_data(..., after=token). returns None if there are no rows
+    """
+    if len(rows) == 0:
+        return None
+    last_row = rows[-1]
+    return encode_continuation_token(
+        [last_row[key] for key in sort_keys(order_by, tiebreaker)]
+    )
+
+
+def sort_keys(order_by: str, tiebreaker: str) -> list:
+    """the columns a keyset page is ordered by"""
+    if order_by and order_by != tiebreaker:
+        return [order_by, tiebreaker]
+    return [tiebreaker]
@@ -2,17 +2,43 @@
 
 import os
 import tempfile
+import time
+import uuid
+from itertools import islice
+from typing import Iterable
 from logging import basicConfig, getLogger, INFO
 import psycopg2
+from psycopg2.extras import execute_values
 from sshtunnel import SSHTunnelForwarder
 from dbt_automation.utils.columnutils import quote_columnname
+from dbt_automation.utils.connectionpool import connection_fingerprint, get_pool
 from dbt_automation.utils.interfaces.warehouse_interface import WarehouseInterface
+from dbt_automation.utils.pagination import decode_continuation_token, sort_keys
+from dbt_automation.utils.jsonkeys import (
+    DATE_PATTERN,
+    INTEGER_PATTERN,
+    NUMERIC_PATTERN,
+    TIMESTAMP_PATTERN,
+    keystats_from_rows,
+)
+from dbt_automation.utils.metadatacache import MetadataCache, cached_metadata
 
 
 basicConfig(level=INFO)
 logger = getLogger()
 
 
+# longer identifiers are truncated, see NAMEDATALEN
+POSTGRES_MAX_IDENTIFIER_LENGTH = 63
+
+# TIMESTAMP_PATTERN without the utc offsets postgres rejects, those beyond
+# 15:59 or with minutes over 59
+CAST_TIMESTAMP_PATTERN = (
+    r"^[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])[T ]"
+    r"([01][0-9]|2[0-3]):[0-5][0-9](:[0-5][0-9](\.[0-9]+)?)?(Z|[-+](0[0-9]|1[0-5])(:?[0-5][0-9])?)?$"
+)
+
+
 class PostgresClient(WarehouseInterface):
     """a postgres client that can be used as a context manager"""
 
@@ -76,11 +102,24 @@ class PostgresClient(WarehouseInterface):
         connection = psycopg2.connect(**connect_params)
         return connection
 
-    def __init__(self, conn_info: dict):
+    def __init__(
+        self,
+        conn_info: dict,
+        pooled: bool = False,
+        metadata_cache: MetadataCache = None,
+        maxconn: int = None,
+    ):
+        """
+        pooled: check the connection out of the pool shared by clients of this
+        warehouse, which holds at least maxconn connections until close()
+        """
         self.name = "postgres"
         self.cursor = None
         self.tunnel = None
         self.connection = None
+        self.pool = None
+        self.reserved_maxconn = None
+        self.metadata_cache = metadata_cache
 
         if conn_info is None:  # take creds from env
             conn_info = {
@@ -91,7 +130,24 @@ class PostgresClient(WarehouseInterface):
                 "database": os.getenv("DBNAME"),
             }
 
-        if "ssh_host" in conn_info:
+        # before the host and port are replaced by the tunnel's
+        self.source_conn_info = dict(conn_info)
+        self.fingerprint = connection_fingerprint(self.source_conn_info)
+
+        if pooled:
+            # the pool owns the tunnel and keeps the connection warm after close()
+            self.pool = get_pool(conn_info, PostgresClient.get_connection)
+            if maxconn:
+                self.pool.reserve(maxconn)
+                self.reserved_maxconn = maxconn
+            try:
+                self.connection = self.pool.getconn()
+            except Exception:
+                self.release_maxconn_()
+                raise
+            conn_info = dict(self.pool.connect_info)
+
+        elif "ssh_host" in conn_info:
             self.tunnel = SSHTunnelForwarder(
                 (conn_info["ssh_host"], conn_info["ssh_port"]),
                 remote_bind_address=(conn_info["host"], conn_info["port"]),
@@ -110,17 +166,23 @@ class PostgresClient(WarehouseInterface):
             self.connection = PostgresClient.get_connection(conn_info)
         self.conn_info = conn_info
 
+    def worker_client(self, maxconn: int = None):
+        """
+        returns a new client with its own pooled connection, for use by another
+        thread; close() it to return the connection to the pool. maxconn sizes
+        the pool for the number of clients which will be in use at once, until
+        they are all closed
+        """
+        return PostgresClient(
+            self.source_conn_info,
+            pooled=True,
+            metadata_cache=self.metadata_cache,
+            maxconn=maxconn,
+        )
+
     def __del__(self):
         """destructor"""
-        if self.cursor is not None:
-            self.cursor.close()
-            self.cursor = None
-        if self.connection is not None:
-            self.connection.close()
-            self.connection = None
-        if self.tunnel is not None:
-            self.tunnel.stop()
-            self.tunnel = None
+        self.close()
 
     def runcmd(self, statement: str):
         """runs a command"""
@@ -129,34 +191,89 @@ class PostgresClient(WarehouseInterface):
         self.cursor.execute(statement)
         self.connection.commit()
 
-    def execute(self, statement: str) -> list:
+    def execute(self, statement: str, params=None) -> list:
         """run a query and return the results"""
         if self.cursor is None:
             self.cursor = self.connection.cursor()
-        self.cursor.execute(statement)
+        try:
+            self.cursor.execute(statement, params)
+        except psycopg2.Error:
+            # leave the connection usable for the next statement
+            self.connection.rollback()
+            raise
         return self.cursor.fetchall()
 
-    def get_tables(self, schema: str) -> list:
-        """returns the list of table names in the given schema"""
-        resultset = self.execute(
-            f"""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = '{schema}'
+    def execute_stream(
+        self, statement: str, itersize: int = 2000, as_dict: bool = False, params=None
+    ):
+        """
+        run a query on a server-side cursor and yield the rows lazily, fetching
+        itersize rows per round trip. rows are tuples, or dicts if as_dict is set
+        the cursor lives in the current transaction, so don't commit on this
+        client (e.g. via runcmd) until the generator is exhausted or closed.
+        the transaction is committed at the end only if the stream began it
         """
+        began_transaction = (
+            self.connection.get_transaction_status()
+            == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        )
+        cursor = self.connection.cursor(name=f"dbt_automation_{uuid.uuid4().hex}")
+        cursor.itersize = itersize
+        try:
+            cursor.execute(statement, params)
+            col_names = None
+            for row in cursor:
+                if not as_dict:
+                    yield row
+                    continue
+                if col_names is None:
+                    col_names = [desc[0] for desc in cursor.description]
+                yield dict(zip(col_names, row))
+        finally:
+            cursor.close()
+            if began_transaction:
+                self.connection.commit()
+
+    def cached_(self, kind: str, loader, schema: str = None, table: str = None):
+        """loader() through the metadata cache, if this client has one"""
+        return cached_metadata(
+            self.metadata_cache, self.fingerprint, kind, loader, schema, table
         )
-        return [x[0] for x in resultset]
+
+    def invalidate_(self, schema: str = None, table: str = None):
+        """forgets cached metadata after a schema or table changes"""
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(self.fingerprint, schema, table)
+
+    def get_tables(self, schema: str) -> list:
+        """returns the list of table names in the given schema"""
+
+        def load():
+            resultset = self.execute(
+                f"""
+                SELECT table_name 
+                FROM information_schema.tables 
+                WHERE table_schema = '{schema}'
+            """
+            )
+            return [x[0] for x in resultset]
+
+        return self.cached_("tables", load, schema)
 
     def get_schemas(self) -> list:
         """returns the list of schema names in the given database connection"""
-        resultset = self.execute(
-            """
-            SELECT nspname
-            FROM pg_namespace
-            WHERE nspname NOT LIKE 'pg_%' AND nspname != 'information_schema' AND nspname != 'airbyte_internal';
-            """
-        )
-        return [x[0] for x in resultset]
+
+        def load():
+            resultset = self.execute(
+                """
+                SELECT nspname
+                FROM pg_namespace
+                WHERE nspname NOT LIKE 'pg_%' AND nspname != 'information_schema' AND nspname != 'airbyte_internal';
+                """
+            )
+            return [x[0] for x in resultset]
+
+        return self.cached_("schemas", load)
 
     def get_table_data(
         self,
@@ -166,11 +283,15 @@ class PostgresClient(WarehouseInterface):
         page: int = 1,
         order_by: str = None,
         order: int = 1,  # ASC
+        after: str = None,
+        tiebreaker: str = None,
     ) -> list:
         """
         returns limited rows from the specified table in the given schema
+        if a tiebreaker (a unique column) is given, rows are paged by keyset:
+        the next page starts after the continuation token `after`, see
+        pagination.next_continuation_token. otherwise `page` is used as an offset
         """
-        offset = max((page - 1) * limit, 0)
         # total_rows = self.execute(f"SELECT COUNT(*) FROM {schema}.{table}")[0][0]
 
         # select
@@ -178,63 +299,283 @@ class PostgresClient(WarehouseInterface):
         SELECT * 
         FROM "{schema}"."{table}"
         """
+        params = None
 
-        # order
-        if order_by:
+        if tiebreaker:
+            keys = sort_keys(order_by, tiebreaker)
+            quoted_keys = ", ".join(
+                [quote_columnname(key, "postgres") for key in keys]
+            )
+            if after:
+                params = decode_continuation_token(after)
+                if len(params) != len(keys):
+                    raise ValueError("continuation token does not match order_by")
+                query += f"""
+            WHERE ({quoted_keys}) {">" if order == 1 else "<"} ({", ".join(["%s"] * len(keys))})
+            """
             query += f"""
+            ORDER BY {", ".join([f'{quote_columnname(key, "postgres")} {"ASC" if order == 1 else "DESC"}' for key in keys])}
+            LIMIT {limit};
+            """
+
+        else:
+            offset = max((page - 1) * limit, 0)
+
+            # order
+            if order_by:
+                query += f"""
             ORDER BY {quote_columnname(order_by, "postgres")} {"ASC" if order == 1 else "DESC"}
             """
 
-        # offset, limit
-        query += f"""
+            # offset, limit
+            query += f"""
         OFFSET {offset} LIMIT {limit};
         """
 
-        resultset = self.execute(query)  # returns an array of tuples of values
+        # a page is bounded by the limit, so a plain cursor will do; unlike
+        # execute_stream it leaves the caller's transaction alone
+        resultset = self.execute(query, params)
         col_names = [desc[0] for desc in self.cursor.description]
-        rows = [dict(zip(col_names, row)) for row in resultset]
-
-        return rows
+        return [dict(zip(col_names, row)) for row in resultset]
 
     def get_table_columns(self, schema: str, table: str) -> list:
         """returns the column names of the specified table in the given schema"""
-        resultset = self.execute(
-            f"""
-            SELECT column_name, data_type
-            FROM information_schema.columns
-            WHERE table_schema = '{schema}' AND table_name = '{table}';
+
+        def load():
+            resultset = self.execute(
+                f"""
+                SELECT column_name, data_type
+                FROM information_schema.columns
+                WHERE table_schema = '{schema}' AND table_name = '{table}';
+                """
+            )
+            return [{"name": x[0], "data_type": x[1]} for x in resultset]
+
+        return self.cached_("columns", load, schema, table)
+
+    def get_schema_columns(self, schema: str, tables: list = None) -> dict:
+        """
+        returns {table: [{"name": ..., "data_type": ...}, ...]} for every table
+        in the schema, or only for the given tables, in one query
+        """
+
+        def load():
+            query = """
+                SELECT table_name, column_name, data_type
+                FROM information_schema.columns
+                WHERE table_schema = %s
             """
-        )
-        return [{"name": x[0], "data_type": x[1]} for x in resultset]
+            params = [schema]
+            if tables is not None:
+                query += "AND table_name = ANY(%s)\n"
+                params.append(list(tables))
+            query += "ORDER BY table_name, ordinal_position"
+
+            schema_columns = {}
+            for table, column_name, data_type in self.execute(query, params):
+                schema_columns.setdefault(table, []).append(
+                    {"name": column_name, "data_type": data_type}
+                )
+            return schema_columns
+
+        if tables is not None:
+            return load()
+        return self.cached_("schema_columns", load, schema)
 
     def get_columnspec(self, schema: str, table_id: str):
         """get the column schema for this table"""
-        return [
-            x[0]
-            for x in self.execute(
-                f"""SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = '{schema}'
-                AND table_name = '{table_id}'
-            """
-            )
-        ]
 
-    def get_json_columnspec(self, schema: str, table: str, column: str):
-        """get the column schema from the specified json field for this table"""
-        return [
-            x[0]
-            for x in self.execute(
-                f"""SELECT DISTINCT 
-                    jsonb_object_keys({quote_columnname(column, 'postgres')}::jsonb)
+        def load():
+            return [
+                x[0]
+                for x in self.execute(
+                    f"""SELECT column_name
+                    FROM information_schema.columns
+                    WHERE table_schema = '{schema}'
+                    AND table_name = '{table_id}'
+                """
+                )
+            ]
+
+        return self.cached_("columnspec", load, schema, table_id)
+
+    def json_scan_(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+    ) -> tuple:
+        """
+        a subquery casting the json in this column to jsonb once per row, restricted
+        to the sample / watermark range / row limit; returns (sql, query parameters)
+        """
+        query = f"""SELECT {quote_columnname(column, 'postgres')}::jsonb AS doc
                 FROM "{schema}"."{table}"
             """
+        if sample_percent is not None:
+            query += f"TABLESAMPLE SYSTEM ({float(sample_percent)})\n"
+
+        conditions = []
+        params = []
+        if watermark_column and after is not None:
+            conditions.append(f"{quote_columnname(watermark_column, 'postgres')} > %s")
+            params.append(after)
+        if watermark_column and until is not None:
+            conditions.append(f"{quote_columnname(watermark_column, 'postgres')} <= %s")
+            params.append(until)
+        if conditions:
+            query += "WHERE " + " AND ".join(conditions) + "\n"
+        if max_rows is not None:
+            query += f"LIMIT {int(max_rows)}\n"
+
+        return query, params
+
+    def get_json_columnspec(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+    ):
+        """
+        get the column schema from the specified json field for this table
+        sample_percent: only read this percentage of the table's pages
+        watermark_column, after, until: only read rows with after < watermark_column <= until
+        max_rows: only read this many rows
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, watermark_column, after, until, max_rows
+        )
+        query = f"""SELECT DISTINCT jsonb_object_keys(docs.doc)
+                FROM ({scan}) AS docs
+            """
+        return [x[0] for x in self.execute(query, params or None)]
+
+    def get_json_keystats(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        sample_percent: float = None,
+        watermark_column: str = None,
+        after=None,
+        until=None,
+        max_rows: int = None,
+        value_classes: bool = False,
+    ) -> dict:
+        """
+        like get_json_columnspec, but in the same pass counts how often each
+        key occurs and the json types of its values
+        returns {key: {"count": n, "types": {"string": n1, "number": n2, ...}}}
+        value_classes: count integer / numeric numbers and date / timestamp / other
+            strings separately rather than just number and string, for type inference
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, watermark_column, after, until, max_rows
+        )
+        value_type = "jsonb_typeof(kv.value)"
+        if value_classes:
+            value_type = f"""CASE jsonb_typeof(kv.value)
+                    WHEN 'number' THEN CASE WHEN kv.value::text ~ '{INTEGER_PATTERN}'
+                        THEN 'integer' ELSE 'numeric' END
+                    WHEN 'string' THEN CASE
+                        WHEN kv.value #>> '{{}}' ~ '{DATE_PATTERN}' THEN 'date'
+                        WHEN kv.value #>> '{{}}' ~ '{TIMESTAMP_PATTERN}' THEN 'timestamp'
+                        ELSE 'string' END
+                    ELSE jsonb_typeof(kv.value) END"""
+        query = f"""SELECT kv.key, {value_type}, COUNT(*)
+                FROM ({scan}) AS docs
+                CROSS JOIN LATERAL jsonb_each(docs.doc) AS kv
+                WHERE jsonb_typeof(docs.doc) = 'object'
+                GROUP BY 1, 2
+            """
+        return keystats_from_rows(self.execute(query, params or None))
+
+    def get_json_paths(
+        self,
+        schema: str,
+        table: str,
+        column: str,
+        max_depth: int = 3,
+        sample_percent: float = None,
+        max_rows: int = None,
+    ) -> list:
+        """
+        finds the paths to the leaves of the json objects in this column, descending
+        into nested objects up to max_depth keys deep. a leaf is a value which is not
+        an object, an empty object, or an object at max_depth
+        returns a sorted list of paths, each a list of keys
+        """
+        scan, params = self.json_scan_(
+            schema, table, column, sample_percent, max_rows=max_rows
+        )
+        query = f"""WITH RECURSIVE docs AS ({scan}),
+                paths(path, value, depth) AS (
+                    SELECT ARRAY[kv.key], kv.value, 1
+                    FROM docs
+                    CROSS JOIN LATERAL jsonb_each(docs.doc) AS kv
+                    WHERE jsonb_typeof(docs.doc) = 'object'
+                  UNION ALL
+                    SELECT paths.path || kv.key, kv.value, paths.depth + 1
+                    FROM paths
+                    CROSS JOIN LATERAL jsonb_each(paths.value) AS kv
+                    WHERE jsonb_typeof(paths.value) = 'object' AND paths.depth < %s
+                )
+                SELECT DISTINCT path FROM paths
+                WHERE jsonb_typeof(value) <> 'object' OR value = '{{}}'::jsonb OR depth = %s
+            """
+        resultset = self.execute(query, params + [max_depth, max_depth])
+        return sorted(list(x[0]) for x in resultset)
+
+    def get_distinct_values(
+        self, schema: str, table: str, column: str, limit: int = 100, top_k: bool = False
+    ) -> list:
+        """
+        returns at most limit distinct non-null values of the column, as strings,
+        in sorted order or, with top_k, the most frequent first. cached in the
+        metadata cache like the table's other metadata
+        """
+
+        def load():
+            quoted_column = quote_columnname(column, "postgres")
+            order = "COUNT(*) DESC, 1" if top_k else "1"
+            resultset = self.execute(
+                f"""SELECT {quoted_column}::text
+                FROM "{schema}"."{table}"
+                WHERE {quoted_column} IS NOT NULL
+                GROUP BY 1
+                ORDER BY {order}
+                LIMIT %s
+                """,
+                [limit],
             )
-        ]
+            return [x[0] for x in resultset]
+
+        kind = f"distinct_values_{'top' if top_k else 'sorted'}_{limit}_{column}"
+        return self.cached_(kind, load, schema, table)
+
+    def get_max_value(self, schema: str, table: str, column: str):
+        """returns the largest value in this column, e.g. the latest timestamp"""
+        resultset = self.execute(
+            f"""SELECT MAX({quote_columnname(column, 'postgres')})
+            FROM "{schema}"."{table}"
+            """
+        )
+        return resultset[0][0] if resultset else None
 
     def ensure_schema(self, schema: str):
         """creates the schema if it doesn't exist"""
         self.runcmd(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+        self.invalidate_(schema)
 
     def ensure_table(self, schema: str, table: str, columns: list):
         """creates the table if it doesn't exist. all columns are TEXT"""
@@ -246,26 +587,231 @@ class PostgresClient(WarehouseInterface):
             );
             """
         )
+        self.invalidate_(schema, table)
 
     def drop_table(self, schema: str, table: str):
         """drops the table if it exists"""
         self.runcmd(f"DROP TABLE IF EXISTS {schema}.{table};")
+        self.invalidate_(schema, table)
 
     def insert_row(self, schema: str, table: str, row: dict):
         """inserts a row into the table"""
-        columns = ",".join(row.keys())
-        values = ",".join([f"'{x}'" for x in row.values()])
-        self.runcmd(
-            f"""
-            INSERT INTO {schema}.{table} ({columns})
-            VALUES ({values});
-            """
+        self.insert_rows(schema, table, [row])
+
+    def insert_rows(
+        self, schema: str, table: str, rows: Iterable[dict], batch_size: int = 1000
+    ) -> int:
+        """
+        inserts rows into the table, batch_size rows per statement
+        all rows must have the same keys as the first one
+        returns the number of rows inserted
+        """
+        start_time = time.monotonic()
+        rows = iter(rows)
+        n_rows = 0
+        if self.cursor is None:
+            self.cursor = self.connection.cursor()
+
+        batch = list(islice(rows, batch_size))
+        if len(batch) == 0:
+            return 0
+        columns = list(batch[0].keys())
+        # unquoted identifiers, to match ensure_table
+        statement = f"INSERT INTO {schema}.{table} ({','.join(columns)}) VALUES %s"
+        while len(batch) > 0:
+            execute_values(
+                self.cursor,
+                statement,
+                [[row[col] for col in columns] for row in batch],
+                page_size=batch_size,
+            )
+            self.connection.commit()
+            n_rows += len(batch)
+            batch = list(islice(rows, batch_size))
+
+        elapsed = time.monotonic() - start_time
+        logger.info(
+            "inserted %d rows into %s.%s in %.2fs (%.0f rows/sec)",
+            n_rows,
+            schema,
+            table,
+            elapsed,
+            n_rows / elapsed if elapsed > 0 else n_rows,
         )
+        return n_rows
 
     def json_extract_op(self, json_column: str, json_field: str, sql_column: str):
         """outputs a sql query snippet for extracting a json field"""
         return f"{quote_columnname(json_column, 'postgres')}::json->>'{json_field}' as \"{sql_column}\""
 
+    def json_flatten_sql(
+        self,
+        json_column: str,
+        columntuples: list,
+        select_columns,
+        from_sql: str,
+        column_types: dict = None,
+    ) -> str:
+        """
+        a SELECT of select_columns (a list, or "*") and of each (json_field, sql_column)
+        in columntuples, which casts json_column to jsonb once per row and unpacks
+        all the fields with jsonb_to_record, instead of parsing the json once per field
+        the json values must be objects (or null), as they are in airbyte's _airbyte_data
+        a json_field may be a list of keys, for a path into nested objects
+        column_types: {json_field: type} for fields which should not be text, see
+            jsonkeys.INFERRED_TYPES; paths are given as tuples. values which don't
+            fit the type become NULL
+        """
+        column_types = column_types or {}
+        source_alias = "_src"
+        quoted_json_column = quote_columnname(json_column, "postgres")
+
+        if select_columns == "*":
+            select_list = [f"{source_alias}.*"]
+        else:
+            select_list = [
+                f"{source_alias}.{quote_columnname(col, 'postgres')}"
+                for col in select_columns
+            ]
+
+        columntuples = list(columntuples)
+        # top-level keys which nested paths go through are unpacked as jsonb
+        nested_parents = {
+            json_field[0]
+            for json_field, _ in columntuples
+            if not isinstance(json_field, str) and len(json_field) > 1
+        }
+
+        record_columns = {}  # top-level key => its type in the record
+        for json_field, sql_column in columntuples:
+            path = [json_field] if isinstance(json_field, str) else list(json_field)
+            column_type = column_types.get(
+                json_field if isinstance(json_field, str) else tuple(json_field),
+                "string",
+            )
+            as_json = column_type == "json"
+            quoted_field = '"' + path[0].replace('"', '""') + '"'
+            if len(path[0].encode("utf-8")) > POSTGRES_MAX_IDENTIFIER_LENGTH:
+                # postgres would truncate the record's column name, so it
+                # wouldn't match the json key
+                expression = self.jsonb_path_op_(
+                    f"{source_alias}.{quoted_json_column}::jsonb", path, as_json
+                )
+            elif path[0] in nested_parents:
+                record_columns[quoted_field] = "jsonb"
+                expression = self.jsonb_path_op_(f"_rec.{quoted_field}", path[1:], as_json)
+            else:
+                record_columns[quoted_field] = "jsonb" if as_json else "text"
+                expression = f"_rec.{quoted_field}"
+            select_list.append(
+                f'{self.safe_cast_(expression, column_type)} as "{sql_column}"'
+            )
+
+        sql = "SELECT " + "\n, ".join(select_list) + "\n"
+        sql += f"FROM {from_sql} AS {source_alias}\n"
+        if record_columns:
+            # parsed once in its own lateral, since jsonb_to_record raises on
+            # anything but an object and the json is checked before it
+            sql += (
+                f"LEFT JOIN LATERAL (SELECT {source_alias}.{quoted_json_column}::jsonb AS _doc)"
+                " AS _parsed ON TRUE\n"
+                "LEFT JOIN LATERAL jsonb_to_record("
+                "CASE WHEN jsonb_typeof(_parsed._doc) = 'object' THEN _parsed._doc END)"
+                f" AS _rec({', '.join(f'{name} {record_type}' for name, record_type in record_columns.items())})"
+                " ON TRUE\n"
+            )
+        return sql
+
+    @staticmethod
+    def text_array_(path: list) -> str:
+        """a text[] literal holding the keys of a json path"""
+        return "ARRAY[" + ", ".join("'" + key.replace("'", "''") + "'" for key in path) + "]"
+
+    @staticmethod
+    def jsonb_path_op_(jsonb_expression: str, path: list, as_json: bool) -> str:
+        """extracts the value at the path as jsonb, or as text"""
+        if len(path) == 0:
+            return jsonb_expression if as_json else f"{jsonb_expression} #>> '{{}}'"
+        if len(path) == 1:
+            operator = "->" if as_json else "->>"
+            return f"{jsonb_expression}{operator}'" + path[0].replace("'", "''") + "'"
+        operator = "#>" if as_json else "#>>"
+        return f"{jsonb_expression} {operator} {PostgresClient.text_array_(path)}"
+
+    def json_extract_path_op(self, json_column: str, path: list, sql_column: str):
+        """outputs a sql query snippet for extracting the value at a path into nested json objects"""
+        return f"{quote_columnname(json_column, 'postgres')}::json #>> {self.text_array_(path)} as \"{sql_column}\""
+
+    def json_explode_sql(
+        self, json_column: str, path: list, select_columns, from_sql: str
+    ) -> str:
+        """
+        a SELECT with one row per element of the json array at the path, holding the
+        select_columns (a list, or "*"), the element's position _index and the element
+        as jsonb in value. rows where there is no array at the path are left out
+        """
+        source_alias = "_src"
+        if select_columns == "*":
+            select_list = [f"{source_alias}.*"]
+        else:
+            select_list = [
+                f"{source_alias}.{quote_columnname(col, 'postgres')}"
+                for col in select_columns
+            ]
+        select_list += ['_elem.ordinality - 1 AS "_index"', '_elem.value AS "value"']
+
+        array = self.jsonb_path_op_(
+            f"{source_alias}.{quote_columnname(json_column, 'postgres')}::jsonb",
+            path,
+            as_json=True,
+        )
+        return (
+            "SELECT " + "\n, ".join(select_list) + "\n"
+            f"FROM {from_sql} AS {source_alias}\n"
+            f"CROSS JOIN LATERAL jsonb_array_elements(CASE WHEN jsonb_typeof({array}) = 'array' "
+            f"THEN {array} END) WITH ORDINALITY AS _elem(value, ordinality)\n"
+        )
+
+    @staticmethod
+    def valid_date_sql_(expression: str) -> str:
+        """
+        whether the yyyy-mm-dd at the start of a text expression is a day of the
+        calendar; the text must already match the date pattern. casting a date
+        such as 2023-02-30 or 0000-01-01 raises an error rather than giving NULL
+        """
+        year = f"CAST(substr({expression}, 1, 4) AS integer)"
+        month = f"substr({expression}, 6, 2)"
+        day = f"CAST(substr({expression}, 9, 2) AS integer)"
+        return (
+            f"{year} > 0 AND {day} <= CASE"
+            f" WHEN {month} IN ('04', '06', '09', '11') THEN 30"
+            f" WHEN {month} <> '02' THEN 31"
+            f" WHEN {year} % 4 = 0 AND ({year} % 100 <> 0 OR {year} % 400 = 0) THEN 29"
+            " ELSE 28 END"
+        )
+
+    @staticmethod
+    def safe_cast_(expression: str, column_type: str) -> str:
+        """casts a text expression to the type, or to NULL if the text doesn't fit it"""
+        if column_type in ["string", "json"]:
+            return expression
+        if column_type == "boolean":
+            return f"CASE WHEN {expression} IN ('true', 'false') THEN ({expression})::boolean END"
+        pattern, sql_type = {
+            "integer": (INTEGER_PATTERN, "bigint"),
+            "numeric": (NUMERIC_PATTERN, "numeric"),
+            "date": (DATE_PATTERN, "date"),
+            "timestamp": (CAST_TIMESTAMP_PATTERN, "timestamptz"),
+        }[column_type]
+        cast = f"({expression})::{sql_type}"
+        if column_type in ["date", "timestamp"]:
+            # nested, since postgres doesn't promise to evaluate the pattern first
+            # in an AND
+            cast = (
+                f"CASE WHEN {PostgresClient.valid_date_sql_(expression)} THEN {cast} END"
+            )
+        return f"CASE WHEN {expression} ~ '{pattern}' THEN {cast} END"
+
     def close(self):
         try:
             if self.cursor is not None:
@@ -275,13 +821,23 @@ class PostgresClient(WarehouseInterface):
                 self.tunnel.stop()
                 self.tunnel = None
             if self.connection is not None:
-                self.connection.close()
+                if self.pool is not None:
+                    self.pool.putconn(self.connection)
+                else:
+                    self.connection.close()
                 self.connection = None
+            self.release_maxconn_()
         except Exception:
             logger.error("something went wrong while closing the postgres connection")
 
         return True
 
+    def release_maxconn_(self):
+        """gives up the share of the pool this client reserved"""
+        if self.reserved_maxconn is not None:
+            self.pool.release(self.reserved_maxconn)
+            self.reserved_maxconn = None
+
     def generate_profiles_yaml_dbt(self, project_name, default_schema):
         """
         Generates the profiles.yml dictionary object for dbt
@@ -2,6 +2,8 @@
 This file will take all helpers need to work with dbt sources and dbt models
 """
 
+from dbt_automation.utils.columnutils import quote_columnname
+
 
 def source_or_ref(source_name: str, input_name: str, input_type: str) -> str:
     if input_type not in ["source", "model", "cte"]:
@@ -16,3 +18,32 @@ def source_or_ref(source_name: str, input_name: str, input_type: str) -> str:
         source_or_ref = f"source('{source_name}', '{input_name}')"
 
     return source_or_ref
+
+
+def select_from_sql(input_table: dict) -> str:
+    """what a generated SELECT reads from: a cte by name, a source or model via jinja"""
+    select_from = source_or_ref(**input_table)
+    if input_table["input_type"] == "cte":
+        return select_from
+    return "{{" + select_from + "}}"
+
+
+def projection_sql(projection: list, input_table: dict, warehouse_name: str) -> str:
+    """
+    a SELECT of the (output column, sql expression) pairs of a projection from
+    the input table; expressions which are the column itself are not aliased
+    """
+    select_list = []
+    for column, expression in projection:
+        quoted_column = quote_columnname(column, warehouse_name)
+        if expression == quoted_column:
+            select_list.append(quoted_column)
+        else:
+            select_list.append(f"{expression} AS {quoted_column}")
+    return (
+        "SELECT\n"
+        + ",\n".join(select_list)
+        + "\nFROM "
+        + select_from_sql(input_table)
+        + "\n"
+    )
@@ -2,14 +2,26 @@
 
 from dbt_automation.utils.postgres import PostgresClient
 from dbt_automation.utils.bigquery import BigQueryClient
+from dbt_automation.utils.metadatacache import MetadataCache
 
 
-def get_client(warehouse: str, conn_info: dict = None, location: str = None):
-    """constructs and returns an instance of the client for the right warehouse"""
+def get_client(
+    warehouse: str,
+    conn_info: dict = None,
+    location: str = None,
+    pooled: bool = False,
+    metadata_cache: MetadataCache = None,
+):
+    """
+    constructs and returns an instance of the client for the right warehouse
+    pooled postgres clients check out a warm connection from a shared pool
+    and return it on close(), so repeated calls don't reconnect
+    clients given a metadata_cache cache schema, table and column listings in it
+    """
     if warehouse == "postgres":
-        client = PostgresClient(conn_info)
+        client = PostgresClient(conn_info, pooled=pooled, metadata_cache=metadata_cache)
     elif warehouse == "bigquery":
-        client = BigQueryClient(conn_info, location)
+        client = BigQueryClient(conn_info, location, metadata_cache=metadata_cache)
     else:
         raise ValueError("unknown warehouse")
     return client
@@ -0,0 +1,122 @@
+"""
+compares the plans of the aggregate model on a local postgres: the old form with
+one scalar subquery per metric against the single aggregate scan joined back
+prints the EXPLAIN ANALYZE of each, and their execution times and buffers
+"""
+
+import os
+import argparse
+from logging import basicConfig, getLogger, INFO
+from dotenv import load_dotenv
+
+from dbt_automation.operations.aggregate import aggregate_dbt_sql
+from dbt_automation.utils.warehouseclient import get_client
+
+basicConfig(level=INFO)
+logger = getLogger()
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--schema", default="bench_aggregate")
+parser.add_argument("--rows", type=int, default=1000000)
+parser.add_argument("--metrics", type=int, default=10)
+parser.add_argument("--as-cte", action="store_true", help="select from an upstream CTE")
+parser.add_argument("--keep", action="store_true", help="don't drop the table after")
+args = parser.parse_args()
+
+load_dotenv("dbconnection.env")
+
+conn_info = {
+    "host": os.getenv("DBHOST"),
+    "port": os.getenv("DBPORT"),
+    "username": os.getenv("DBUSER"),
+    "password": os.getenv("DBPASSWORD"),
+    "database": os.getenv("DBNAME"),
+}
+warehouse = get_client("postgres", conn_info)
+
+TABLE = "facts"
+OPERATIONS = ["count", "countdistinct", "sum", "avg", "min", "max"]
+
+warehouse.ensure_schema(args.schema)
+warehouse.drop_table(args.schema, TABLE)
+logger.info("creating %d rows", args.rows)
+warehouse.runcmd(
+    f"""
+    CREATE TABLE {args.schema}.{TABLE} AS
+    SELECT i AS id, i % 1000 AS grp, (i * 7919) % 100000 AS amount, md5(i::text) AS label
+    FROM generate_series(1, {args.rows}) AS i
+    """
+)
+warehouse.runcmd(f"ANALYZE {args.schema}.{TABLE}")
+
+aggregate_on = [
+    {
+        "operation": OPERATIONS[i % len(OPERATIONS)],
+        "column": "amount",
+        "output_column_name": f"metric_{i}",
+    }
+    for i in range(args.metrics)
+]
+input_sql = f"{args.schema}.{TABLE}"
+cte_prefix = ""
+if args.as_cte:
+    # an upstream step of a mergeoperations chain
+    cte_prefix = (
+        f"WITH upstream AS (SELECT id, grp, amount + 1 AS amount FROM {args.schema}.{TABLE})\n"
+    )
+    input_sql = "upstream"
+
+
+def scalar_subqueries_sql() -> str:
+    """the aggregate model as it was generated before, one subquery per metric"""
+    metrics = []
+    for agg_col in aggregate_on:
+        if agg_col["operation"] == "count":
+            aggregate = 'COUNT("amount")'
+        elif agg_col["operation"] == "countdistinct":
+            aggregate = 'COUNT(DISTINCT "amount")'
+        else:
+            aggregate = f'{agg_col["operation"].upper()}("amount")'
+        metrics.append(
+            f'(SELECT {aggregate} FROM {input_sql}) AS "{agg_col["output_column_name"]}"'
+        )
+    return 'SELECT "id",\n' + ",\n".join(metrics) + f"\nFROM {input_sql}\n"
+
+
+def single_scan_sql() -> str:
+    """the aggregate model as generated now"""
+    sql, _ = aggregate_dbt_sql(
+        {
+            "input": {"input_type": "cte", "input_name": input_sql, "source_name": None},
+            "source_columns": ["id"],
+            "aggregate_on": aggregate_on,
+        },
+        warehouse,
+    )
+    return sql
+
+
+def explain(select: str) -> list:
+    """the lines of the plan, as executed"""
+    resultset = warehouse.execute(
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) {cte_prefix}{select}"
+    )
+    return [row[0] for row in resultset]
+
+
+for label, select in [
+    ("scalar subqueries", scalar_subqueries_sql()),
+    ("single scan", single_scan_sql()),
+]:
+    plan = explain(select)
+    print(f"==== {label}")
+    print("\n".join(plan))
+    # the first Buffers line is the root node's, which includes its children's
+    root_buffers = next(
+        (line.strip() for line in plan if line.strip().startswith("Buffers:")), ""
+    )
+    print(f"{label}: {plan[-1].strip()}, {root_buffers}")
+
+if not args.keep:
+    warehouse.drop_table(args.schema, TABLE)
+warehouse.close()
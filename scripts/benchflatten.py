@@ -0,0 +1,147 @@
+"""
+compares the cost of the flatten models which parse the json once per field
+with those which parse it once per row, on a wide synthetic airbyte table
+on bigquery the slot time of each run is reported as well as the wall time
+"""
+
+import os
+import json
+import time
+import argparse
+from logging import basicConfig, getLogger, INFO
+from dotenv import load_dotenv
+
+from dbt_automation.operations.flattenairbyte import mk_dbtmodel
+from dbt_automation.utils.warehouseclient import get_client
+
+basicConfig(level=INFO)
+logger = getLogger()
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--warehouse", required=True, choices=["postgres", "bigquery"])
+parser.add_argument("--schema", default="bench_flatten")
+parser.add_argument("--rows", type=int, default=100000)
+parser.add_argument("--keys", type=int, default=300)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--keep", action="store_true", help="don't drop the table after")
+args = parser.parse_args()
+
+load_dotenv("dbconnection.env")
+
+if args.warehouse == "postgres":
+    conn_info = {
+        "host": os.getenv("DBHOST"),
+        "port": os.getenv("DBPORT"),
+        "username": os.getenv("DBUSER"),
+        "password": os.getenv("DBPASSWORD"),
+        "database": os.getenv("DBNAME"),
+    }
+else:
+    with open(
+        os.getenv("GOOGLE_APPLICATION_CREDENTIALS"), "r", encoding="utf-8"
+    ) as gcp_creds:
+        conn_info = json.loads(gcp_creds.read())
+warehouse = get_client(args.warehouse, conn_info)
+
+TABLE = "wide_raw"
+OUTPUT = "bench_output"
+
+
+def run(statement: str) -> float:
+    """runs a statement; returns the slot milliseconds it used on bigquery, else None"""
+    if args.warehouse == "postgres":
+        warehouse.runcmd(statement)
+        return None
+    query_job = warehouse.bqclient.query(statement, location=warehouse.location)
+    query_job.result()
+    return query_job.slot_millis
+
+
+warehouse.ensure_schema(args.schema)
+warehouse.drop_table(args.schema, TABLE)
+logger.info("creating %d rows with %d keys each", args.rows, args.keys)
+if args.warehouse == "postgres":
+    run(
+        f"""
+        CREATE TABLE {args.schema}.{TABLE} AS
+        SELECT md5(i::text) AS _airbyte_ab_id,
+            (
+                SELECT json_object_agg('key_' || k, md5((i * k)::text))
+                FROM generate_series(1, {args.keys}) AS k
+            )::text AS _airbyte_data
+        FROM generate_series(1, {args.rows}) AS i
+        """
+    )
+    run(f"ANALYZE {args.schema}.{TABLE}")
+else:
+    run(
+        f"""
+        CREATE TABLE `{args.schema}`.`{TABLE}` AS
+        SELECT TO_HEX(MD5(CAST(i AS STRING))) AS _airbyte_ab_id,
+            (
+                SELECT '{{' || STRING_AGG(
+                    FORMAT('"key_%d":"%s"', k, TO_HEX(MD5(CAST(i * k AS STRING)))), ','
+                ) || '}}'
+                FROM UNNEST(GENERATE_ARRAY(1, {args.keys})) AS k
+            ) AS _airbyte_data
+        FROM UNNEST(GENERATE_ARRAY(1, {args.rows})) AS i
+        """
+    )
+
+columntuples = [(f"key_{k}", f"key_{k}") for k in range(1, args.keys + 1)]
+table_ref = (
+    f"{args.schema}.{TABLE}"
+    if args.warehouse == "postgres"
+    else f"`{args.schema}`.`{TABLE}`"
+)
+
+
+def model_select(parse_json_once: bool) -> str:
+    """the flatten model's SELECT, with the dbt source() replaced by the table"""
+    model_sql = mk_dbtmodel(
+        warehouse,
+        args.schema,
+        "bench",
+        TABLE,
+        columntuples,
+        parse_json_once=parse_json_once,
+    )
+    select = model_sql[model_sql.index("SELECT") :]
+    return select.replace("{{source('bench','wide_raw')}}", table_ref)
+
+
+def time_select(select: str) -> tuple:
+    """
+    materializes the select, the way dbt runs the model
+    returns the best wall time and the slot time of that run
+    """
+    best = None
+    for _ in range(args.repeat):
+        warehouse.drop_table(args.schema, OUTPUT)
+        start = time.perf_counter()
+        slot_millis = run(f"CREATE TABLE {args.schema}.{OUTPUT} AS {select}")
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, slot_millis)
+    warehouse.drop_table(args.schema, OUTPUT)
+    return best
+
+
+results = {}
+for label, parse_json_once in [("per field", False), ("once per row", True)]:
+    elapsed, slot_millis = time_select(model_select(parse_json_once))
+    results[label] = slot_millis if slot_millis is not None else elapsed
+    report = (
+        f"parse {label:>12}: {elapsed:8.2f} s {1e6 * elapsed / args.rows:10.1f} us/row"
+    )
+    if slot_millis is not None:
+        report += f" {slot_millis:12d} slot ms"
+    print(report)
+print(
+    f"{'slot time' if args.warehouse == 'bigquery' else 'time'} reduction: "
+    f"{results['per field'] / results['once per row']:.1f}x"
+)
+
+if not args.keep:
+    warehouse.drop_table(args.schema, TABLE)
+warehouse.close()
@@ -0,0 +1,129 @@
+"""
+compares the dbt compile time of a union of many tables generated with the
+dbt_utils.union_relations macro, which queries each relation's columns while
+compiling, against the explicit UNION ALL generated from metadata read in bulk
+needs a dbt project with dbt_utils installed, at DBT_PROJECT_DIR
+"""
+
+import os
+import json
+import time
+import argparse
+import subprocess
+from logging import basicConfig, getLogger, INFO
+from dotenv import load_dotenv
+
+from dbt_automation.operations.mergetables import union_tables_sql
+from dbt_automation.operations.syncsources import generate_source_definitions_yaml
+from dbt_automation.utils.dbtproject import dbtProject
+from dbt_automation.utils.warehouseclient import get_client
+
+basicConfig(level=INFO)
+logger = getLogger()
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--warehouse", required=True, choices=["postgres", "bigquery"])
+parser.add_argument("--schema", default="bench_union")
+parser.add_argument("--tables", type=int, default=80)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--dbt", default="dbt", help="the dbt executable")
+parser.add_argument("--keep", action="store_true", help="don't drop the tables after")
+args = parser.parse_args()
+
+load_dotenv("dbconnection.env")
+project_dir = os.getenv("DBT_PROJECT_DIR")
+
+if args.warehouse == "postgres":
+    conn_info = {
+        "host": os.getenv("DBHOST"),
+        "port": os.getenv("DBPORT"),
+        "username": os.getenv("DBUSER"),
+        "password": os.getenv("DBPASSWORD"),
+        "database": os.getenv("DBNAME"),
+    }
+else:
+    with open(
+        os.getenv("GOOGLE_APPLICATION_CREDENTIALS"), "r", encoding="utf-8"
+    ) as gcp_creds:
+        conn_info = json.loads(gcp_creds.read())
+warehouse = get_client(args.warehouse, conn_info)
+
+# the tables share most of their columns; every fifth one lacks "remarks"
+tablenames = [f"district_{i}" for i in range(args.tables)]
+logger.info("creating %d tables in %s", args.tables, args.schema)
+warehouse.ensure_schema(args.schema)
+for i, tablename in enumerate(tablenames):
+    columns = ["id", "district", "month", "measure1", "measure2"]
+    if i % 5:
+        columns.append("remarks")
+    warehouse.drop_table(args.schema, tablename)
+    warehouse.ensure_table(args.schema, tablename, columns)
+
+dbtproject = dbtProject(project_dir)
+generate_source_definitions_yaml(args.schema, args.schema, tablenames, dbtproject)
+
+inputs = [
+    {
+        "input": {
+            "input_type": "source",
+            "input_name": tablename,
+            "source_name": args.schema,
+        },
+        "source_columns": ["id", "district", "month", "measure1", "measure2"]
+        + (["remarks"] if i % 5 else []),
+    }
+    for i, tablename in enumerate(tablenames)
+]
+config = {
+    "dest_schema": args.schema,
+    "input": inputs[0]["input"],
+    "source_columns": inputs[0]["source_columns"],
+    "other_inputs": inputs[1:],
+}
+
+start = time.perf_counter()
+native_sql, output_columns = union_tables_sql(config, warehouse)
+generate_elapsed = time.perf_counter() - start
+
+relations = ", ".join(f"source('{args.schema}', '{tablename}')" for tablename in tablenames)
+include = ", ".join(f"'{col}'" for col in output_columns if col != "_dbt_source_relation")
+macro_sql = (
+    "{{ dbt_utils.union_relations(relations=[" + relations + "], include=[" + include + "]) }}\n"
+)
+
+models = {"bench_union_macro": macro_sql, "bench_union_native": native_sql}
+for modelname, model_sql in models.items():
+    dbtproject.write_model(args.schema, modelname, model_sql)
+
+
+def time_compile(modelname: str) -> float:
+    """the best wall time of dbt compile on the model"""
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.check_call(
+            [args.dbt, "compile", "--select", modelname, "--project-dir", project_dir],
+            stdout=subprocess.DEVNULL,
+        )
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+results = {modelname: time_compile(modelname) for modelname in models}
+print(f"generating the native union: {generate_elapsed:8.2f} s")
+for modelname, elapsed in results.items():
+    print(f"dbt compile {modelname:>20}: {elapsed:8.2f} s")
+print(
+    f"compile time reduction: "
+    f"{results['bench_union_macro'] / results['bench_union_native']:.1f}x"
+)
+
+for modelname in models:
+    dbtproject.delete_model(
+        dbtproject.strip_project_dir(dbtproject.models_dir(args.schema) / f"{modelname}.sql")
+    )
+if not args.keep:
+    for tablename in tablenames:
+        warehouse.drop_table(args.schema, tablename)
+warehouse.close()
@@ -36,14 +36,23 @@ conn_info = {
 client = get_client("postgres", conn_info)
 # client = get_client("bigquery", None)  # set json account creds in the env
 
+schema_columns = {}
+for table in mergespec["tables"]:
+    schema_columns.setdefault(table["schema"], []).append(table["tablename"])
+for schema, tablenames in schema_columns.items():
+    schema_columns[schema] = client.get_schema_columns(schema, tablenames)
+
 for table in mergespec["tables"]:
     logger.info("table=%s.%s", table["schema"], table["tablename"])
-    columns = client.get_columnspec(table["schema"], table["tablename"])
+    columns = [
+        column["name"]
+        for column in schema_columns[table["schema"]].get(table["tablename"], [])
+    ]
     quoted_column_names = [f'"{c}"' for c in columns]
     columnlist = ", ".join(quoted_column_names)
     statement = f"SELECT {columnlist} FROM {table['schema']}.{table['tablename']}"
     # logger.info(statement)
-    resultset = client.execute(statement)
+    resultset = client.execute_stream(statement)
     for row in tqdm(resultset, desc="Checking table ..."):
         check_statement = "SELECT COUNT(1) FROM "
         check_statement += (
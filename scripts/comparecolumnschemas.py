@@ -42,10 +42,18 @@ def get_column_lists(p_client, p_mergespec: dict, p_working_dir: str):
             column_lists = yaml.safe_load(column_lists_file)
             return column_lists
 
-    column_lists = defaultdict(set)
+    # one round trip per schema rather than one per table
+    tables_by_schema = defaultdict(list)
     for table_iter in p_mergespec["tables"]:
-        columns = p_client.get_columnspec(table_iter["schema"], table_iter["tablename"])
-        column_lists[table_iter["tablename"]] = columns
+        tables_by_schema[table_iter["schema"]].append(table_iter["tablename"])
+
+    column_lists = defaultdict(set)
+    for schema, tablenames in tables_by_schema.items():
+        schema_columns = p_client.get_schema_columns(schema, tablenames)
+        for tablename in tablenames:
+            column_lists[tablename] = [
+                column["name"] for column in schema_columns.get(tablename, [])
+            ]
 
     with open(column_lists_filename, "w", encoding="utf-8") as column_lists_file:
         yaml.dump(dict(column_lists), column_lists_file)
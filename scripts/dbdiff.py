@@ -86,10 +86,13 @@ if set(ref_tables) != set(comp_tables):
 
     ref_tables = set(ref_tables) & set(comp_tables)
 
+ref_schema_columns = ref_client.get_schema_columns(ref_schema, list(ref_tables))
+comp_schema_columns = comp_client.get_schema_columns(comp_schema, list(ref_tables))
+
 columns_specs = {}
 for tablename in ref_tables:
-    ref_columns = ref_client.get_columnspec(ref_schema, tablename)
-    comp_columns = comp_client.get_columnspec(comp_schema, tablename)
+    ref_columns = [c["name"] for c in ref_schema_columns.get(tablename, [])]
+    comp_columns = [c["name"] for c in comp_schema_columns.get(tablename, [])]
     if set(ref_columns) != set(comp_columns):
         print(f"columns for {tablename} are not the same")
         if len(ref_columns) > len(comp_columns):
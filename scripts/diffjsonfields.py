@@ -35,7 +35,7 @@ json_field = args.json_field
 
 for table in ref_tables:
     if table in comp_tables:
-        ref_data = ref_client.execute(
+        ref_data = ref_client.execute_stream(
             f"""
         SELECT {json_field}
         FROM {ref_schema}.{table}"""
@@ -57,6 +57,4 @@ for seed in seed_data:
         # comment on the next two lines in the inserts fail
         warehouse.drop_table(seed["schema"], table["name"])
         warehouse.ensure_table(seed["schema"], table["name"], reader.fieldnames)
-        for row in reader:
-            print(row)
-            warehouse.insert_row(seed["schema"], table["name"], row)
+        warehouse.insert_rows(seed["schema"], table["name"], reader)
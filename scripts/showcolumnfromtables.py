@@ -34,9 +34,5 @@ client = get_client(warehouse, conn_info)
 
 for tablename in args.tables:
     QUERY = f"SELECT DISTINCT {column} FROM {schema}.{tablename}"
-    resultset = client.execute(QUERY)
-    for result in resultset:
-        if warehouse == "bigquery":
-            print(result[column])
-        else:
-            print(result[0])
+    for result in client.execute_stream(QUERY):
+        print(result[0])
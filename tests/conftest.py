@@ -0,0 +1,14 @@
+from unittest.mock import Mock
+import pytest
+
+
+@pytest.fixture
+def mock_warehouse():
+    """makes clients which only have a name"""
+
+    def make(name: str = "postgres"):
+        warehouse = Mock()
+        warehouse.name = name
+        return warehouse
+
+    return make
@@ -0,0 +1,24 @@
+from unittest.mock import Mock
+from dbt_automation.operations.aggregate import aggregate_dbt_sql
+
+
+def test_aggregate_scans_input_once_for_all_metrics():
+    """the metrics come from one aggregate subquery joined back to the rows"""
+    warehouse = Mock()
+    warehouse.name = "postgres"
+    config = {
+        "input": {"input_type": "model", "input_name": "orders", "source_name": None},
+        "source_columns": ["id"],
+        "aggregate_on": [
+            {"operation": "count", "column": "NGO", "output_column_name": "count__ngo"},
+            {"operation": "countdistinct", "column": "Month", "output_column_name": "months"},
+            {"operation": "max", "column": "amount", "output_column_name": "max_amount"},
+        ],
+    }
+    sql, output_columns = aggregate_dbt_sql(config, warehouse)
+    assert output_columns == ["id", "count__ngo", "months", "max_amount"]
+    assert sql.count("FROM {{ref('orders')}}") == 2
+    assert "(SELECT" not in sql
+    assert 'COUNT(DISTINCT "Month") AS "months"' in sql
+    assert 'MAX("amount") AS "max_amount"' in sql
+    assert sql.startswith('SELECT\n_input."id",\n_agg."count__ngo",')
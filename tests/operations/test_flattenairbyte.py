@@ -0,0 +1,168 @@
+from unittest.mock import Mock
+import pytest
+import yaml
+from dbt_automation.operations.flattenairbyte import flatten_operation
+from dbt_automation.utils.dbtproject import dbtProject
+
+
+@pytest.fixture
+def project_dir(tmpdir):
+    """a dbt project with a source of three raw tables"""
+    project = dbtProject(tmpdir)
+    project.ensure_models_dir("raw")
+    with open(project.sources_filename("raw"), "w", encoding="utf-8") as sources:
+        yaml.safe_dump(
+            {
+                "version": 2,
+                "sources": [
+                    {
+                        "name": "src",
+                        "schema": "raw",
+                        "tables": [
+                            {"name": f"table{i}", "identifier": f"table{i}"}
+                            for i in range(3)
+                        ],
+                    }
+                ],
+            },
+            sources,
+        )
+    return tmpdir
+
+
+def mock_warehouse(failing_table: str = None):
+    """a postgres-like client whose worker clients share its behaviour"""
+
+    def get_json_columnspec(schema, table, column):
+        if table == failing_table:
+            raise ValueError("boom")
+        return [f"{table}_key"]
+
+    warehouse = Mock()
+    warehouse.name = "postgres"
+    warehouse.get_json_columnspec.side_effect = get_json_columnspec
+    warehouse.json_extract_op.side_effect = (
+        lambda json_column, json_field, sql_column: f'"{json_field}" as "{sql_column}"'
+    )
+    warehouse.json_flatten_sql.return_value = "SELECT 1\n"
+    warehouse.worker_client.return_value = warehouse
+    return warehouse
+
+
+def test_flatten_parallel_keeps_source_order(project_dir):
+    """models.yml follows the order of the sources.yml"""
+    warehouse = mock_warehouse()
+    flatten_operation(
+        {"source_schema": "raw", "dest_schema": "staging", "max_workers": 3},
+        warehouse,
+        project_dir,
+    )
+    with open(project_dir / "models" / "staging" / "models.yml", encoding="utf-8") as f:
+        models = yaml.safe_load(f)["models"]
+    assert [model["name"] for model in models] == ["table0", "table1", "table2"]
+    assert (project_dir / "models" / "staging" / "table2.sql").exists()
+
+
+def test_flatten_parallel_failures(project_dir):
+    """a failing table is reported once the others are done, and nothing is written"""
+    warehouse = mock_warehouse(failing_table="table1")
+    with pytest.raises(RuntimeError, match="table1"):
+        flatten_operation(
+            {"source_schema": "raw", "dest_schema": "staging", "max_workers": 2},
+            warehouse,
+            project_dir,
+        )
+    assert warehouse.get_json_columnspec.call_count == 3
+    assert not (project_dir / "models" / "staging" / "models.yml").exists()
+    assert not (project_dir / "models" / "staging" / "table0.sql").exists()
+    # the pool is sized for the workers
+    warehouse.worker_client.assert_called_with(maxconn=3)
+
+
+def test_flatten_sequential_fails_fast(project_dir):
+    """with one worker the first error is raised straight away"""
+    warehouse = mock_warehouse(failing_table="table1")
+    with pytest.raises(ValueError, match="boom"):
+        flatten_operation(
+            {"source_schema": "raw", "dest_schema": "staging"}, warehouse, project_dir
+        )
+    assert warehouse.get_json_columnspec.call_count == 2
+    assert not (project_dir / "models" / "staging" / "models.yml").exists()
+
+
+def test_flatten_nested_paths_and_exploded_arrays(project_dir):
+    """nested leaves become columns, and exploded arrays child models"""
+    warehouse = mock_warehouse()
+    warehouse.get_json_paths.return_value = [["address", "city"], ["id"], ["items"]]
+    warehouse.json_explode_sql.return_value = "SELECT 2\n"
+    flatten_operation(
+        {
+            "source_schema": "raw",
+            "dest_schema": "staging",
+            "nested": {"max_depth": 2, "explode": [["items"]]},
+            "parse_json_once": True,
+        },
+        warehouse,
+        project_dir,
+    )
+    warehouse.get_json_columnspec.assert_not_called()
+    assert warehouse.get_json_paths.call_args.kwargs["max_depth"] == 2
+    columntuples = list(warehouse.json_flatten_sql.call_args.args[1])
+    assert columntuples == [
+        (("address", "city"), "address_city"),
+        ("id", "id"),
+        ("items", "items"),
+    ]
+
+    with open(project_dir / "models" / "staging" / "models.yml", encoding="utf-8") as f:
+        models = yaml.safe_load(f)["models"]
+    assert [model["name"] for model in models] == [
+        "table0",
+        "table0_items",
+        "table1",
+        "table1_items",
+        "table2",
+        "table2_items",
+    ]
+    assert models[1]["columns"][0] == {
+        "name": "_airbyte_ab_id",
+        "description": "",
+        "tests": ["not_null"],
+    }
+    assert "SELECT 2" in (project_dir / "models" / "staging" / "table0_items.sql").read()
+
+
+def test_flatten_parses_per_field_by_default(project_dir):
+    """parse_json_once is opt-in on postgres too"""
+    warehouse = mock_warehouse()
+    flatten_operation({"source_schema": "raw", "dest_schema": "staging"}, warehouse, project_dir)
+    warehouse.json_flatten_sql.assert_not_called()
+    warehouse.json_extract_op.assert_called()
+
+
+def test_flatten_incremental(project_dir):
+    """incremental models keep _airbyte_emitted_at and filter on it"""
+    warehouse = mock_warehouse()
+    warehouse.json_flatten_sql.return_value = "SELECT x FROM y\n"
+    flatten_operation(
+        {
+            "source_schema": "raw",
+            "dest_schema": "staging",
+            "incremental": True,
+            "parse_json_once": True,
+        },
+        warehouse,
+        project_dir,
+    )
+    assert warehouse.json_flatten_sql.call_args.args[2] == [
+        "_airbyte_ab_id",
+        "_airbyte_emitted_at",
+    ]
+    model_sql = (project_dir / "models" / "staging" / "table0.sql").read()
+    assert "materialized='incremental'" in model_sql
+    assert "incremental_strategy='delete+insert'" in model_sql
+    assert "{% if is_incremental() %}" in model_sql
+
+    with open(project_dir / "models" / "staging" / "models.yml", encoding="utf-8") as f:
+        models = yaml.safe_load(f)["models"]
+    assert models[0]["columns"][1]["name"] == "_airbyte_emitted_at"
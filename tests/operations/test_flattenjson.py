@@ -0,0 +1,41 @@
+from unittest.mock import patch
+from dbt_automation.operations.flattenjson import flattenjson_dbt_sql
+from dbt_automation.utils.postgres import PostgresClient
+
+
+def test_flattenjson_parse_json_once():
+    """the json column is parsed once for all the copied fields"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        warehouse = PostgresClient({"host": "HOST", "port": 1234})
+    config = {
+        "input": {"input_type": "model", "input_name": "orders", "source_name": None},
+        "source_columns": ["id"],
+        "json_column": "data",
+        "json_columns_to_copy": ["a", "b"],
+        "parse_json_once": True,
+    }
+    sql, output_columns = flattenjson_dbt_sql(config, warehouse)
+    assert output_columns == ["id", "data_a", "data_b"]
+    assert sql.count("::jsonb") == 1
+    assert "FROM {{ref('orders')}} AS _src" in sql
+    assert '_rec."b" as "data_b"' in sql
+
+
+def test_flattenjson_nested_path():
+    """a list of keys copies a value out of nested objects"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        warehouse = PostgresClient({"host": "HOST", "port": 1234})
+    config = {
+        "input": {"input_type": "model", "input_name": "orders", "source_name": None},
+        "source_columns": ["id"],
+        "json_column": "data",
+        "json_columns_to_copy": ["a", ["b", "c"]],
+    }
+    sql, output_columns = flattenjson_dbt_sql(config, warehouse)
+    assert output_columns == ["id", "data_a", "data_b_c"]
+    assert "\"data\"::json #>> ARRAY['b', 'c'] as \"data_b_c\"" in sql
+
+    config["parse_json_once"] = True
+    sql, _ = flattenjson_dbt_sql(config, warehouse)
+    assert "_rec.\"b\"->>'c' as \"data_b_c\"" in sql
+    assert 'AS _rec("a" text, "b" jsonb)' in sql
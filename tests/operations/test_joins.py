@@ -0,0 +1,101 @@
+import pytest
+from dbt_automation.operations.joins import joins_sql
+
+
+def source_input(input_name: str) -> dict:
+    """a source table of the pytest schema"""
+    return {"input_type": "source", "input_name": input_name, "source_name": "pytest"}
+
+
+def two_way_config() -> dict:
+    """a join as configured before joins could take more inputs"""
+    return {
+        "input": source_input("orders"),
+        "source_columns": ["id", "amount"],
+        "other_inputs": [
+            {
+                "input": source_input("customers"),
+                "source_columns": ["id", "name"],
+                "seq": 2,
+            }
+        ],
+        "join_type": "left",
+        "join_on": {"key1": "customer_id", "key2": "id", "compare_with": "="},
+    }
+
+
+def test_two_way_join(mock_warehouse):
+    """two inputs generate the same join as before, with ordered output columns"""
+    sql, output_columns = joins_sql(two_way_config(), mock_warehouse("postgres"))
+    assert output_columns == ["id", "amount", "id_2", "name"]
+    assert '"t2"."id" AS "id_2"' in sql
+    assert "FROM {{source('pytest', 'orders')}} t1" in sql
+    assert "LEFT JOIN {{source('pytest', 'customers')}} t2" in sql
+    assert 'ON "t1"."customer_id" = "t2"."id"' in sql
+
+
+def test_three_way_join_composite_key(mock_warehouse):
+    """a third input joins in the same select, on two keys of the second"""
+    config = two_way_config()
+    config["other_inputs"].append(
+        {
+            "input": source_input("targets"),
+            "source_columns": ["target"],
+            "seq": 3,
+            "join_type": "inner",
+            "join_on": [
+                {"key1": "id", "key2": "customer_id", "key1_input": "customers"},
+                {"key1": "month", "key2": "month", "compare_with": "="},
+            ],
+        }
+    )
+    sql, output_columns = joins_sql(config, mock_warehouse("bigquery"))
+    assert output_columns == ["id", "amount", "id_2", "name", "target"]
+    assert sql.count("SELECT") == 1
+    assert "INNER JOIN {{source('pytest', 'targets')}} t3" in sql
+    assert "ON `t2`.`id` = `t3`.`customer_id`\n AND `t1`.`month` = `t3`.`month`" in sql
+
+
+def test_inner_joins_ordered_by_row_counts(mock_warehouse):
+    """the largest input is scanned first, the others are joined smallest first"""
+    config = two_way_config()
+    config["join_type"] = "inner"
+    config["other_inputs"].append(
+        {
+            "input": source_input("regions"),
+            "source_columns": ["region"],
+            "seq": 3,
+            "join_on": {"key1": "region_id", "key2": "id"},
+        }
+    )
+    config["row_counts"] = {"orders": 10, "customers": 1000000, "regions": 50}
+    sql, output_columns = joins_sql(config, mock_warehouse("postgres"))
+    # the select list keeps the seq order
+    assert output_columns == ["id", "amount", "id_2", "name", "region"]
+    assert sql.index("FROM {{source('pytest', 'customers')}} t2") < sql.index(
+        "INNER JOIN {{source('pytest', 'orders')}} t1"
+    )
+    assert sql.index("JOIN {{source('pytest', 'orders')}} t1") < sql.index(
+        "JOIN {{source('pytest', 'regions')}} t3"
+    )
+
+
+def test_outer_joins_keep_seq_order(mock_warehouse):
+    """row counts don't reorder joins which aren't all inner"""
+    config = two_way_config()
+    config["row_counts"] = {"orders": 10, "customers": 1000000}
+    sql, _ = joins_sql(config, mock_warehouse("postgres"))
+    assert "FROM {{source('pytest', 'orders')}} t1" in sql
+
+
+def test_join_bad_config(mock_warehouse):
+    """unknown join types and keys of later inputs are rejected"""
+    config = two_way_config()
+    config["join_type"] = "cross"
+    with pytest.raises(ValueError):
+        joins_sql(config, mock_warehouse("postgres"))
+
+    config = two_way_config()
+    config["join_on"]["key1_input"] = "customers"
+    with pytest.raises(ValueError):
+        joins_sql(config, mock_warehouse("postgres"))
@@ -0,0 +1,116 @@
+from unittest.mock import Mock
+from dbt_automation.operations.mergeoperations import merge_operations_sql
+from dbt_automation.operations.mergetables import union_tables_sql
+from dbt_automation.utils.dbtproject import dbtProject
+
+
+def mock_warehouse(schema_columns: dict = None):
+    """a postgres client which knows the columns of one schema"""
+    warehouse = Mock()
+    warehouse.name = "postgres"
+    warehouse.get_schema_columns.return_value = schema_columns or {}
+    return warehouse
+
+
+def sheets_project(project_dir) -> str:
+    """a project whose sheet1 and sheet2 models are in the staging schema"""
+    for model in ["sheet1", "sheet2"]:
+        dbtProject(project_dir).write_model(
+            "staging", model, "{{ config(materialized='table', schema='staging') }}"
+        )
+    return project_dir
+
+
+def union_config(**kwargs) -> dict:
+    """a union of the sheet1 and sheet2 models"""
+    config = {
+        "dest_schema": "intermediate",
+        "input": {"input_type": "model", "input_name": "sheet1", "source_name": None},
+        "source_columns": ["ngo", "measure1"],
+        "other_inputs": [
+            {
+                "input": {"input_type": "model", "input_name": "sheet2", "source_name": None},
+                "source_columns": ["ngo", "measure2"],
+            }
+        ],
+    }
+    config.update(kwargs)
+    return config
+
+
+def test_union_pads_and_aligns_columns(tmpdir):  # pytest tmpdir fixture
+    """missing columns are typed NULLs, mismatched ones are cast to the first type"""
+    warehouse = mock_warehouse(
+        {
+            "sheet1": [
+                {"name": "ngo", "data_type": "text"},
+                {"name": "measure1", "data_type": "integer"},
+            ],
+            "sheet2": [
+                {"name": "ngo", "data_type": "character varying"},
+                {"name": "measure2", "data_type": "numeric"},
+            ],
+        }
+    )
+    sql, output_columns = union_tables_sql(
+        union_config(project_dir=sheets_project(tmpdir)), warehouse
+    )
+    assert output_columns == ["_dbt_source_relation", "ngo", "measure1", "measure2"]
+    warehouse.get_schema_columns.assert_called_once_with("staging")
+    first, second = sql.split("UNION ALL\n")
+    assert "CAST('{{ ref('sheet1') }}' AS varchar) AS \"_dbt_source_relation\"" in first
+    assert 'CAST(NULL AS numeric) AS "measure2"' in first
+    assert 'CAST("ngo" AS text) AS "ngo"' in second
+    assert 'CAST(NULL AS integer) AS "measure1"' in second
+    assert "dbt_utils" not in sql
+
+
+def test_union_without_metadata():
+    """align_types False reads no metadata and pads with plain NULLs"""
+    warehouse = mock_warehouse()
+    sql, _ = union_tables_sql(union_config(align_types=False), warehouse)
+    warehouse.get_schema_columns.assert_not_called()
+    assert 'NULL AS "measure1"' in sql
+
+
+def test_union_missing_metadata(tmpdir, caplog):  # pytest fixtures
+    """inputs which can't be looked up, or aren't in the warehouse, are left untyped"""
+    warehouse = mock_warehouse()
+    sql, _ = union_tables_sql(union_config(), warehouse)
+    assert "no project_dir to look sheet1 up in" in caplog.text
+    warehouse.get_schema_columns.assert_not_called()
+    assert 'NULL AS "measure2"' in sql
+
+    sql, _ = union_tables_sql(union_config(project_dir=tmpdir), mock_warehouse())
+    assert "found 0 models named sheet1" in caplog.text
+    assert 'NULL AS "measure2"' in sql
+
+    warehouse = mock_warehouse({"sheet1": [{"name": "ngo", "data_type": "text"}]})
+    sql, _ = union_tables_sql(union_config(project_dir=sheets_project(tmpdir)), warehouse)
+    assert "no columns found for staging.sheet2" in caplog.text
+    assert 'NULL AS "measure2"' in sql.split("UNION ALL\n")[0]
+
+
+def test_union_in_merge_chain(tmpdir):  # pytest tmpdir fixture
+    """the union can follow another step"""
+    config = {
+        "dest_schema": "intermediate",
+        "project_dir": sheets_project(tmpdir),
+        "input": {"input_type": "model", "input_name": "sheet1", "source_name": None},
+        "operations": [
+            {
+                "type": "dropcolumns",
+                "config": {"source_columns": ["ngo", "measure1", "x"], "columns": ["x"]},
+            },
+            {
+                "type": "unionall",
+                "config": {
+                    "source_columns": ["ngo", "measure1"],
+                    "other_inputs": union_config()["other_inputs"],
+                },
+            },
+        ],
+    }
+    sql, output_columns = merge_operations_sql(config, mock_warehouse())
+    assert "FROM cte1\nUNION ALL" in sql
+    assert output_columns[-1] == "measure2"
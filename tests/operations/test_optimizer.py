@@ -0,0 +1,459 @@
+from dbt_automation.operations.mergeoperations import merge_operations_sql
+
+
+def chain_config(operations: list) -> dict:
+    """an optimized mergeoperations config reading the raw sales table"""
+    return {
+        "input": {"input_type": "source", "source_name": "raw", "input_name": "sales"},
+        "operations": operations,
+        "optimize": True,
+    }
+
+
+RENAME = {
+    "type": "renamecolumns",
+    "config": {"source_columns": ["id", "amt", "region"], "columns": {"amt": "amount"}},
+}
+CAST = {
+    "type": "castdatatypes",
+    "config": {
+        "source_columns": ["id", "region", "amount"],
+        "columns": [{"columnname": "amount", "columntype": "numeric"}],
+    },
+}
+REPLACE = {
+    "type": "replace",
+    "config": {
+        "source_columns": ["id", "region", "amount"],
+        "columns": [
+            {
+                "col_name": "region",
+                "output_column_name": "region_clean",
+                "replace_ops": [{"find": "-", "replace": " "}],
+            }
+        ],
+    },
+}
+CONCAT = {
+    "type": "concat",
+    "config": {
+        "source_columns": ["id", "amount", "region_clean"],
+        "columns": [
+            {"name": "region_clean", "is_col": True},
+            {"name": "/", "is_col": False},
+            {"name": "id", "is_col": True},
+        ],
+        "output_column_name": "label",
+    },
+}
+ADD = {
+    "type": "arithmetic",
+    "config": {
+        "source_columns": ["id", "label", "amount"],
+        "operator": "add",
+        "operands": [{"is_col": True, "value": "amount"}, {"is_col": False, "value": "1"}],
+        "output_column_name": "amount_plus",
+    },
+}
+DROP = {
+    "type": "dropcolumns",
+    "config": {
+        "source_columns": ["id", "label", "amount", "amount_plus"],
+        "columns": ["amount"],
+    },
+}
+WHERE = {
+    "type": "where",
+    "config": {
+        "source_columns": ["id", "region", "amount"],
+        "clauses": [
+            {"column": "amount", "operator": ">", "operand": {"is_col": False, "value": "0"}}
+        ],
+    },
+}
+
+
+def copies(*operations) -> list:
+    """fresh copies, since merge_operations_sql sets the inputs of the operations"""
+    return [{"type": op["type"], "config": dict(op["config"])} for op in operations]
+
+
+def test_fuse_projection_chain_postgres(mock_warehouse):
+    """six row-wise operations become one select with composed expressions"""
+    sql, output_columns = merge_operations_sql(
+        chain_config(copies(RENAME, CAST, REPLACE, CONCAT, ADD, DROP)),
+        mock_warehouse("postgres"),
+    )
+    assert output_columns == ["id", "label", "amount_plus"]
+    assert sql == (
+        "-- cte1 (renamecolumns): 1 unused source_columns pruned\n"
+        "-- cte3 (replace): 1 unused source_columns pruned\n"
+        "-- cte4 (concat): 1 unused source_columns pruned\n"
+        "-- cte5 (arithmetic): 1 unused source_columns pruned\n"
+        "WITH cte6 as (\n"
+        "-- cte1, cte2, cte3, cte4, cte5, cte6 fused: renamecolumns, castdatatypes,"
+        " replace, concat, arithmetic, dropcolumns\n"
+        "SELECT\n"
+        '"id",\n'
+        "CONCAT(REPLACE(\"region\", '-', ' '),'/',\"id\") AS \"label\",\n"
+        # the macro expands to a sum, so it stays parenthesized
+        "({{dbt_utils.safe_add(['CAST(\"amt\" AS numeric)','1'])}}) AS \"amount_plus\"\n"
+        "FROM {{source('raw', 'sales')}}\n"
+        ")\n"
+        "-- Final SELECT statement combining the outputs of all CTEs\n"
+        "SELECT *\n"
+        "FROM cte6"
+    )
+
+
+def test_fuse_projection_chain_bigquery(mock_warehouse):
+    """the composed expressions quote columns for bigquery"""
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, CAST)), mock_warehouse("bigquery")
+    )
+    assert sql == (
+        "-- cte1 (renamecolumns): 1 unused source_columns pruned\n"
+        "WITH cte2 as (\n"
+        "-- cte1, cte2 fused: renamecolumns, castdatatypes\n"
+        "SELECT\n"
+        "`id`,\n"
+        "`region`,\n"
+        "CAST(`amt` AS numeric) AS `amount`\n"
+        "FROM {{source('raw', 'sales')}}\n"
+        ")\n"
+        "-- Final SELECT statement combining the outputs of all CTEs\n"
+        "SELECT *\n"
+        "FROM cte2"
+    )
+
+
+def test_optimize_disabled(mock_warehouse):
+    """without optimize there is one cte per operation"""
+    config = chain_config(copies(RENAME, CAST, REPLACE))
+    del config["optimize"]
+    sql, output_columns = merge_operations_sql(config, mock_warehouse("postgres"))
+    assert output_columns == ["id", "region", "amount", "region_clean"]
+    assert sql == (
+        "WITH cte1 as (\n"
+        "SELECT\n"
+        '"id",\n'
+        '"region",\n'
+        '"amt" AS "amount"\n'
+        "FROM {{source('raw', 'sales')}}\n"
+        ") , cte2 as (\n"
+        "SELECT\n"
+        '"id",\n'
+        '"region",\n'
+        'CAST("amount" AS numeric) AS "amount"\n'
+        "FROM cte1\n"
+        ") , cte3 as (\n"
+        "SELECT\n"
+        '"id",\n'
+        '"region",\n'
+        '"amount",\n'
+        "REPLACE(\"region\", '-', ' ') AS \"region_clean\"\n"
+        "FROM cte2\n"
+        ")\n"
+        "-- Final SELECT statement combining the outputs of all CTEs\n"
+        "SELECT *\n"
+        "FROM cte3"
+    )
+
+
+def test_fusion_stops_at_other_operations(mock_warehouse):
+    """a filter ends a run; the projection after it is generated on its own"""
+    sql, output_columns = merge_operations_sql(
+        chain_config(copies(RENAME, CAST, WHERE, REPLACE)), mock_warehouse("postgres")
+    )
+    assert output_columns == ["id", "region", "amount", "region_clean"]
+    assert "WITH cte2 as (\n-- cte1, cte2 fused: renamecolumns, castdatatypes\n" in sql
+    assert " , cte3 as (\nSELECT\n" in sql
+    assert "FROM cte2\nWHERE (" in sql
+    assert " , cte4 as (\nSELECT\n" in sql
+    assert sql.endswith("FROM cte3\n)\n-- Final SELECT statement combining the outputs of all CTEs\nSELECT *\nFROM cte4")
+
+
+def test_fusion_needs_upstream_columns(mock_warehouse):
+    """an operation reading a column its predecessor dropped is not fused"""
+    sql, _ = merge_operations_sql(
+        chain_config(copies(DROP, CAST)), mock_warehouse("postgres")
+    )
+    assert "fused" not in sql
+    assert "FROM cte1\n" in sql
+
+
+def test_fusion_reads_computed_columns_once(mock_warehouse):
+    """a computed column read twice ends the run rather than being pasted twice"""
+    concat_twice = {
+        "type": "concat",
+        "config": {
+            "source_columns": ["id"],
+            "columns": [
+                {"name": "region_clean", "is_col": True},
+                {"name": "/", "is_col": False},
+                {"name": "region_clean", "is_col": True},
+            ],
+            "output_column_name": "label",
+        },
+    }
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, REPLACE, concat_twice)), mock_warehouse("postgres")
+    )
+    assert "-- cte1, cte2 fused: renamecolumns, replace\n" in sql
+    assert sql.count("REPLACE(") == 1
+    assert "FROM cte2\n" in sql
+
+
+def test_fusion_keeps_macro_operands_plain(mock_warehouse):
+    """dbt_utils macros can't take an upstream expression with quotes as operand"""
+    add_cleaned = {
+        "type": "arithmetic",
+        "config": {
+            "source_columns": ["id"],
+            "operator": "sub",
+            "operands": [
+                {"is_col": True, "value": "region_clean"},
+                {"is_col": True, "value": "amount"},
+            ],
+            "output_column_name": "diff",
+        },
+    }
+    sql, _ = merge_operations_sql(
+        chain_config(copies(REPLACE, add_cleaned)), mock_warehouse("postgres")
+    )
+    assert "fused" not in sql
+    assert "{{dbt_utils.safe_subtract(['\"region_clean\"','\"amount\"'])}}" in sql
+
+
+def test_fusion_skips_advance_casewhen(mock_warehouse):
+    """a casewhen with a raw sql snippet reads the input as is and isn't fused"""
+    casewhen = {
+        "type": "casewhen",
+        "config": {
+            "source_columns": ["id", "region", "amount"],
+            "when_clauses": [{"column": "amount"}],
+            "case_type": "advance",
+            "sql_snippet": "CASE WHEN amount > 0 THEN 'y' END AS positive",
+            "output_column_name": "positive",
+        },
+    }
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, CAST, casewhen)), mock_warehouse("postgres")
+    )
+    assert "-- cte1, cte2 fused: renamecolumns, castdatatypes\n" in sql
+    assert "CASE WHEN amount > 0 THEN 'y' END AS positive\nFROM cte2\n" in sql
+
+
+REGEX = {
+    "type": "regexextraction",
+    "config": {"source_columns": ["id", "amount", "region"], "columns": {"region": "^[a-z]+"}},
+}
+
+
+def where_on(column: str, source_columns: list, **config) -> dict:
+    """a where operation keeping the rows whose column is positive"""
+    return {
+        "type": "where",
+        "config": {
+            "source_columns": source_columns,
+            "clauses": [
+                {"column": column, "operator": ">", "operand": {"is_col": False, "value": "0"}}
+            ],
+            **config,
+        },
+    }
+
+
+def test_push_down_where(mock_warehouse):
+    """the filter runs on the input, ahead of the projections it doesn't depend on"""
+    sql, output_columns = merge_operations_sql(
+        chain_config(copies(RENAME, REGEX, where_on("id", ["id", "region"]))),
+        mock_warehouse("postgres"),
+    )
+    assert output_columns == ["id", "region"]
+    assert sql == (
+        "-- where on id (step 3) moved ahead of renamecolumns (step 1),"
+        " regexextraction (step 2)\n"
+        "-- cte1 (where): source_columns * narrowed to 3\n"
+        "-- cte2 (renamecolumns): 1 unused source_columns pruned\n"
+        "-- cte3 (regexextraction): 1 unused source_columns pruned\n"
+        "WITH cte1 as (\n"
+        "SELECT\n"
+        '"id",\n'
+        '"region",\n'
+        '"amt"\n'
+        "FROM {{source('raw', 'sales')}}\n"
+        "WHERE (\"id\" > '0' )) , cte4 as (\n"
+        "-- cte2, cte3, cte4 fused: renamecolumns, regexextraction, dropcolumns\n"
+        "SELECT\n"
+        '"id",\n'
+        "substring(\"region\" FROM '^[a-z]+') AS \"region\"\n"
+        "FROM cte1\n"
+        ")\n"
+        "-- Final SELECT statement combining the outputs of all CTEs\n"
+        "SELECT *\n"
+        "FROM cte4"
+    )
+
+
+def test_push_down_stops_at_computed_column(mock_warehouse):
+    """a filter on a column an operation computes stays after that operation"""
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, REGEX, where_on("region", ["id", "region"]))),
+        mock_warehouse("postgres"),
+    )
+    assert "moved" not in sql
+    assert "FROM cte2\nWHERE (\"region\" > '0' )" in sql
+
+
+def test_push_down_past_some_operations(mock_warehouse):
+    """a filter on a renamed column moves ahead of the operations after the rename"""
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, CAST, REPLACE, where_on("id", ["id", "amount"]))),
+        mock_warehouse("bigquery"),
+    )
+    assert sql.startswith(
+        "-- where on id (step 4) moved ahead of renamecolumns (step 1),"
+        " castdatatypes (step 2), replace (step 3)\n"
+    )
+
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, CAST, where_on("amount", ["id", "amount"]))),
+        mock_warehouse("bigquery"),
+    )
+    assert "moved" not in sql
+
+
+def test_push_down_skips_plain_projections(mock_warehouse):
+    """moving ahead of steps which only select or rename columns gains nothing"""
+    sql, _ = merge_operations_sql(
+        chain_config(copies(DROP, where_on("id", ["id", "label"]))),
+        mock_warehouse("postgres"),
+    )
+    assert "moved" not in sql
+    assert "dropcolumns, dropcolumns" not in sql
+    assert "FROM cte1\nWHERE (\"id\" > '0' )" in sql
+
+
+def test_push_down_keeps_sql_snippets(mock_warehouse):
+    """a raw sql filter may read any column, so it is left in place"""
+    where_sql = {
+        "type": "where",
+        "config": {
+            "source_columns": ["id", "region"],
+            "where_type": "sql",
+            "sql_snippet": "id > 0",
+        },
+    }
+    sql, _ = merge_operations_sql(
+        chain_config(copies(RENAME, REGEX, where_sql)), mock_warehouse("postgres")
+    )
+    assert "moved" not in sql
+    assert "FROM cte2\nWHERE (id > 0)" in sql
+
+
+def test_push_down_disabled(mock_warehouse):
+    """without optimize the where stays where it is"""
+    config = chain_config(copies(RENAME, REGEX, where_on("id", ["id", "region"])))
+    del config["optimize"]
+    sql, _ = merge_operations_sql(config, mock_warehouse("postgres"))
+    assert "moved" not in sql
+    assert "FROM cte2\nWHERE (\"id\" > '0' )" in sql
+
+
+def with_json_extraction(warehouse):
+    """the client, generating json extraction sql"""
+    warehouse.json_extract_op = lambda column, field, sql_column: (
+        f"{column}->>'{field}' AS {sql_column}"
+    )
+    return warehouse
+
+
+def test_prune_star_columns(mock_warehouse):
+    """a flattenjson over * selects only the columns later steps read"""
+    operations = [
+        {
+            "type": "flattenjson",
+            "config": {
+                "source_columns": "*",
+                "json_column": "data",
+                "json_columns_to_copy": ["a", "b"],
+            },
+        },
+        {
+            "type": "castdatatypes",
+            "config": {
+                "source_columns": ["id", "data_a", "data_b"],
+                "columns": [{"columnname": "data_a", "columntype": "int"}],
+            },
+        },
+        {
+            "type": "dropcolumns",
+            "config": {"source_columns": ["id", "data_a", "data_b"], "columns": ["data_b"]},
+        },
+    ]
+    sql, output_columns = merge_operations_sql(
+        chain_config(operations), with_json_extraction(mock_warehouse("postgres"))
+    )
+    assert output_columns == ["id", "data_a"]
+    assert sql.startswith(
+        "-- cte1 (flattenjson): source_columns * narrowed to 1\n"
+        "-- cte2 (castdatatypes): 1 unused source_columns pruned\n"
+        'WITH cte1 as (\nSELECT "id"\n'
+    )
+    # the caller's config is left as it was
+    assert operations[0]["config"]["source_columns"] == "*"
+
+
+def test_prune_wide_source(mock_warehouse):
+    """columns no step reads are not carried through the chain from the source"""
+    wide_columns = [f"col_{i}" for i in range(400)]
+    operations = [
+        {
+            "type": "castdatatypes",
+            "config": {
+                "source_columns": wide_columns,
+                "columns": [{"columnname": "col_1", "columntype": "int"}],
+            },
+        },
+        where_on("col_1", wide_columns),
+        {
+            "type": "concat",
+            "config": {
+                "source_columns": ["col_0"],
+                "columns": [{"name": "col_1", "is_col": True}, {"name": "col_2", "is_col": True}],
+                "output_column_name": "joined",
+            },
+        },
+    ]
+    sql, output_columns = merge_operations_sql(
+        chain_config(operations), mock_warehouse("bigquery")
+    )
+    assert output_columns == ["col_0", "joined"]
+    # the cast reads three columns of the source, and the where passes them on
+    assert "`col_3`" not in sql
+    assert "SELECT\n`col_0`,\n`col_2`,\nCAST(`col_1` AS int) AS `col_1`\nFROM {{source('raw', 'sales')}}" in sql
+
+
+def test_prune_stops_at_unknown_reads(mock_warehouse):
+    """above a raw sql filter, whose snippet may read any column, nothing is pruned"""
+    operations = copies(
+        RENAME,
+        {
+            "type": "where",
+            "config": {"source_columns": ["id"], "where_type": "sql", "sql_snippet": "amount > 0"},
+        },
+    )
+    sql, output_columns = merge_operations_sql(chain_config(operations), mock_warehouse("postgres"))
+    assert output_columns == ["id"]
+    assert "pruned" not in sql
+    assert 'SELECT\n"id",\n"region",\n"amt" AS "amount"\n' in sql
+
+
+def test_prune_disabled(mock_warehouse):
+    """without optimize every step keeps its source_columns"""
+    config = chain_config(copies(RENAME, CAST))
+    del config["optimize"]
+    sql, _ = merge_operations_sql(config, mock_warehouse("postgres"))
+    assert "pruned" not in sql
+    assert 'SELECT\n"id",\n"region",\n"amt" AS "amount"\n' in sql
@@ -0,0 +1,111 @@
+import pytest
+from dbt_automation.operations.pivot import pivot, pivot_dbt_sql
+from dbt_automation.utils.dbtproject import dbtProject
+
+
+def finding(warehouse, values: list):
+    """the client, finding these distinct values"""
+    warehouse.get_distinct_values.return_value = values
+    return warehouse
+
+
+def pivot_config(**kwargs) -> dict:
+    """a pivot of the month column of the sheet model"""
+    config = {
+        "input": {"input_type": "model", "input_name": "sheet", "source_name": None},
+        "dest_schema": "intermediate",
+        "source_columns": ["ngo"],
+        "pivot_column_name": "month",
+    }
+    config.update(kwargs)
+    return config
+
+
+def test_pivot_postgres_filter_aggregates(mock_warehouse):
+    """each value is counted with a FILTER clause"""
+    sql, output_columns = pivot_dbt_sql(
+        pivot_config(pivot_column_values=["jan", "o'clock"]), mock_warehouse("postgres")
+    )
+    assert output_columns == ["ngo", "jan", "o'clock"]
+    assert 'COUNT(*) FILTER (WHERE "month" = \'jan\') AS "jan"' in sql
+    assert "'o''clock'" in sql
+    assert sql.endswith('GROUP BY "ngo"')
+
+
+def test_pivot_bigquery_native(mock_warehouse):
+    """bigquery uses PIVOT"""
+    sql, _ = pivot_dbt_sql(
+        pivot_config(pivot_column_values=["jan", "feb"]), mock_warehouse("bigquery")
+    )
+    assert "SELECT `ngo`, `month`, 1 AS _pivot_count\nFROM {{ref('sheet')}}" in sql
+    assert "PIVOT (COUNT(_pivot_count) FOR `month` IN ('jan' AS `jan`, 'feb' AS `feb`))" in sql
+
+
+def test_pivot_discovers_values(tmpdir, mock_warehouse):  # pytest tmpdir fixture
+    """values are looked up in the input's table, bounded by max_pivot_columns"""
+    dbtProject(tmpdir).write_model(
+        "staging", "sheet", "{{ config(materialized='table', schema='staging') }}"
+    )
+    warehouse = finding(mock_warehouse("postgres"), ["feb", "jan"])
+    _, output_columns = pivot_dbt_sql(
+        pivot_config(discover_values=True, project_dir=tmpdir), warehouse
+    )
+    assert output_columns == ["ngo", "feb", "jan"]
+    warehouse.get_distinct_values.assert_called_once_with(
+        "staging", "sheet", "month", limit=101
+    )
+
+    warehouse = finding(mock_warehouse("postgres"), ["a", "b", "c"])
+    with pytest.raises(ValueError, match="more than 2 values"):
+        pivot_dbt_sql(
+            pivot_config(discover_values=True, max_pivot_columns=2, project_dir=tmpdir),
+            warehouse,
+        )
+
+    warehouse = finding(mock_warehouse("postgres"), ["a", "b"])
+    pivot_dbt_sql(
+        pivot_config(
+            discover_values={"top_k": 5}, max_pivot_columns=2, project_dir=tmpdir
+        ),
+        warehouse,
+    )
+    warehouse.get_distinct_values.assert_called_once_with(
+        "staging", "sheet", "month", limit=2, top_k=True
+    )
+
+
+def test_pivot_reads_model_written_in_batch(tmpdir, mock_warehouse):  # pytest tmpdir fixture
+    """a pivot finds the input model an earlier operation of the batch wrote"""
+    warehouse = finding(mock_warehouse("postgres"), ["jan"])
+    with dbtProject(tmpdir).batch():
+        dbtProject(tmpdir).write_model(
+            "staging", "sheet", "{{ config(materialized='table', schema='staging') }}"
+        )
+        pivot(pivot_config(discover_values=True, output_name="pivoted"), warehouse, tmpdir)
+    warehouse.get_distinct_values.assert_called_once_with(
+        "staging", "sheet", "month", limit=101
+    )
+    assert (tmpdir / "models" / "intermediate" / "pivoted.sql").exists()
+
+
+def test_pivot_discovers_values_in_given_table(mock_warehouse):
+    """an explicit schema and table need no project to look the input up in"""
+    warehouse = finding(mock_warehouse("postgres"), ["jan"])
+    pivot_dbt_sql(
+        pivot_config(discover_values={"schema": "raw", "table": "sheet_v2"}), warehouse
+    )
+    warehouse.get_distinct_values.assert_called_once_with(
+        "raw", "sheet_v2", "month", limit=101
+    )
+
+    with pytest.raises(ValueError, match="needs a schema and table"):
+        pivot_dbt_sql(pivot_config(discover_values=True), warehouse)
+
+
+def test_pivot_width_guard(mock_warehouse):
+    """too many given values are rejected too"""
+    with pytest.raises(ValueError, match="max_pivot_columns"):
+        pivot_dbt_sql(
+            pivot_config(pivot_column_values=["a", "b", "c"], max_pivot_columns=2),
+            mock_warehouse("postgres"),
+        )
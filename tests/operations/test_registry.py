@@ -0,0 +1,56 @@
+import subprocess
+import sys
+from unittest.mock import Mock
+import pytest
+from dbt_automation.operations.mergeoperations import merge_operations_sql
+from dbt_automation.operations.registry import (
+    OPERATIONS,
+    get_columns,
+    get_operation,
+    get_projection,
+    get_sql_generator,
+    get_writer,
+)
+
+
+def test_every_operation_resolves():
+    """every registered module exports the functions the registry names"""
+    for op_type, spec in OPERATIONS.items():
+        assert callable(get_writer(op_type))
+        if spec["cte_safe"]:
+            assert callable(get_sql_generator(op_type))
+        if spec["projection"]:
+            assert spec["row_wise"]
+            assert callable(get_projection(op_type))
+        if spec["columns"]:
+            assert callable(get_columns(op_type))
+
+
+def test_unknown_operation():
+    """unknown types are rejected with a ValueError"""
+    with pytest.raises(ValueError, match="unknown operation type"):
+        get_operation("nosuchop")
+
+
+def test_registry_imports_lazily():
+    """importing the registry does not import the operation modules"""
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import dbt_automation.operations.registry; "
+            "print('dbt_automation.operations.pivot' in sys.modules)",
+        ],
+        text=True,
+    )
+    assert output.strip() == "False"
+
+
+def test_merge_rejects_operations_without_sql():
+    """operations which only write models can't be steps of a merge"""
+    config = {
+        "input": {"input_type": "model", "input_name": "m", "source_name": None},
+        "operations": [{"type": "flatten", "config": {}}],
+    }
+    with pytest.raises(ValueError, match="cannot be merged"):
+        merge_operations_sql(config, Mock())
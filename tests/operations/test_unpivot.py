@@ -0,0 +1,45 @@
+from dbt_automation.operations.mergeoperations import merge_operations_sql
+from dbt_automation.operations.unpivot import unpivot_dbt_sql
+
+
+CONFIG = {
+    "input": {"input_type": "model", "input_name": "sheet", "source_name": None},
+    "exclude_columns": ["id"],
+    "unpivot_columns": ["jan", "feb"],
+    "unpivot_field_name": "month",
+    "unpivot_value_name": "amount",
+}
+
+
+def test_unpivot_postgres(mock_warehouse):
+    """one scan of the input, paired with a VALUES row per column"""
+    sql, output_columns = unpivot_dbt_sql(dict(CONFIG), mock_warehouse("postgres"))
+    assert output_columns == ["id", "month", "amount"]
+    assert sql.count("FROM") == 1
+    assert "CROSS JOIN LATERAL (VALUES" in sql
+    assert "('feb', CAST(_input.\"feb\" AS varchar))" in sql
+    assert ') AS _unpivot("month", "amount")' in sql
+
+
+def test_unpivot_bigquery(mock_warehouse):
+    """an array of structs, with varchar mapped to STRING"""
+    sql, _ = unpivot_dbt_sql(dict(CONFIG), mock_warehouse("bigquery"))
+    assert "CROSS JOIN UNNEST([" in sql
+    assert "STRUCT('jan' AS `month`, CAST(_input.`jan` AS STRING) AS `amount`)" in sql
+
+
+def test_unpivot_after_another_step(mock_warehouse):
+    """unpivot can follow other operations in a merge"""
+    config = {
+        "input": CONFIG["input"],
+        "operations": [
+            {
+                "type": "dropcolumns",
+                "config": {"source_columns": ["id", "jan", "feb", "mar"], "columns": ["mar"]},
+            },
+            {"type": "unpivot", "config": {key: CONFIG[key] for key in CONFIG if key != "input"}},
+        ],
+    }
+    sql, output_columns = merge_operations_sql(config, mock_warehouse("postgres"))
+    assert output_columns == ["id", "month", "amount"]
+    assert "FROM cte1 AS _input" in sql
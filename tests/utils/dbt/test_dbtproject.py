@@ -1,5 +1,8 @@
-from dbt_automation.utils.dbtproject import dbtProject
+from dbt_automation.utils.dbtproject import FILE_MODE, dbtProject
 import os
+import stat
+import pytest
+import threading
 import yaml
 
 
@@ -94,3 +97,195 @@ def test_write_model_config(tmpdir):  # pytest tmpdir fixture
     assert len(models_yaml["models"]) == 1
     assert models_yaml["models"][0] == models_input[0]
     assert str(yaml_filename) == f"models/{schema}/models.yml"
+
+
+def test_batch_buffers_writes(tmpdir):  # pytest tmpdir fixture
+    """models written in a batch appear when the batch ends"""
+    project = dbtProject(tmpdir)
+    with project.batch() as model_batch:
+        dbtProject(tmpdir).write_model("test_schema", "model1", "select 1")
+        project.write_model_config("test_schema", [{"name": "model1"}])
+        assert os.path.exists(tmpdir / "models" / "test_schema") is True
+        assert os.path.exists(tmpdir / "models" / "test_schema" / "model1.sql") is False
+
+    assert os.path.exists(tmpdir / "models" / "test_schema" / "model1.sql") is True
+    assert sorted(str(path) for path in model_batch.manifest["written"]) == [
+        "models/test_schema/model1.sql",
+        "models/test_schema/models.yml",
+    ]
+    assert model_batch.manifest["unchanged"] == []
+
+
+def test_batch_skips_unchanged_files(tmpdir):  # pytest tmpdir fixture
+    """files with the same content are not rewritten"""
+    project = dbtProject(tmpdir)
+    project.write_model("test_schema", "model1", "select 1")
+    project.write_model("test_schema", "model2", "select 2")
+    with project.batch() as model_batch:
+        project.write_model("test_schema", "model1", "select 1")
+        project.write_model("test_schema", "model2", "select 22")
+
+    assert [str(path) for path in model_batch.manifest["written"]] == [
+        "models/test_schema/model2.sql"
+    ]
+    assert [str(path) for path in model_batch.manifest["unchanged"]] == [
+        "models/test_schema/model1.sql"
+    ]
+
+
+def test_batch_discarded_on_error(tmpdir):  # pytest tmpdir fixture
+    """nothing is written if the batch fails"""
+    project = dbtProject(tmpdir)
+    try:
+        with project.batch():
+            project.write_model("test_schema", "model1", "select 1")
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert os.path.exists(tmpdir / "models" / "test_schema" / "model1.sql") is False
+    # and the next write is not batched
+    project.write_model("test_schema", "model1", "select 1")
+    assert os.path.exists(tmpdir / "models" / "test_schema" / "model1.sql") is True
+
+
+def test_write_model_skips_unchanged(tmpdir):  # pytest tmpdir fixture
+    """rewriting the same sql leaves the file untouched"""
+    project = dbtProject(tmpdir)
+    project.write_model("test_schema", "test_model", "select 1")
+    model_filename = tmpdir / "models" / "test_schema" / "test_model.sql"
+    os.utime(model_filename, (0, 0))
+
+    project.write_model("test_schema", "test_model", "select 1")
+    assert os.path.getmtime(model_filename) == 0
+    project.write_model_config("test_schema", [{"name": "test_model"}])
+    project.write_model_config("test_schema", [{"name": "test_model"}])
+    assert project.write_counts() == {"written": 2, "skipped": 2}
+
+    project.write_model("test_schema", "test_model", "select 2")
+    assert os.path.getmtime(model_filename) > 0
+    assert project.write_counts() == {"written": 3, "skipped": 2}
+
+
+def test_write_model_file_mode(tmpdir):  # pytest tmpdir fixture
+    """models get the umask's permissions, not the temp file's owner-only ones"""
+    project = dbtProject(tmpdir)
+    project.write_model("test_schema", "test_model", "select 1")
+    model_filename = tmpdir / "models" / "test_schema" / "test_model.sql"
+    assert stat.S_IMODE(os.stat(model_filename).st_mode) == FILE_MODE
+
+
+def test_batch_is_per_thread(tmpdir):  # pytest tmpdir fixture
+    """another thread's writes are not buffered in this thread's batch"""
+    project = dbtProject(tmpdir)
+    with project.batch() as model_batch:
+        thread = threading.Thread(
+            target=lambda: dbtProject(tmpdir).write_model("test_schema", "m2", "select 2")
+        )
+        thread.start()
+        thread.join()
+        assert os.path.exists(tmpdir / "models" / "test_schema" / "m2.sql") is True
+        project.write_model("test_schema", "m1", "select 1")
+
+    assert [str(path) for path in model_batch.manifest["written"]] == [
+        "models/test_schema/m1.sql"
+    ]
+
+
+def test_batch_in_symlinked_project(tmpdir):  # pytest tmpdir fixture
+    """the manifest is relative to the project however its dir was spelled"""
+    os.makedirs(tmpdir / "real")
+    os.symlink(tmpdir / "real", tmpdir / "link")
+    with dbtProject(tmpdir / "link").batch() as model_batch:
+        dbtProject(tmpdir / "real").write_model("test_schema", "m1", "select 1")
+
+    assert [str(path) for path in model_batch.manifest["written"]] == [
+        "models/test_schema/m1.sql"
+    ]
+
+
+def test_input_relation_source(tmpdir):  # pytest tmpdir fixture
+    """a source's schema and identifier come from its sources.yml"""
+    sources_dir = tmpdir / "models" / "staging"
+    os.makedirs(sources_dir)
+    with open(sources_dir / "sources.yml", "w", encoding="utf-8") as sources_file:
+        yaml.safe_dump(
+            {
+                "version": 2,
+                "sources": [
+                    {
+                        "name": "raw",
+                        "schema": "airbyte_raw",
+                        "tables": [{"name": "sheet", "identifier": "_airbyte_raw_sheet"}],
+                    },
+                    {"name": "other", "tables": [{"name": "t"}]},
+                ],
+            },
+            sources_file,
+        )
+    project = dbtProject(tmpdir)
+    assert project.input_relation(
+        {"input_type": "source", "source_name": "raw", "input_name": "sheet"}
+    ) == ("airbyte_raw", "_airbyte_raw_sheet")
+    # dbt's defaults are the source and table names
+    assert project.input_relation(
+        {"input_type": "source", "source_name": "other", "input_name": "t"}
+    ) == ("other", "t")
+    with pytest.raises(ValueError, match="no table missing in a source raw"):
+        project.input_relation(
+            {"input_type": "source", "source_name": "raw", "input_name": "missing"}
+        )
+
+
+def test_input_relation_model(tmpdir):  # pytest tmpdir fixture
+    """a model's schema comes from its config"""
+    project = dbtProject(tmpdir)
+    project.write_model(
+        "intermediate",
+        "sheet",
+        "{{ config(materialized='incremental', on_schema_change='fail', schema='staging') }}",
+    )
+    project.write_model("intermediate", "bare", "select 1")
+    assert project.input_relation(
+        {"input_type": "model", "source_name": None, "input_name": "sheet"}
+    ) == ("staging", "sheet")
+    with pytest.raises(ValueError, match="doesn't set its schema"):
+        project.input_relation(
+            {"input_type": "model", "source_name": None, "input_name": "bare"}
+        )
+    with pytest.raises(ValueError, match="found 0 models named missing"):
+        project.input_relation(
+            {"input_type": "model", "source_name": None, "input_name": "missing"}
+        )
+    with pytest.raises(ValueError, match="cte input"):
+        project.input_relation(
+            {"input_type": "cte", "source_name": None, "input_name": "cte1"}
+        )
+
+
+def test_input_relation_in_batch(tmpdir):  # pytest tmpdir fixture
+    """models written earlier in a batch are read before the batch is flushed"""
+    project = dbtProject(tmpdir)
+    project.write_model("staging", "sheet", "{{ config(materialized='table', schema='old') }}")
+    sheet = {"input_type": "model", "source_name": None, "input_name": "sheet"}
+    with project.batch():
+        # a later op reads the model an earlier one wrote
+        dbtProject(tmpdir).write_model(
+            "intermediate", "pivoted", "{{ config(materialized='table', schema='intermediate') }}"
+        )
+        assert project.input_relation(
+            {"input_type": "model", "source_name": None, "input_name": "pivoted"}
+        ) == ("intermediate", "pivoted")
+        assert os.path.exists(tmpdir / "models" / "intermediate" / "pivoted.sql") is False
+
+        # a model regenerated in the batch is read as it will be written
+        dbtProject(tmpdir).write_model(
+            "staging", "sheet", "{{ config(materialized='table', schema='new') }}"
+        )
+        assert project.input_relation(sheet) == ("new", "sheet")
+
+        # and one written elsewhere too makes the name ambiguous
+        dbtProject(tmpdir).write_model(
+            "other", "sheet", "{{ config(materialized='table', schema='other') }}"
+        )
+        with pytest.raises(ValueError, match="found 2 models named sheet"):
+            project.input_relation(sheet)
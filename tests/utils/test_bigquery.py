@@ -0,0 +1,43 @@
+from unittest.mock import Mock
+from dbt_automation.utils.bigquery import BigQueryClient
+
+
+def bigquery_client(rows: list) -> BigQueryClient:
+    """a client whose queries return these rows, without credentials"""
+    client = BigQueryClient.__new__(BigQueryClient)
+    client.name = "bigquery"
+    client.execute = Mock(return_value=rows)
+    return client
+
+
+def test_json_columnspec_unquotes_keys():
+    """keys which JSON_KEYS quotes are returned as they appear in the json"""
+    client = bigquery_client([{"k": "a"}, {"k": '"b.c"'}, {"k": '"d\\"e"'}])
+    assert client.get_json_columnspec("s", "t", "_airbyte_data") == ["a", "b.c", 'd"e']
+    sql = client.execute.call_args[0][0]
+    assert "wide_number_mode=>'round'" in sql
+
+
+def test_json_keystats_unquotes_keys():
+    """values are looked up by the unquoted key, which is the one reported"""
+    client = bigquery_client(
+        [
+            {"k": '"b.c"', "json_type": "number", "n": 2},
+            {"k": '"b.c"', "json_type": "string", "n": 1},
+        ]
+    )
+    assert client.get_json_keystats("s", "t", "_airbyte_data") == {
+        "b.c": {"count": 3, "types": {"number": 2, "string": 1}}
+    }
+    sql = client.execute.call_args[0][0]
+    assert "docs.doc[IF(STARTS_WITH(k, '\"'), JSON_VALUE(PARSE_JSON(k)), k)]" in sql
+
+
+def test_insert_row_uses_insert_rows():
+    """a single row goes through the load-job path, not a streaming insert"""
+    client = bigquery_client([])
+    client.insert_rows = Mock(return_value=1)
+    client.bqclient = Mock()
+    client.insert_row("s", "t", {"a": 1})
+    client.insert_rows.assert_called_once_with("s", "t", [{"a": 1}])
+    client.bqclient.insert_rows.assert_not_called()
@@ -0,0 +1,157 @@
+from unittest.mock import Mock, patch
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from dbt_automation.utils import connectionpool
+from dbt_automation.utils.connectionpool import (
+    PostgresConnectionPool,
+    connection_fingerprint,
+    get_pool,
+    close_all_pools,
+)
+from dbt_automation.utils.postgres import PostgresClient
+
+
+def mock_connection():
+    """a stand-in for a psycopg2 connection"""
+    connection = Mock()
+    connection.closed = 0
+    connection.status = extensions.STATUS_READY
+    return connection
+
+
+def test_connection_fingerprint():
+    """the fingerprint does not depend on key order"""
+    assert connection_fingerprint({"host": "h", "port": 1}) == connection_fingerprint(
+        {"port": 1, "host": "h"}
+    )
+    assert connection_fingerprint({"host": "h"}) != connection_fingerprint(
+        {"host": "i"}
+    )
+
+
+def test_getconn_reuses_returned_connection():
+    """a returned connection is handed out again without reconnecting"""
+    connect = Mock(side_effect=lambda conn_info: mock_connection())
+    pool = PostgresConnectionPool({"host": "h"}, connect)
+    conn1 = pool.getconn()
+    pool.putconn(conn1)
+    conn2 = pool.getconn()
+    assert conn1 is conn2
+    assert connect.call_count == 1
+
+
+def test_getconn_replaces_unhealthy_connection():
+    """stale connections are pinged and replaced if the ping fails"""
+    connect = Mock(side_effect=lambda conn_info: mock_connection())
+    pool = PostgresConnectionPool({"host": "h"}, connect, health_check_after=0)
+    conn1 = pool.getconn()
+    conn1.cursor.side_effect = connectionpool.psycopg2.OperationalError()
+    pool.putconn(conn1)
+    conn2 = pool.getconn()
+    assert conn2 is not conn1
+    conn1.close.assert_called_once()
+
+
+def test_putconn_rolls_back_open_transaction():
+    """connections are returned to the pool outside of a transaction"""
+    pool = PostgresConnectionPool({"host": "h"}, lambda conn_info: mock_connection())
+    conn = pool.getconn()
+    conn.status = extensions.STATUS_IN_TRANSACTION
+    pool.putconn(conn)
+    conn.rollback.assert_called_once()
+
+
+def test_evict_idle():
+    """connections idle for longer than idle_timeout are closed"""
+    pool = PostgresConnectionPool(
+        {"host": "h"}, lambda conn_info: mock_connection(), idle_timeout=-1
+    )
+    conn = pool.getconn()
+    pool.putconn(conn)
+    pool.evict_idle()
+    assert pool.idle == []
+    conn.close.assert_called_once()
+
+
+def test_pool_exhausted():
+    """checkout fails once maxconn connections are in use"""
+    pool = PostgresConnectionPool(
+        {"host": "h"},
+        lambda conn_info: mock_connection(),
+        maxconn=1,
+        checkout_timeout=0,
+    )
+    pool.getconn()
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+
+def test_reserve_and_release():
+    """a reservation raises maxconn only until it is released"""
+    pool = PostgresConnectionPool(
+        {"host": "h"}, lambda conn_info: mock_connection(), maxconn=2
+    )
+    pool.reserve(4)
+    pool.reserve(3)
+    assert pool.maxconn == 4
+    conns = [pool.getconn() for _ in range(4)]
+    pool.release(4)
+    assert pool.maxconn == 3
+    pool.release(3)
+    assert pool.maxconn == 2
+    for conn in conns:
+        pool.putconn(conn)
+    assert len(pool.idle) == 2
+    assert sum(conn.close.call_count for conn in conns) == 2
+
+
+def test_get_pool_keeps_maxconn():
+    """asking the shared pool for more connections does not grow it for good"""
+    connect = Mock(side_effect=lambda conn_info: mock_connection())
+    pool = get_pool({"host": "g", "port": 1}, connect)
+    assert get_pool({"host": "g", "port": 1}, connect, maxconn=17) is pool
+    assert pool.maxconn == 10
+    close_all_pools()
+
+
+def test_worker_clients_release_maxconn():
+    """the pool shrinks back once the clients which asked for more are closed"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect") as mock_connect:
+        mock_connect.side_effect = lambda **kwargs: mock_connection()
+        client = PostgresClient({"host": "HOST", "port": 4321}, pooled=True)
+        workers = [client.worker_client(maxconn=12) for _ in range(11)]
+        assert client.pool.maxconn == 12
+        for worker in workers:
+            worker.close()
+        assert client.pool.maxconn == 10
+        assert client.pool.reservations == []
+        client.close()
+    close_all_pools()
+
+
+def test_get_pool_is_shared():
+    """clients with the same connection info share one pool"""
+    connect = Mock(side_effect=lambda conn_info: mock_connection())
+    pool1 = get_pool({"host": "h", "port": 1}, connect)
+    pool2 = get_pool({"port": 1, "host": "h"}, connect)
+    assert pool1 is pool2
+    close_all_pools()
+    assert get_pool({"host": "h", "port": 1}, connect) is not pool1
+    close_all_pools()
+
+
+def test_pooled_client_returns_connection_on_close():
+    """closing a pooled client keeps its connection warm"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect") as mock_connect:
+        mock_connect.side_effect = lambda **kwargs: mock_connection()
+        client1 = PostgresClient({"host": "HOST", "port": 1234}, pooled=True)
+        connection = client1.connection
+        client1.close()
+        connection.close.assert_not_called()
+
+        client2 = PostgresClient({"host": "HOST", "port": 1234}, pooled=True)
+        assert client2.connection is connection
+        assert mock_connect.call_count == 1
+        client2.close()
+    close_all_pools()
@@ -0,0 +1,137 @@
+import datetime
+import os
+import stat
+from unittest.mock import Mock
+import pytest
+from dbt_automation.utils.dbtproject import FILE_MODE
+from dbt_automation.utils.jsonkeys import (
+    JsonKeyStore,
+    discover_json_keys,
+    dominant_type,
+    infer_json_types,
+    keystats_from_rows,
+    leaf_paths,
+    split_json_keys_path,
+)
+
+T1 = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+T2 = datetime.datetime(2024, 2, 1, tzinfo=datetime.timezone.utc)
+
+
+def test_keystore_roundtrip(tmpdir):
+    """keys and watermarks survive a reload"""
+    JsonKeyStore(tmpdir / "keys.yml").put("s", "t", "c", ["b", "a"], T1)
+    assert JsonKeyStore(tmpdir / "keys.yml").get("s", "t", "c") == {
+        "keys": ["b", "a"],
+        "watermark": T1,
+    }
+    assert JsonKeyStore(tmpdir / "keys.yml").get("s", "t", "d") is None
+
+
+def test_keystore_file_mode(tmpdir):
+    """the store gets the umask's permissions, not the temp file's owner-only ones"""
+    JsonKeyStore(tmpdir / "keys.yml").put("s", "t", "c", ["a"], T1)
+    assert stat.S_IMODE(os.stat(tmpdir / "keys.yml").st_mode) == FILE_MODE
+
+
+def test_discover_full():
+    """a full scan without a keystore returns the sorted keys"""
+    warehouse = Mock()
+    warehouse.get_json_columnspec.return_value = ["b", "a"]
+    result = discover_json_keys(warehouse, "s", "t")
+    assert result["keys"] == ["a", "b"]
+    warehouse.get_json_columnspec.assert_called_once_with("s", "t", "_airbyte_data")
+
+
+def test_discover_sample(tmpdir):
+    """sampled keys are added to the keys found earlier"""
+    keystore = JsonKeyStore(tmpdir / "keys.yml")
+    keystore.put("s", "t", "_airbyte_data", ["z"], T1)
+    warehouse = Mock()
+    warehouse.get_json_columnspec.return_value = ["z", "a"]
+    result = discover_json_keys(
+        warehouse, "s", "t", mode="sample", sample_percent=5, keystore=keystore
+    )
+    assert result == {"keys": ["z", "a"], "new_keys": ["a"], "watermark": T1}
+    warehouse.get_json_columnspec.assert_called_once_with(
+        "s", "t", "_airbyte_data", sample_percent=5
+    )
+
+
+def test_discover_incremental(tmpdir):
+    """only rows newer than the watermark are scanned"""
+    keystore = JsonKeyStore(tmpdir / "keys.yml")
+    warehouse = Mock()
+    warehouse.get_max_value.return_value = T1
+    warehouse.get_json_columnspec.return_value = ["a"]
+    result = discover_json_keys(warehouse, "s", "t", mode="incremental", keystore=keystore)
+    assert result == {"keys": ["a"], "new_keys": ["a"], "watermark": T1}
+
+    warehouse.get_max_value.return_value = T2
+    warehouse.get_json_columnspec.return_value = ["c", "a"]
+    result = discover_json_keys(warehouse, "s", "t", mode="incremental", keystore=keystore)
+    assert result == {"keys": ["a", "c"], "new_keys": ["c"], "watermark": T2}
+    warehouse.get_json_columnspec.assert_called_with(
+        "s",
+        "t",
+        "_airbyte_data",
+        watermark_column="_airbyte_emitted_at",
+        after=T1,
+        until=T2,
+    )
+
+    # nothing new since the last run: no scan
+    warehouse.get_json_columnspec.reset_mock()
+    result = discover_json_keys(warehouse, "s", "t", mode="incremental", keystore=keystore)
+    assert result["keys"] == ["a", "c"]
+    warehouse.get_json_columnspec.assert_not_called()
+
+
+def test_discover_incremental_requires_keystore():
+    """there is nowhere to keep the watermark without a keystore"""
+    with pytest.raises(ValueError):
+        discover_json_keys(Mock(), "s", "t", mode="incremental")
+
+
+def test_keystats_from_rows():
+    """per-type counts are summed per key"""
+    assert keystats_from_rows([("a", "string", 3), ("a", "null", 1)]) == {
+        "a": {"count": 4, "types": {"string": 3, "null": 1}}
+    }
+
+
+def test_dominant_type():
+    """the type covering min_share of the non-null values wins"""
+    assert dominant_type({"integer": 96, "string": 4}) == "integer"
+    assert dominant_type({"integer": 90, "string": 10}) == "string"
+    assert dominant_type({"integer": 50, "numeric": 50, "null": 500}) == "numeric"
+    assert dominant_type({"date": 10, "timestamp": 90}) == "timestamp"
+    assert dominant_type({"object": 3, "array": 1}) == "json"
+    assert dominant_type({"null": 3}) == "string"
+
+
+def test_infer_json_types():
+    """keys missing from the sample stay strings"""
+    warehouse = Mock()
+    warehouse.get_json_keystats.return_value = {
+        "a": {"count": 10, "types": {"boolean": 10}},
+    }
+    assert infer_json_types(warehouse, "s", "t", "c", ["a", "b"], sample_rows=5) == {
+        "a": "boolean",
+        "b": "string",
+    }
+    assert warehouse.get_json_keystats.call_args.kwargs["max_rows"] == 5
+    assert warehouse.get_json_keystats.call_args.kwargs["value_classes"] is True
+
+
+def test_split_json_keys_path():
+    """quoted keys may hold dots and escaped quotes"""
+    assert split_json_keys_path("a.b") == ["a", "b"]
+    assert split_json_keys_path('a."b.c".d') == ["a", "b.c", "d"]
+    assert split_json_keys_path('"say \\"hi\\""') == ['say "hi"']
+
+
+def test_leaf_paths():
+    """paths which other paths descend from are dropped"""
+    paths = [["a"], ["a", "b"], ["a", "b", "c"], ["d"], ["a", "e"]]
+    assert leaf_paths(paths) == [["a", "b", "c"], ["a", "e"], ["d"]]
@@ -0,0 +1,126 @@
+import pytest
+from dbt_automation.operations.arithmetic import arithmetic
+from dbt_automation.operations.mergeoperations import merge_operations
+from dbt_automation.operations.replace import replace
+from dbt_automation.utils.materialization import (
+    incremental_options,
+    incremental_select,
+    model_config_header,
+)
+
+
+def test_table_by_default(mock_warehouse):
+    """models are tables unless incremental is asked for"""
+    config = {"dest_schema": "staging"}
+    assert (
+        model_config_header(config, mock_warehouse(), "castdatatypes")
+        == "{{ config(materialized='table', schema='staging') }}"
+    )
+    assert incremental_select("SELECT 1", ["a"], config, mock_warehouse()) == "SELECT 1"
+
+
+def test_incremental_strategy_per_warehouse(mock_warehouse):
+    """each warehouse has its own default strategy, which the config can override"""
+    config = {"dest_schema": "staging", "incremental": True}
+    assert incremental_options(config, mock_warehouse("bigquery"))["strategy"] == "merge"
+    assert (
+        model_config_header(config, mock_warehouse(), "castdatatypes")
+        == "{{ config(materialized='incremental', unique_key='_airbyte_ab_id', "
+        "incremental_strategy='delete+insert', schema='staging') }}"
+    )
+    config["incremental"] = {"strategy": "append", "unique_key": "id"}
+    assert incremental_options(config, mock_warehouse()) == {
+        "unique_key": "id",
+        "watermark_column": "_airbyte_emitted_at",
+        "strategy": "append",
+    }
+
+
+def test_incremental_rejects_unsafe_operations(mock_warehouse):
+    """aggregating operations are rebuilt in full"""
+    config = {"dest_schema": "staging", "incremental": True}
+    with pytest.raises(ValueError, match="cannot be materialized incrementally"):
+        model_config_header(config, mock_warehouse(), "castdatatypes", "aggregate")
+    # a watermark over a union would skip the rows of inputs loaded later
+    with pytest.raises(ValueError, match="unionall cannot be materialized incrementally"):
+        model_config_header(config, mock_warehouse(), "unionall")
+
+
+def test_incremental_select(mock_warehouse):
+    """the select is filtered on the watermark during incremental runs"""
+    config = {"dest_schema": "staging", "incremental": True}
+    sql = incremental_select(
+        "SELECT * FROM {{ref('m')}}\n", ["*"], config, mock_warehouse("bigquery")
+    )
+    assert sql.startswith("SELECT * FROM (\nSELECT * FROM {{ref('m')}}\n) AS _incremental\n")
+    assert (
+        "WHERE _incremental.`_airbyte_emitted_at` >= "
+        "(SELECT MAX(`_airbyte_emitted_at`) FROM {{ this }})" in sql
+    )
+    with pytest.raises(ValueError, match="_airbyte_emitted_at"):
+        incremental_select("SELECT a", ["a"], config, mock_warehouse())
+    with pytest.raises(ValueError, match="_airbyte_ab_id"):
+        incremental_select(
+            "SELECT a", ["a", "_airbyte_emitted_at"], config, mock_warehouse()
+        )
+
+
+def test_merge_operations_incremental(tmpdir, mock_warehouse):
+    """a chain of row-wise operations can be incremental"""
+    config = {
+        "dest_schema": "staging",
+        "output_name": "merged",
+        "incremental": True,
+        "input": {"input_type": "model", "input_name": "m", "source_name": None},
+        "operations": [
+            {
+                "type": "dropcolumns",
+                "config": {
+                    "source_columns": ["_airbyte_ab_id", "_airbyte_emitted_at", "a"],
+                    "columns": ["a"],
+                },
+            }
+        ],
+    }
+    merge_operations(config, mock_warehouse(), tmpdir)
+    model_sql = (tmpdir / "models" / "staging" / "merged.sql").read()
+    assert "materialized='incremental'" in model_sql
+    assert "{% if is_incremental() %}" in model_sql
+
+
+def test_model_config_written_once(tmpdir, mock_warehouse):  # pytest tmpdir fixture
+    """the config header heads the model once"""
+    input_table = {"input_type": "model", "input_name": "m", "source_name": None}
+    arithmetic(
+        {
+            "dest_schema": "staging",
+            "output_name": "added",
+            "input": input_table,
+            "source_columns": ["a"],
+            "operator": "add",
+            "operands": [{"is_col": True, "value": "a"}, {"is_col": False, "value": "1"}],
+            "output_column_name": "b",
+        },
+        mock_warehouse(),
+        tmpdir,
+    )
+    replace(
+        {
+            "dest_schema": "staging",
+            "output_name": "replaced",
+            "input": input_table,
+            "source_columns": ["a"],
+            "columns": [
+                {
+                    "col_name": "a",
+                    "output_column_name": "c",
+                    "replace_ops": [{"find": "-", "replace": " "}],
+                }
+            ],
+        },
+        mock_warehouse(),
+        tmpdir,
+    )
+    for model in ["added", "replaced"]:
+        model_sql = (tmpdir / "models" / "staging" / f"{model}.sql").read()
+        assert model_sql.count("{{ config(") == 1
@@ -0,0 +1,102 @@
+from unittest.mock import Mock, patch
+import pytest
+from dbt_automation.utils.metadatacache import (
+    DiskMetadataCache,
+    MemoryMetadataCache,
+    MetadataCache,
+)
+from dbt_automation.utils.postgres import PostgresClient
+
+
+@pytest.fixture(params=["memory", "disk"])
+def cache(request, tmpdir):
+    """each kind of cache"""
+    if request.param == "memory":
+        return MemoryMetadataCache()
+    return DiskMetadataCache(tmpdir)
+
+
+def test_incomplete_cache_fails_on_creation():
+    """a subclass missing part of the interface can't be instantiated"""
+
+    class NoInvalidate(MetadataCache):  # pylint:disable=abstract-method
+        def get_(self, key: tuple):
+            return False, None
+
+        def put_(self, key: tuple, value, expires_at: float):
+            pass
+
+    with pytest.raises(TypeError, match="invalidate"):
+        NoInvalidate()
+
+
+def test_get_or_load_counts_hits_and_misses(cache):
+    """the loader runs only on a miss"""
+    loader = Mock(return_value=["a", "b"])
+    assert cache.get_or_load(("fp", "s", None, "tables"), loader) == ["a", "b"]
+    assert cache.get_or_load(("fp", "s", None, "tables"), loader) == ["a", "b"]
+    loader.assert_called_once()
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_entries_expire(cache):
+    """entries older than the ttl are reloaded"""
+    cache.ttl = -1
+    loader = Mock(return_value=["a"])
+    cache.get_or_load(("fp", None, None, "schemas"), loader)
+    cache.get_or_load(("fp", None, None, "schemas"), loader)
+    assert loader.call_count == 2
+
+
+def test_invalidate_table(cache):
+    """invalidating a table forgets its columns and its schema's listing"""
+    for key in [
+        ("fp", None, None, "schemas"),
+        ("fp", "s", None, "tables"),
+        ("fp", "s", "t", "columns"),
+        ("fp", "s", "u", "columns"),
+        ("other", "s", "t", "columns"),
+    ]:
+        cache.get_or_load(key, lambda: ["x"])
+
+    cache.invalidate("fp", "s", "t")
+    cache.hits = cache.misses = 0
+    for key in [
+        ("fp", None, None, "schemas"),
+        ("fp", "s", None, "tables"),
+        ("fp", "s", "t", "columns"),
+        ("fp", "s", "u", "columns"),
+        ("other", "s", "t", "columns"),
+    ]:
+        cache.get_or_load(key, lambda: ["x"])
+    # schemas, s.u and the other warehouse are still cached
+    assert cache.stats() == {"hits": 3, "misses": 2}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """the cache holds at most maxsize entries"""
+    cache = MemoryMetadataCache(maxsize=2)
+    cache.get_or_load(("fp", "s", "a", "columns"), lambda: 1)
+    cache.get_or_load(("fp", "s", "b", "columns"), lambda: 2)
+    cache.get_or_load(("fp", "s", "a", "columns"), lambda: 1)
+    cache.get_or_load(("fp", "s", "c", "columns"), lambda: 3)
+    assert list(cache.entries) == [("fp", "s", "a", "columns"), ("fp", "s", "c", "columns")]
+
+
+def test_postgres_client_uses_cache():
+    """repeated lookups don't query the warehouse until the table changes"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient(
+            {"host": "HOST", "port": 1234}, metadata_cache=MemoryMetadataCache()
+        )
+        cursor = client.connection.cursor()
+        cursor.fetchall.return_value = [("table1",)]
+
+        assert client.get_tables("schema") == ["table1"]
+        assert client.get_tables("schema") == ["table1"]
+        assert cursor.execute.call_count == 1
+
+        client.drop_table("schema", "table1")
+        assert client.get_tables("schema") == ["table1"]
+        # the drop and the reload
+        assert cursor.execute.call_count == 3
@@ -0,0 +1,41 @@
+import datetime
+import decimal
+import pytest
+from dbt_automation.utils.pagination import (
+    encode_continuation_token,
+    decode_continuation_token,
+    next_continuation_token,
+)
+
+
+def test_continuation_token_roundtrip():
+    """values survive encoding and decoding with their types"""
+    values = [
+        "abc",
+        12,
+        1.5,
+        None,
+        True,
+        decimal.Decimal("1.10"),
+        datetime.date(2024, 1, 31),
+        datetime.datetime(2024, 1, 31, 10, 20, tzinfo=datetime.timezone.utc),
+    ]
+    assert decode_continuation_token(encode_continuation_token(values)) == values
+
+
+def test_decode_invalid_token():
+    """garbage tokens are rejected"""
+    with pytest.raises(ValueError):
+        decode_continuation_token("not-a-token")
+
+
+def test_next_continuation_token():
+    """the token holds the order_by and tiebreaker values of the last row"""
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    token = next_continuation_token(rows, "name", "id")
+    assert decode_continuation_token(token) == ["b", 2]
+    token = next_continuation_token(rows, None, "id")
+    assert decode_continuation_token(token) == [2]
+    token = next_continuation_token(rows, "id", "id")
+    assert decode_continuation_token(token) == [2]
+    assert next_continuation_token([], "name", "id") is None
@@ -1,5 +1,11 @@
+import re
+import sqlite3
+import psycopg2
 from unittest.mock import patch, ANY
-from dbt_automation.utils.postgres import PostgresClient
+from dbt_automation.utils.jsonkeys import DATE_PATTERN
+from dbt_automation.utils.postgres import CAST_TIMESTAMP_PATTERN, PostgresClient
+from dbt_automation.utils.pagination import encode_continuation_token
+from dbt_automation.utils.metadatacache import MemoryMetadataCache
 
 
 def test_get_connection_1():
@@ -111,3 +117,261 @@ def test_get_connection_7():
         )
         mock_connect.assert_called_once()
         mock_connect.assert_called_with(sslmode="disable", sslrootcert=ANY, sslcert=ANY)
+
+
+def test_insert_rows():
+    """tests PostgresClient.insert_rows"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"), patch(
+        "dbt_automation.utils.postgres.execute_values"
+    ) as mock_execute_values:
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        rows = ({"col1": str(i), "col2": str(i * 2)} for i in range(5))
+        n_rows = client.insert_rows("schema", "table", rows, batch_size=2)
+
+        assert n_rows == 5
+        assert mock_execute_values.call_count == 3
+        assert client.connection.commit.call_count == 3
+        _, statement, values = mock_execute_values.call_args_list[0][0]
+        assert statement == "INSERT INTO schema.table (col1,col2) VALUES %s"
+        assert values == [["0", "0"], ["1", "2"]]
+        _, _, values = mock_execute_values.call_args_list[2][0]
+        assert values == [["4", "8"]]
+
+
+def test_get_table_data_keyset():
+    """tests PostgresClient.get_table_data with a continuation token"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        cursor = client.connection.cursor()
+        cursor.description = [("name",), ("id",)]
+        cursor.fetchall.return_value = [("c", 3)]
+        token = encode_continuation_token(["b", 2])
+
+        rows = client.get_table_data(
+            "schema", "table", 10, order_by="name", after=token, tiebreaker="id"
+        )
+
+        assert rows == [{"name": "c", "id": 3}]
+        query, params = cursor.execute.call_args[0]
+        assert params == ["b", 2]
+        assert '("name", "id") > (%s, %s)' in query
+        assert 'ORDER BY "name" ASC, "id" ASC' in query
+        assert "LIMIT 10" in query
+        assert "OFFSET" not in query
+        # a preview doesn't commit the caller's transaction
+        client.connection.commit.assert_not_called()
+
+
+def test_execute_stream():
+    """tests PostgresClient.execute_stream"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        cursor = client.connection.cursor()
+        cursor.description = [("a",), ("b",)]
+        cursor.__iter__.return_value = iter([(1, 2), (3, 4)])
+
+        rows = client.execute_stream("SELECT a, b FROM t", itersize=1, as_dict=True)
+        assert next(rows) == {"a": 1, "b": 2}
+        assert cursor.itersize == 1
+        assert "name" in client.connection.cursor.call_args.kwargs
+        assert list(rows) == [{"a": 3, "b": 4}]
+        cursor.close.assert_called_once()
+        # the stream ran inside a transaction the caller had open
+        client.connection.commit.assert_not_called()
+
+
+def test_execute_stream_commits_own_transaction():
+    """tests that PostgresClient.execute_stream ends the transaction it began"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        client.connection.get_transaction_status.return_value = (
+            psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        )
+        cursor = client.connection.cursor()
+        cursor.__iter__.return_value = iter([(1,)])
+
+        assert list(client.execute_stream("SELECT 1")) == [(1,)]
+        client.connection.commit.assert_called_once()
+
+
+def test_get_json_keystats():
+    """tests PostgresClient.get_json_keystats"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        cursor = client.connection.cursor()
+        cursor.fetchall.return_value = [
+            ("a", "string", 8),
+            ("a", "number", 2),
+            ("b", "object", 5),
+        ]
+
+        keystats = client.get_json_keystats(
+            "schema", "table", "_airbyte_data", sample_percent=10, max_rows=100
+        )
+        assert keystats == {
+            "a": {"count": 10, "types": {"string": 8, "number": 2}},
+            "b": {"count": 5, "types": {"object": 5}},
+        }
+        query = cursor.execute.call_args.args[0]
+        assert "TABLESAMPLE SYSTEM (10.0)" in query
+        assert "LIMIT 100" in query
+        assert "jsonb_typeof" in query
+
+
+def test_get_schema_columns():
+    """tests PostgresClient.get_schema_columns"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        cursor = client.connection.cursor()
+        cursor.fetchall.return_value = [
+            ("t1", "a", "text"),
+            ("t1", "b", "integer"),
+            ("t2", "c", "jsonb"),
+        ]
+
+        assert client.get_schema_columns("schema", ["t1", "t2"]) == {
+            "t1": [
+                {"name": "a", "data_type": "text"},
+                {"name": "b", "data_type": "integer"},
+            ],
+            "t2": [{"name": "c", "data_type": "jsonb"}],
+        }
+        assert cursor.execute.call_count == 1
+        assert cursor.execute.call_args.args[1] == ["schema", ["t1", "t2"]]
+
+
+def test_json_flatten_sql():
+    """tests PostgresClient.json_flatten_sql"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        long_key = "k" * 64
+        sql = client.json_flatten_sql(
+            "_airbyte_data",
+            [("a", "a"), ('b"c', "b_c"), (long_key, "k")],
+            ["_airbyte_ab_id"],
+            "{{source('src','table')}}",
+        )
+        assert sql == (
+            'SELECT _src."_airbyte_ab_id"\n'
+            ', _rec."a" as "a"\n'
+            ', _rec."b""c" as "b_c"\n'
+            f", _src.\"_airbyte_data\"::jsonb->>'{long_key}' as \"k\"\n"
+            "FROM {{source('src','table')}} AS _src\n"
+            'LEFT JOIN LATERAL (SELECT _src."_airbyte_data"::jsonb AS _doc) AS _parsed ON TRUE\n'
+            "LEFT JOIN LATERAL jsonb_to_record("
+            "CASE WHEN jsonb_typeof(_parsed._doc) = 'object' THEN _parsed._doc END)"
+            ' AS _rec("a" text, "b""c" text) ON TRUE\n'
+        )
+
+
+def test_json_flatten_sql_non_object_rows():
+    """rows whose json isn't an object get NULL columns instead of failing the model"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        sql = client.json_flatten_sql(
+            "_airbyte_data", [("a", "a")], ["_airbyte_ab_id"], "{{source('src','table')}}"
+        )
+        # a row holding e.g. [1, 2] or "text" reaches jsonb_to_record as NULL
+        assert (
+            "jsonb_to_record(CASE WHEN jsonb_typeof(_parsed._doc) = 'object' "
+            "THEN _parsed._doc END)" in sql
+        )
+        assert "LEFT JOIN LATERAL jsonb_to_record" in sql
+        assert sql.count("::jsonb") == 1
+
+
+def test_json_flatten_sql_typed():
+    """typed columns are safe-cast from the record's text"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        sql = client.json_flatten_sql(
+            "_airbyte_data",
+            [("n", "n"), ("o", "o"), ("s", "s")],
+            ["_airbyte_ab_id"],
+            "{{source('src','table')}}",
+            column_types={"n": "integer", "o": "json"},
+        )
+        assert "CASE WHEN _rec.\"n\" ~ '^-?[0-9]{1,18}$' THEN (_rec.\"n\")::bigint END" in sql
+        assert '_rec."o" as "o"' in sql
+        assert '_rec("n" text, "o" jsonb, "s" text)' in sql
+
+
+def test_safe_cast_impossible_dates():
+    """dates which match the pattern but aren't on the calendar are NULL, not errors"""
+    sql = PostgresClient.safe_cast_('_rec."d"', "date")
+    assert sql.startswith(
+        "CASE WHEN _rec.\"d\" ~ '" + DATE_PATTERN + "' THEN CASE WHEN "
+    )
+    assert sql.endswith(' THEN (_rec."d")::date END END')
+
+    # the calendar check is plain sql; sqlite evaluates it the same way
+    valid_date = PostgresClient.valid_date_sql_("d")
+    with sqlite3.connect(":memory:") as connection:
+        for text, valid in [
+            ("2023-02-28", True),
+            ("2023-02-29", False),
+            ("2023-02-30", False),
+            ("2024-02-29", True),
+            ("1900-02-29", False),
+            ("2000-02-29", True),
+            ("2023-04-31", False),
+            ("2023-12-31", True),
+            ("0000-01-01", False),
+            ("2023-02-30T10:00:00Z", False),
+        ]:
+            (result,) = connection.execute(
+                f"SELECT {valid_date} FROM (SELECT ? AS d)", (text,)
+            ).fetchone()
+            assert bool(result) is valid, text
+
+
+def test_safe_cast_timestamp_offsets():
+    """utc offsets postgres can't parse don't match the cast pattern"""
+    assert re.match(CAST_TIMESTAMP_PATTERN, "2023-01-01T10:00:00+05:30")
+    assert not re.match(CAST_TIMESTAMP_PATTERN, "2023-01-01T10:00:00+99")
+    assert not re.match(CAST_TIMESTAMP_PATTERN, "2023-01-01T10:00:00+05:99")
+
+
+def test_json_flatten_sql_nested_paths():
+    """parents of nested paths are unpacked as jsonb and descended into"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        sql = client.json_flatten_sql(
+            "_airbyte_data",
+            [(("a", "b"), "a_b"), ("a", "a"), (("c", "d", "e"), "c_d_e")],
+            ["_airbyte_ab_id"],
+            "{{source('src','table')}}",
+            column_types={("c", "d", "e"): "json"},
+        )
+        assert "_rec.\"a\"->>'b' as \"a_b\"" in sql
+        assert "_rec.\"a\" #>> '{}' as \"a\"" in sql
+        assert "_rec.\"c\" #> ARRAY['d', 'e'] as \"c_d_e\"" in sql
+        assert '_rec("a" jsonb, "c" jsonb)' in sql
+
+
+def test_json_explode_sql():
+    """one row per array element, numbered from 0"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient({"host": "HOST", "port": 1234})
+        sql = client.json_explode_sql(
+            "_airbyte_data", ["order", "items"], ["_airbyte_ab_id"], "raw.orders"
+        )
+        assert "jsonb_array_elements(CASE WHEN jsonb_typeof(" in sql
+        assert "_src.\"_airbyte_data\"::jsonb #> ARRAY['order', 'items']" in sql
+        assert '_elem.ordinality - 1 AS "_index"' in sql
+
+
+def test_get_distinct_values_cached():
+    """distinct values come from one bounded query, then from the cache"""
+    with patch("dbt_automation.utils.postgres.psycopg2.connect"):
+        client = PostgresClient(
+            {"host": "HOST", "port": 1234}, metadata_cache=MemoryMetadataCache()
+        )
+        cursor = client.connection.cursor()
+        cursor.fetchall.return_value = [("a",), ("b",)]
+
+        assert client.get_distinct_values("schema", "table", "col", limit=5, top_k=True) == ["a", "b"]
+        assert client.get_distinct_values("schema", "table", "col", limit=5, top_k=True) == ["a", "b"]
+        assert cursor.execute.call_count == 1
+        assert "ORDER BY COUNT(*) DESC, 1" in cursor.execute.call_args.args[0]
+        assert cursor.execute.call_args.args[1] == [5]